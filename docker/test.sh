@@ -3,3 +3,4 @@ sh docker/migration.sh
 pytest --color=yes --showlocals --tb=short -v tests/auth/unit
 pytest --color=yes --showlocals --tb=short -v tests/auth/integration
 pytest --color=yes --showlocals --tb=short -v tests/auth/e2e
+pytest --color=yes --showlocals --tb=short -v tests/core
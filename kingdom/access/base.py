@@ -1,42 +1,47 @@
-from collections import defaultdict
-from copy import deepcopy
-from dataclasses import dataclass
+from bisect import bisect_right
+from collections import Counter, OrderedDict, defaultdict
+from dataclasses import dataclass, field
 from datetime import datetime, timedelta
-from enum import Enum
+from enum import IntFlag
 from functools import reduce
-from typing import Dict, List, NamedTuple, Optional, Set, Tuple, Union
+from heapq import heappop, heappush
+from itertools import chain, count, permutations
+from operator import or_
+from typing import (
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
-from kingdom.access import config
-from kingdom.access.dsl import TOKEN_ALL
+from kingdom.access import claims, config
+from kingdom.access.dsl import TOKEN_ALL, is_prefix
+from kingdom.access.interning import intern, intern_context
 from kingdom.access.types import Payload, PolicyContext, SelectorPermissionMap
 
 
-class Permission(Enum):
-    """Fine-grained mapping of a permission operation."""
-
-    READ = 0b000
-    CREATE = 0b001
-    UPDATE = 0b010
-    DELETE = 0b100
-
-    def __hash__(self) -> int:
-        return hash(self.value)
-
-    def __or__(self, other):
-        if isinstance(other, Permission):
-            other = other.value
-        return self.value | other
-
-    def __ror__(self, other):
-        return self.__or__(other)
+class Permission(IntFlag):
+    """
+    Fine-grained mapping of a permission operation. Members are plain ints,
+    so masks are combined and tested with native integer operators.
 
-    def __and__(self, other):
-        if isinstance(other, Permission):
-            other = other.value
-        return self.value & other
+    READ has its own bit, so a mask tells whether reading was granted like
+    it does for every other operation. Owning a selector still grants
+    reading it, whatever its mask, so claims issued while READ was 0
+    keep their meaning.
+    """
 
-    def __rand__(self, other):
-        return self.__and__(other)
+    CREATE = 0b0001
+    UPDATE = 0b0010
+    DELETE = 0b0100
+    READ = 0b1000
 
 
 @dataclass
@@ -63,17 +68,57 @@ class Policy:
     """
     An association of permissions that are allowed to be performed on
     on instances of a given resource that match ANY of the conditionals
-    criteria"""
+    criteria.
+
+    A `deny` policy forbids its permissions instead, whatever other
+    policies allow, see `compile_decisions`. Denying READ denies every
+    operation.
+
+    A policy only holds from `not_before` (included) until `not_after`
+    (excluded), both UTC, when given."""
 
     resource: Resource
     permissions: Tuple[Permission, ...]
     conditionals: List[Statement]
+    deny: bool = False
+    not_before: Optional[datetime] = None
+    not_after: Optional[datetime] = None
+
+    def __post_init__(self):
+        if self.not_before and self.not_after:
+            if self.not_before >= self.not_after:
+                raise ValueError(f"{self} ends before it starts")
+
+    @property
+    def is_timed(self) -> bool:
+        return self.not_before is not None or self.not_after is not None
+
+    @property
+    def transitions(self) -> Tuple[datetime, ...]:
+        "When this policy starts or stops holding"
+        return tuple(
+            moment for moment in (self.not_before, self.not_after) if moment
+        )
+
+    def is_active(self, at: datetime) -> bool:
+        if self.not_before is not None and at < self.not_before:
+            return False
+        return self.not_after is None or at < self.not_after
 
 
 @dataclass
 class Role:
+    """
+    A named group of policies, inheriting every policy of its `parents`.
+    Encoded fragments are cached by name, and dropped once the role holds
+    other policies or parents. `version` must be bumped (or the role
+    invalidated on `role_fragments`) whenever one of them is changed in
+    place."""
+
     name: str
     policies: List[Policy]
+    version: int = 0
+    parents: List["Role"] = field(default_factory=list)
 
     def __hash__(self) -> int:
         return hash(self.name)
@@ -88,56 +133,86 @@ class User:
     def policy_context(self) -> PolicyContext:
         "Builds a policy context reading all roles associated to a User"
 
-        user_policies = list(self.resolve_policies())
-        return encode_policies(user_policies)
+        return self.policy_context_at(datetime.utcnow())
+
+    def policy_context_at(self, now: datetime) -> PolicyContext:
+        "Policy context made of the policies holding at `now`"
+        roles = [role for role in self.roles if role]
+        return compile_decisions(
+            merge_fragments(role_fragments.get(role, now) for role in roles),
+            union_contexts(
+                role_fragments.denials(role, now) for role in roles
+            ),
+        )
 
     @property
     def jwt_payload(self) -> Payload:
         "Knows how to build a JWT Payload with necessary claims"
 
-        expiration = datetime.utcnow() + timedelta(
-            minutes=config.TOKEN_EXPIRATION_MIN
-        )
-        return dict(
-            sub=self.access_key, exp=expiration, policies=self.encoded_policies
-        )
+        now = datetime.utcnow()
+        context = self.policy_context_at(now)
+        # The token must not outlive a time-bounded policy starting or
+        # ending before it expires, its context would be stale.
+        expiration = now + timedelta(minutes=config.TOKEN_EXPIRATION_MIN)
+        for role in filter(None, self.roles):
+            moment = role_fragments.next_transition(role, now)
+            if moment is not None and moment < expiration:
+                expiration = moment
+        policies: Payload
+        if config.COMPACT_POLICY_CLAIM:
+            policies = {
+                config.COMPACT_POLICY_CLAIM_NAME: claims.encode_claim(context)
+            }
+        else:
+            policies = {config.POLICY_CLAIM: context}
+        return dict(sub=self.access_key, exp=expiration, **policies)
 
-    def resolve_policies(self):
-        # TODO: Improve this typing
+    def resolve_policies(self) -> Iterator[Policy]:
+        "Policies of every role, inherited ones included"
         for role in self.roles:
-            for policy in role.policies:
-                yield policy
+            if role:
+                yield from role_fragments.policies(role)
 
 
 PermissionTuple = Tuple[Permission, ...]
+PERMISSION_BITS = tuple(permission.value for permission in Permission)
+WRITE_MASK = Permission.CREATE | Permission.UPDATE | Permission.DELETE
 AnyPermission = Union[Permission, int]
 PermissionTupleOrInt = Union[PermissionTuple, int]
 
+# Mask of every ordering of every combination of distinct permissions, so
+# Policy.permissions tuples are translated with a single dict lookup.
+PERMISSION_MASKS: Dict[Tuple, int] = {
+    permissions: reduce(or_, map(int, permissions), 0)
+    for permissions in chain.from_iterable(
+        permutations(Permission, size) for size in range(len(Permission) + 1)
+    )
+}
+
 
 def ptoi(permissions: PermissionTupleOrInt) -> int:
     """
-    Considering that a permission can be both an integer and an instance of
-    Permission, this function ensures that operations are done with a
-    Permission type.
-    It does by translating integer to Permission whenever needed.
+    Considering that a permission can be both an integer and a tuple of
+    Permission, this function ensures that operations are done with an int.
 
     >>> ptoi(0)
     0
     >>> ptoi((Permission.CREATE, Permission.READ, Permission.UPDATE))
-    3
-    >>> ptoi((,))
+    11
+    >>> ptoi(())
     0
     """
     if isinstance(permissions, int):
-        return permissions
-
-    return (
-        reduce(lambda a, b: a | b, permissions)
-        if len(permissions) > 1
-        else permissions[0].value
-        if len(permissions) == 1
-        else 0
+        return int(permissions)
+    mask = (
+        PERMISSION_MASKS.get(permissions)
+        if isinstance(permissions, tuple)
+        else None
     )
+    if mask is None:
+        # Repeated members, or not a tuple
+        mask = reduce(or_, map(int, permissions), 0)
+    return mask
 
 
 def union(
@@ -149,7 +224,7 @@ def union(
     be unionized, this method adds them up.
 
     >>> union_permissions((Permission.READ,), 2)
-    3
+    10
     >>> union_permissions(
         (Permission.DELETE,), (Permission.CREATE, Permission.UPDATE))
     7
@@ -246,30 +321,665 @@ def remove_context_redundancy(context: PolicyContext) -> PolicyContext:
         }
     }
     """
-    simplified: PolicyContext = deepcopy(context)
+    simplified: PolicyContext = {}
 
     for resource, selector_perm in context.items():
         if TOKEN_ALL not in selector_perm:
             # Well, nothing to do then.
+            simplified[resource] = dict(selector_perm)
             continue
 
+        all_perms = selector_perm[TOKEN_ALL]
+        simplified[resource] = {TOKEN_ALL: all_perms}
+        # Owning "*" grants reading every selector, whatever its mask.
+        contemplated = all_perms | Permission.READ
         for selector, permissions in selector_perm.items():
             # Subtract "*"'s permissions from the other permissions
-            if selector == TOKEN_ALL:
-                # Not this one.
-                continue
-
-            updated_perms: int = permissions & ~selector_perm[TOKEN_ALL]
-            if updated_perms == 0:
-                # All of this selector's permissions are already
+            updated_perms: int = permissions & ~contemplated
+            if selector != TOKEN_ALL and updated_perms != 0:
+                # Otherwise all of this selector's permissions are already
                 # contemplated by "*"
-                del simplified[resource][selector]
-            else:
                 simplified[resource][selector] = updated_perms
 
     return simplified
 
 
+# Flags of a decision table entry, see `compile_decisions`.
+OVERRIDE = 0b0100_0000
+EXCLUSIONS = 0b0010_0000
+ALL_PERMISSIONS = reduce(or_, PERMISSION_BITS)
+
+
+def widen_denial(denied: int) -> int:
+    "Denying READ denies every operation"
+    return ALL_PERMISSIONS if denied & Permission.READ else denied
+
+
+def is_blocked(permissions: int) -> bool:
+    "Whether a decision table entry denies every operation, reading too"
+    return permissions == OVERRIDE
+
+
+def is_excepted(permissions: Optional[int], operation: int) -> bool:
+    """
+    Whether a selector's own entry denies `operation` although the "*"
+    entry or a prefix wildcard of its resource may allow it.
+    """
+    if permissions is None or not permissions & OVERRIDE:
+        return False
+    if operation == Permission.READ.value:
+        return permissions == OVERRIDE
+    return not permissions & operation
+
+
+def withheld_operations(owned: Mapping[str, int]) -> int:
+    """
+    Operations a deny policy withholds from some selector of `owned`
+    although its "*" entry grants them. A write on "*" would reach that
+    selector too, so it can't be granted those.
+    """
+    if not owned.get(TOKEN_ALL, 0) & EXCLUSIONS:
+        return 0
+    withheld = 0
+    for permissions in owned.values():
+        if permissions & OVERRIDE:
+            withheld |= ALL_PERMISSIONS & ~permissions
+    return withheld
+
+
+def compile_decisions(
+    context: PolicyContext, denials: PolicyContext
+) -> PolicyContext:
+    """
+    Subtracts deny masks from a simplified allow context once, so decisions
+    stay a lookup or two. `denials` maps resources to selectors to denied
+    permissions, "*" denying them on every selector.
+
+    Denied bits are removed from each entry. But a selector is also granted
+    the masks of "*" and of the prefix wildcards contemplating it, so the
+    selectors denied something those would grant become OVERRIDE entries:
+    their mask is final, "*" and prefix wildcards don't apply to them. An
+    entry that is exactly OVERRIDE is blocked, neither readable nor
+    writable. The "*" entry of a resource holding OVERRIDE entries is
+    flagged with EXCLUSIONS, so "*" shortcuts know they have to look the
+    selector up. Denying a prefix wildcard is not supported.
+
+    >>> compile_decisions(
+        {"account": {"*": READ | UPDATE}}, {"account": {"5f34": UPDATE}}
+    )
+    {"account": {"*": EXCLUSIONS | READ | UPDATE, "5f34": OVERRIDE | READ}}
+    >>> compile_decisions(
+        {"account": {"*": READ}}, {"account": {"5f34": READ}}
+    )
+    {"account": {"*": EXCLUSIONS | READ, "5f34": OVERRIDE}}
+    """
+    if not denials:
+        return context
+    compiled = dict(context)
+    for resource, denied in denials.items():
+        if resource not in context:
+            continue
+        owned = compile_resource_decisions(context[resource], denied)
+        if owned:
+            compiled[resource] = owned
+        else:
+            del compiled[resource]
+    return compiled
+
+
+def inherited_permissions(
+    owned: SelectorPermissionMap, selector: str
+) -> Optional[int]:
+    """
+    Permissions `selector` is granted by the "*" entry and the prefix
+    wildcards of `owned`, None if neither contemplates it.
+    """
+    inherited = owned.get(TOKEN_ALL)
+    for idx in range(1, len(selector) + 1):
+        prefix = selector[:idx] + TOKEN_ALL
+        if prefix != selector and prefix in owned:
+            inherited = (inherited or 0) | owned[prefix]
+    return inherited
+
+
+def compile_resource_decisions(
+    owned: SelectorPermissionMap, denied: SelectorPermissionMap
+) -> SelectorPermissionMap:
+    deny_all = widen_denial(denied.get(TOKEN_ALL, 0))
+    if deny_all == ALL_PERMISSIONS:
+        return {}
+    compiled = {}
+    if TOKEN_ALL in owned:
+        compiled[TOKEN_ALL] = owned[TOKEN_ALL] & ~deny_all
+    for selector in chain(owned, denied):
+        if selector in compiled:
+            continue
+        if selector in denied and is_prefix(selector):
+            raise ValueError(
+                f"Deny policies on prefix wildcards, e.g. {selector}, "
+                "are not supported"
+            )
+        deny = widen_denial(denied.get(selector, 0)) | deny_all
+        inherited = inherited_permissions(owned, selector)
+        if inherited is not None and (
+            deny == ALL_PERMISSIONS or inherited & deny & ~deny_all
+        ):
+            # "*" or a prefix wildcard would grant what's denied here.
+            if TOKEN_ALL in compiled:
+                compiled[TOKEN_ALL] |= EXCLUSIONS
+            granted = (inherited | owned.get(selector, 0)) & ~deny
+            compiled[selector] = (
+                OVERRIDE
+                if deny == ALL_PERMISSIONS
+                else OVERRIDE | Permission.READ.value | granted
+            )
+        elif selector in owned and deny != ALL_PERMISSIONS:
+            permissions = owned[selector] & ~deny
+            if permissions or TOKEN_ALL not in owned:
+                compiled[selector] = permissions
+    return compiled
+
+
+@dataclass(eq=False)
+class Window:
+    "An applied time-bounded policy, see `ContextEncoder`"
+
+    policy: Policy
+    active: bool = False
+    retracted: bool = False
+
+
+class Transition(NamedTuple):
+    at: datetime
+    # Tie breaker, windows are never compared.
+    sequence: int
+    starts: bool
+    window: Window
+
+
+class ContextEncoder:
+    """
+    Incrementally maintains a simplified PolicyContext, i.e. the same output
+    as `encode_policies`, while policies and roles are applied or retracted
+    one at a time.
+
+    Every (resource, selector) keeps a reference count per permission bit,
+    so retracting a policy only drops the bits no other policy grants.
+    Applying or retracting a policy costs time proportional to its
+    conditionals, except when it changes a "*" mask: then that resource's
+    selectors are re-simplified against the new mask.
+
+    >>> encoder = ContextEncoder()
+    >>> encoder.apply(a_policy)  # UPDATE | CREATE on "*" of Account
+    >>> encoder.apply(ya_policy)  # UPDATE on "5f34" of Account
+    >>> encoder.context
+    {"account": {"*": 3}}
+    >>> encoder.retract(a_policy)
+    >>> encoder.context
+    {"account": {"5f34": 2}}
+
+    `context` only holds allowed permissions. Deny policies are counted the
+    same way in `denials`, and `decisions` is the compiled decision table.
+
+    Time-bounded policies are only counted while they hold. Their upcoming
+    starts and ends are kept in a min-heap, so `next_transition` is known
+    at a glance and `refresh` has nothing to do until it's due: then only
+    the policies starting or ending are applied or retracted. Retracted
+    policies leave their transitions behind, skipped once popped.
+    """
+
+    def __init__(
+        self,
+        policies: Optional[List[Policy]] = None,
+        now: Optional[datetime] = None,
+    ):
+        self.context: PolicyContext = {}
+        self.denials: PolicyContext = {}
+        # Counts of [*PERMISSION_BITS, references] per resource per selector
+        self._counts: Dict[str, Dict[str, List[int]]] = {}
+        self._deny_counts: Dict[str, Dict[str, List[int]]] = {}
+        self._transitions: List[Transition] = []
+        # Windows of applied time-bounded policies, by policy id
+        self._windows: Dict[int, List[Window]] = {}
+        self._sequence = count()
+        for policy in policies or []:
+            self.apply(policy, now)
+
+    @property
+    def decisions(self) -> PolicyContext:
+        self.refresh()
+        return compile_decisions(self.context, self.denials)
+
+    @property
+    def next_transition(self) -> Optional[datetime]:
+        "When a time-bounded policy starts or ends next, if ever"
+        transitions = self._transitions
+        while transitions and transitions[0].window.retracted:
+            heappop(transitions)
+        return transitions[0].at if transitions else None
+
+    def refresh(self, now: Optional[datetime] = None) -> None:
+        "Applies or retracts the time-bounded policies starting or ending"
+        transitions = self._transitions
+        if not transitions:
+            return
+        now = now or datetime.utcnow()
+        while transitions and transitions[0].at <= now:
+            transition = heappop(transitions)
+            window = transition.window
+            if window.retracted or window.active == transition.starts:
+                continue
+            window.active = transition.starts
+            self._count(window.policy, 1 if window.active else -1)
+
+    def apply(self, policy: Policy, now: Optional[datetime] = None) -> None:
+        if not policy.is_timed:
+            self._count(policy, 1)
+            return
+
+        now = now or datetime.utcnow()
+        window = Window(policy)
+        self._windows.setdefault(id(policy), []).append(window)
+        if policy.is_active(now):
+            window.active = True
+            self._count(policy, 1)
+        for moment in policy.transitions:
+            if moment > now:
+                self._schedule(moment, moment == policy.not_before, window)
+
+    def retract(self, policy: Policy) -> None:
+        if policy.is_timed:
+            windows = self._windows.get(id(policy))
+            if not windows:
+                raise ValueError(f"{policy} was never applied")
+            window = windows.pop()
+            if not windows:
+                del self._windows[id(policy)]
+            window.retracted = True
+            if window.active:
+                self._count(policy, -1)
+            return
+
+        counts = (self._deny_counts if policy.deny else self._counts).get(
+            policy.resource.alias, {}
+        )
+        if not self._holds(counts, policy):
+            raise ValueError(f"{policy} was never applied")
+        self._count(policy, -1)
+
+    def apply_role(self, role: Role) -> None:
+        for policy in role_fragments.policies(role):
+            self.apply(policy)
+
+    def retract_role(self, role: Role) -> None:
+        for policy in role_fragments.policies(role):
+            self.retract(policy)
+
+    @staticmethod
+    def _holds(counts: Dict[str, List[int]], policy: Policy) -> bool:
+        "Whether retracting `policy` leaves every count at 0 or above"
+        permissions = ptoi(policy.permissions)
+        references = Counter(
+            conditional.selector for conditional in policy.conditionals
+        )
+        for selector, times in references.items():
+            selector_counts = counts.get(selector)
+            if selector_counts is None or selector_counts[-1] < times:
+                return False
+            for idx, bit in enumerate(PERMISSION_BITS):
+                if permissions & bit and selector_counts[idx] < times:
+                    return False
+        return True
+
+    def _schedule(self, at: datetime, starts: bool, window: Window) -> None:
+        heappush(
+            self._transitions,
+            Transition(at, next(self._sequence), starts, window),
+        )
+
+    def _count(self, policy: Policy, delta: int) -> None:
+        if policy.deny:
+            self._update_denials(policy, delta)
+        else:
+            self._update(policy, delta)
+
+    def _update(self, policy: Policy, delta: int) -> None:
+        resource = intern(policy.resource.alias)
+        permissions = ptoi(policy.permissions)
+        counts = self._counts.setdefault(resource, {})
+        all_before = (TOKEN_ALL in counts, self._mask(counts.get(TOKEN_ALL)))
+
+        touched = []
+        for conditional in policy.conditionals:
+            selector = intern(conditional.selector)
+            selector_counts = counts.setdefault(
+                selector, [0] * (len(PERMISSION_BITS) + 1)
+            )
+            for idx, bit in enumerate(PERMISSION_BITS):
+                if permissions & bit:
+                    selector_counts[idx] += delta
+            selector_counts[-1] += delta
+            if selector_counts[-1] == 0:
+                del counts[selector]
+            touched.append(selector)
+
+        all_after = (TOKEN_ALL in counts, self._mask(counts.get(TOKEN_ALL)))
+        if all_after != all_before:
+            # "*" has changed, every selector must be simplified again.
+            touched = list(counts) + list(self.context.get(resource, {}))
+
+        for selector in touched:
+            self._simplify(resource, selector)
+
+        if not counts:
+            del self._counts[resource]
+            self.context.pop(resource, None)
+
+    def _simplify(self, resource: str, selector: str) -> None:
+        counts = self._counts[resource]
+        simplified = self.context.setdefault(resource, {})
+        if selector not in counts:
+            simplified.pop(selector, None)
+            return
+
+        permissions = self._mask(counts[selector])
+        if selector != TOKEN_ALL and TOKEN_ALL in counts:
+            permissions &= ~(self._mask(counts[TOKEN_ALL]) | Permission.READ)
+            if permissions == 0:
+                # Already contemplated by "*"
+                simplified.pop(selector, None)
+                return
+        simplified[selector] = permissions
+
+    def _update_denials(self, policy: Policy, delta: int) -> None:
+        # No simplification, denials are only looked up by selector.
+        resource = intern(policy.resource.alias)
+        permissions = ptoi(policy.permissions)
+        counts = self._deny_counts.setdefault(resource, {})
+        denied = self.denials.setdefault(resource, {})
+        for conditional in policy.conditionals:
+            selector = intern(conditional.selector)
+            selector_counts = counts.setdefault(
+                selector, [0] * (len(PERMISSION_BITS) + 1)
+            )
+            for idx, bit in enumerate(PERMISSION_BITS):
+                if permissions & bit:
+                    selector_counts[idx] += delta
+            selector_counts[-1] += delta
+            if selector_counts[-1] == 0:
+                del counts[selector]
+                del denied[selector]
+            else:
+                denied[selector] = self._mask(selector_counts)
+
+        if not counts:
+            del self._deny_counts[resource]
+            del self.denials[resource]
+
+    @staticmethod
+    def _mask(selector_counts: Optional[List[int]]) -> int:
+        if selector_counts is None:
+            return 0
+        mask = 0
+        for bit, references in zip(PERMISSION_BITS, selector_counts):
+            if references > 0:
+                mask |= bit
+        return mask
+
+
+class CyclicRoleErr(Exception):
+    def __init__(self, name: str):
+        super().__init__(f"Role {name} inherits from itself.")
+
+
+Signature = Tuple[int, Tuple[int, ...], Tuple[int, ...]]
+
+
+def signature(role: Role) -> Signature:
+    """
+    `role`'s version and the identities of its policies and parents. Ids
+    are only compared while the entry holding them keeps them alive.
+    """
+    return (
+        role.version,
+        tuple(map(id, role.policies)),
+        tuple(map(id, role.parents)),
+    )
+
+
+@dataclass
+class RoleEntry:
+    "A role's transitive closure, as cached by RoleFragmentCache"
+
+    # The role itself first, then its ancestors, each one once.
+    closure: Tuple[Role, ...]
+    signatures: Tuple[Signature, ...]
+    policies: Tuple[Policy, ...]
+    fragment: Optional[PolicyContext] = None
+    denials: Optional[PolicyContext] = None
+    # Sorted starts and ends of time-bounded policies. They split time in
+    # windows over which the same policies hold, and fragments are encoded
+    # for the window numbered `window`, see `RoleFragmentCache._current`.
+    transitions: Tuple[datetime, ...] = ()
+    window: int = -1
+
+    def is_current(self, role: Role) -> bool:
+        if signature(role) != self.signatures[0]:
+            return False
+        return all(
+            signature(ancestor) == ancestor_signature
+            for ancestor, ancestor_signature in zip(
+                self.closure[1:], self.signatures[1:]
+            )
+        )
+
+
+class RoleFragmentCache:
+    """
+    Thousands of users share the same handful of roles, so each role's
+    redundant context (see `build_redundant_context`) is encoded once and
+    kept in a bounded LRU cache keyed by role name, and by the version,
+    policies and parents it holds (see `signature`). A user's context is
+    then a cheap `merge_fragments` of cached fragments.
+
+    >>> cache = RoleFragmentCache(maxsize=2)
+    >>> cache.get(store_manager)
+    {"product": {"*": 1, "ab4f": 2}}
+    >>> cache.invalidate(store_manager.name)  # e.g. its policies changed
+
+    A role's fragment covers its inherited policies too. Its transitive
+    closure of parents is computed once, reusing the parents' cached
+    closures, and stays valid while no role in it changes signature. When a
+    parent changes, only its descendants are dropped.
+
+    Fragments of a role with time-bounded policies hold for the time window
+    they were encoded for. Asking for another moment, earlier or later,
+    encodes them again, so previewing a context doesn't change the others.
+
+    Fragments are shared and must not be mutated.
+    """
+
+    def __init__(self, maxsize: int = config.ROLE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[str, RoleEntry]" = OrderedDict()
+        # Parent name to the names of its direct children.
+        self._children: Dict[str, Set[str]] = defaultdict(set)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, role: Role, now: Optional[datetime] = None) -> PolicyContext:
+        "Redundant context of what `role` allows"
+        entry = self._current(role, now)
+        if entry.fragment is None:
+            entry.fragment = plain_context(
+                [
+                    policy
+                    for policy in entry.policies
+                    if not policy.deny and self._holds(policy, now)
+                ]
+            )
+        return entry.fragment
+
+    def denials(
+        self, role: Role, now: Optional[datetime] = None
+    ) -> PolicyContext:
+        "Redundant context of what `role` denies"
+        entry = self._current(role, now)
+        if entry.denials is None:
+            entry.denials = plain_context(
+                [
+                    policy
+                    for policy in entry.policies
+                    if policy.deny and self._holds(policy, now)
+                ]
+            )
+        return entry.denials
+
+    def next_transition(
+        self, role: Role, now: Optional[datetime] = None
+    ) -> Optional[datetime]:
+        "When a time-bounded policy of `role` starts or ends after `now`"
+        transitions = self._entry(role).transitions
+        index = bisect_right(transitions, now or datetime.utcnow())
+        return transitions[index] if index < len(transitions) else None
+
+    def closure(self, role: Role) -> Tuple[Role, ...]:
+        "`role` and all of its ancestors, each one once"
+        return self._entry(role).closure
+
+    def policies(self, role: Role) -> Tuple[Policy, ...]:
+        "Flattened policies of `role` and its ancestors, without repetition"
+        return self._entry(role).policies
+
+    def invalidate(self, name: str) -> None:
+        "Drops role `name` and every role inheriting from it"
+        pending, seen = [name], {name}
+        while pending:
+            current = pending.pop()
+            entry = self._entries.pop(current, None)
+            if entry is not None:
+                self._unlink(current, entry)
+            for child in self._children.pop(current, ()):
+                if child not in seen:
+                    seen.add(child)
+                    pending.append(child)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._children.clear()
+
+    def _unlink(self, name: str, entry: RoleEntry) -> None:
+        "Forgets `name` as a child of its parents, once it's no longer cached"
+        for parent in entry.closure[0].parents:
+            children = self._children.get(parent.name)
+            if children is None:
+                continue
+            children.discard(name)
+            if not children:
+                del self._children[parent.name]
+
+    def _current(self, role: Role, now: Optional[datetime]) -> RoleEntry:
+        """
+        `role`'s entry, whose fragments are dropped unless they were encoded
+        for the time window `now` falls in.
+        """
+        entry = self._entry(role)
+        if not entry.transitions:
+            return entry
+        window = bisect_right(entry.transitions, now or datetime.utcnow())
+        if window != entry.window:
+            entry.fragment = entry.denials = None
+            entry.window = window
+        return entry
+
+    @staticmethod
+    def _holds(policy: Policy, now: Optional[datetime]) -> bool:
+        return not policy.is_timed or policy.is_active(
+            now or datetime.utcnow()
+        )
+
+    def _entry(
+        self, role: Role, visiting: FrozenSet[str] = frozenset()
+    ) -> RoleEntry:
+        entry = self._entries.get(role.name)
+        if entry is not None and entry.is_current(role):
+            self._entries.move_to_end(role.name)
+            return entry
+        if entry is not None:
+            self.invalidate(role.name)
+        if role.name in visiting:
+            raise CyclicRoleErr(role.name)
+
+        visiting = visiting | {role.name}
+        closure: Dict[str, Role] = {role.name: role}
+        for parent in role.parents:
+            parent_closure = self._entry(parent, visiting).closure
+            # Registered once the parent is current: refreshing drops children
+            self._children[parent.name].add(role.name)
+            for ancestor in parent_closure:
+                closure.setdefault(ancestor.name, ancestor)
+
+        policies: Dict[int, Policy] = {}
+        for member in closure.values():
+            for policy in member.policies:
+                policies.setdefault(id(policy), policy)
+
+        entry = RoleEntry(
+            closure=tuple(closure.values()),
+            signatures=tuple(signature(member) for member in closure.values()),
+            policies=tuple(policies.values()),
+            transitions=tuple(
+                sorted(
+                    {
+                        moment
+                        for policy in policies.values()
+                        for moment in policy.transitions
+                    }
+                )
+            ),
+        )
+        self._entries[role.name] = entry
+        if len(self._entries) > self.maxsize:
+            self._unlink(*self._entries.popitem(last=False))
+        return entry
+
+
+role_fragments = RoleFragmentCache()
+
+
+def plain_context(policies: List[Policy]) -> PolicyContext:
+    "`build_redundant_context` made of plain dicts"
+    return {
+        resource: dict(selector_perm)
+        for resource, selector_perm in build_redundant_context(
+            policies
+        ).items()
+    }
+
+
+def union_contexts(contexts: Iterable[PolicyContext]) -> PolicyContext:
+    "ORs the permissions of every selector of every context"
+    merged: PolicyContext = {}
+    for context in contexts:
+        for resource, selector_perm in context.items():
+            owned = merged.setdefault(resource, {})
+            for selector, permissions in selector_perm.items():
+                owned[selector] = owned.get(selector, 0) | permissions
+    return merged
+
+
+def merge_fragments(fragments: Iterable[PolicyContext]) -> PolicyContext:
+    """
+    Unionizes redundant contexts and simplifies the result, which is
+    equivalent to encoding all of their policies together.
+
+    >>> merge_fragments([{"account": {"*": 2}}, {"account": {"5f34": 3}}])
+    {"account": {"*": 2, "5f34": 1}}
+    """
+    return remove_context_redundancy(union_contexts(fragments))
+
+
 def encode_policies(policies: List[Policy]) -> PolicyContext:
     """
     This functions parses a list of Policy and return a mapping of
@@ -301,12 +1011,24 @@ def encode_policies(policies: List[Policy]) -> PolicyContext:
     >>> pack_policies([a_policy, ya_policy])
     {
         "product": {
-            "5f34": 0,
+            "5f34": 8,
         },
         "account": {
             "*": 4,
         },
     }
     """
-    context = build_redundant_context(policies)
-    return remove_context_redundancy(context)
+    now = datetime.utcnow()
+    held = [
+        policy
+        for policy in policies
+        if not policy.is_timed or policy.is_active(now)
+    ]
+    allowed = [policy for policy in held if not policy.deny]
+    denied = [policy for policy in held if policy.deny]
+    return intern_context(
+        compile_decisions(
+            remove_context_redundancy(build_redundant_context(allowed)),
+            plain_context(denied),
+        )
+    )
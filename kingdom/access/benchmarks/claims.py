@@ -0,0 +1,57 @@
+"""
+Compares the JSON `policies` claim against the compact `pol` claim, both in
+token size and in the time it takes to go from a token to a context.
+
+    python -m kingdom.access.benchmarks.claims
+"""
+import json
+import random
+import sys
+import uuid
+from typing import Dict
+
+from kingdom.access import claims, jwt
+from kingdom.access.benchmarks.harness import measure
+from kingdom.access.context import CompiledPolicyContext
+from kingdom.access.types import PolicyContext
+
+RESOURCES = 20
+SIZES = (10, 100, 1000)
+
+
+def synthetic_context(resources: int, selectors: int) -> PolicyContext:
+    rng = random.Random(resources * selectors)
+    return {
+        f"resource{r}": {
+            str(uuid.UUID(int=rng.getrandbits(128))): rng.randint(1, 7)
+            for _ in range(selectors)
+        }
+        for r in range(resources)
+    }
+
+
+def run(resources: int, selectors: int) -> Dict:
+    context = synthetic_context(resources, selectors // resources or 1)
+    plain = jwt.encode(dict(sub="abbf", policies=context))
+    compact = jwt.encode(dict(sub="abbf", pol=claims.encode_claim(context)))
+
+    def decode_plain():
+        return CompiledPolicyContext(jwt.decode(plain)["policies"])
+
+    def decode_compact():
+        return CompiledPolicyContext.from_claim(jwt.decode(compact)["pol"])
+
+    assert decode_plain() == decode_compact()
+    options = dict(samples=20, number=10, warmup=1)
+    return dict(
+        selectors=selectors,
+        plain_bytes=len(plain),
+        compact_bytes=len(compact),
+        plain_decode=measure(decode_plain, **options),
+        compact_decode=measure(decode_compact, **options),
+    )
+
+
+if __name__ == "__main__":
+    results = [run(RESOURCES, size) for size in SIZES]
+    json.dump(results, sys.stdout, indent=2)
@@ -0,0 +1,35 @@
+"""
+Parsing long `||` chains of conditionals with the single-pass parser, with
+and without its memoization.
+
+    python -m kingdom.access.benchmarks.dsl
+"""
+import json
+import sys
+from typing import Dict
+
+from kingdom.access.benchmarks.harness import measure
+from kingdom.access.dsl import parse_conditionals
+
+SIZES = (10, 1000, 5000)
+
+
+def chain(clauses: int) -> str:
+    return " || ".join(f"resource.id == '{i:08x}'" for i in range(clauses))
+
+
+def run(clauses: int) -> Dict:
+    sequence = chain(clauses)
+    assert len(parse_conditionals(sequence)) == clauses
+    options = dict(samples=20, number=1, warmup=1)
+    return dict(
+        clauses=clauses,
+        single_pass=measure(
+            lambda: parse_conditionals.__wrapped__(sequence), **options
+        ),
+        memoized=measure(lambda: parse_conditionals(sequence), **options),
+    )
+
+
+if __name__ == "__main__":
+    json.dump([run(size) for size in SIZES], sys.stdout, indent=2)
@@ -0,0 +1,82 @@
+"""
+generators.py
+
+Deterministic synthetic roles, users and access requests, so benchmark
+runs of a given size are comparable with each other.
+
+>>> roles = synthetic_roles(roles=4, policies=8, selectors=16)
+>>> len(roles), len(roles[0].policies), len(roles[0].policies[0].conditionals)
+(4, 8, 16)
+"""
+import random
+import uuid
+from typing import List, Tuple
+
+from kingdom.access.base import Permission, Policy, Resource, Role, Statement
+from kingdom.access.dsl import TOKEN_ALL
+from kingdom.access.types import PolicyContext
+
+Request = Tuple[str, str, str]
+
+RESOURCES = 20
+# Share of policies granting "*" rather than listing selectors.
+WILDCARD_RATIO = 0.05
+OPERATIONS = tuple(Permission.__members__)
+
+
+def selector_pool(size: int, seed: int = 0) -> List[str]:
+    "Uuid selectors, drawn from a fixed pool so roles overlap"
+    rng = random.Random(seed)
+    return [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(size)]
+
+
+def synthetic_roles(
+    roles: int,
+    policies: int,
+    selectors: int,
+    resources: int = RESOURCES,
+    seed: int = 0,
+) -> List[Role]:
+    "`roles` roles of `policies` policies of `selectors` selectors each"
+    rng = random.Random(seed)
+    pool = selector_pool(max(selectors * 4, 1), seed)
+    permissions = [p for p in Permission]
+
+    def policy() -> Policy:
+        resource = Resource(f"Resource{rng.randrange(resources)}")
+        granted = tuple(rng.sample(permissions, rng.randint(1, 3)))
+        if rng.random() < WILDCARD_RATIO:
+            picked = [TOKEN_ALL]
+        else:
+            picked = rng.sample(pool, min(selectors, len(pool)))
+        return Policy(
+            resource=resource,
+            permissions=granted,
+            conditionals=[
+                Statement("resource.id", selector) for selector in picked
+            ],
+        )
+
+    return [
+        Role(f"role{r}", policies=[policy() for _ in range(policies)])
+        for r in range(roles)
+    ]
+
+
+def synthetic_requests(
+    context: PolicyContext, count: int, seed: int = 0
+) -> List[Request]:
+    """
+    (resource, operation, selector) triples against `context`, mixing
+    owned and unknown selectors and resources.
+    """
+    rng = random.Random(seed)
+    resources = sorted(context) + ["unknown"]
+    strangers = selector_pool(16, seed + 1)
+    requests = []
+    for _ in range(count):
+        resource = rng.choice(resources)
+        owned = sorted(context.get(resource, {})) or strangers
+        selector = rng.choice(owned if rng.random() < 0.8 else strangers)
+        requests.append((resource, rng.choice(OPERATIONS), selector))
+    return requests
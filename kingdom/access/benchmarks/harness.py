@@ -0,0 +1,169 @@
+"""
+harness.py
+
+Timing, reporting and baseline comparison shared by the benchmark suite.
+
+Every case is timed in samples of `number` calls, so percentiles are taken
+over per-call averages of each sample rather than over single calls, which
+would mostly measure the clock itself for sub-microsecond operations.
+
+>>> stats = measure(lambda: sum(range(100)), samples=50, number=100)
+>>> sorted(stats)
+['calls_per_sec', 'mean_us', 'p50_us', 'p99_us']
+"""
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+Stats = Dict[str, float]
+Results = Dict[str, Any]
+
+SAMPLES = 200
+NUMBER = 100
+WARMUP = 10
+# Relative slowdown of p50 over the baseline that counts as a regression.
+TOLERANCE = 0.25
+
+
+def percentile(samples: Sequence[float], q: float) -> float:
+    """
+    Nearest-rank percentile of `samples`, `q` in [0, 100].
+
+    >>> percentile([4, 1, 3, 2], 50)
+    2
+    """
+    if not samples:
+        raise ValueError("percentile of an empty sample")
+    ordered = sorted(samples)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[min(int(rank), len(ordered)) - 1]
+
+
+def measure(
+    fn: Callable[[], Any],
+    samples: int = SAMPLES,
+    number: int = NUMBER,
+    warmup: int = WARMUP,
+) -> Stats:
+    "Latency percentiles (microseconds per call) and throughput of `fn`"
+    for _ in range(warmup):
+        fn()
+
+    timings: List[float] = []
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(samples):
+            start = time.perf_counter_ns()
+            for _ in range(number):
+                fn()
+            timings.append((time.perf_counter_ns() - start) / number / 1e3)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    mean = sum(timings) / len(timings)
+    return dict(
+        calls_per_sec=1e6 / mean if mean else float("inf"),
+        mean_us=mean,
+        p50_us=percentile(timings, 50),
+        p99_us=percentile(timings, 99),
+    )
+
+
+def environment() -> Dict[str, str]:
+    "Where the results come from, numbers are only comparable on one host"
+    return dict(
+        python=platform.python_version(),
+        implementation=platform.python_implementation(),
+        machine=platform.machine(),
+        system=platform.system(),
+    )
+
+
+def report(cases: Dict[str, Stats]) -> Results:
+    return dict(environment=environment(), cases=cases)
+
+
+def save(results: Results, path: str) -> None:
+    with open(path, "w") as output:
+        json.dump(results, output, indent=2, sort_keys=True)
+
+
+def load(path: str) -> Results:
+    with open(path) as source:
+        results: Results = json.load(source)
+    return results
+
+
+def compare(
+    results: Results, baseline: Results, tolerance: float = TOLERANCE
+) -> Dict[str, float]:
+    """
+    Relative p50 change of every case present in both runs, positive being
+    slower, e.g. {"authorize/dict": 0.25} for a 25% slowdown. Only the
+    cases beyond `tolerance` in either direction are returned.
+    """
+    changes = {}
+    previous = baseline["cases"]
+    for case, stats in results["cases"].items():
+        if case not in previous or not previous[case]["p50_us"]:
+            continue
+        change = stats["p50_us"] / previous[case]["p50_us"] - 1
+        if abs(change) > tolerance:
+            changes[case] = change
+    return changes
+
+
+def format_table(results: Results) -> str:
+    lines = [f"{'case':<48} {'calls/s':>12} {'p50 us':>10} {'p99 us':>10}"]
+    for case, stats in results["cases"].items():
+        lines.append(
+            f"{case:<48} {stats['calls_per_sec']:>12.0f} "
+            f"{stats['p50_us']:>10.2f} {stats['p99_us']:>10.2f}"
+        )
+    return "\n".join(lines)
+
+
+def parser(description: str) -> argparse.ArgumentParser:
+    cli = argparse.ArgumentParser(description=description)
+    cli.add_argument("-o", "--output", help="save results as JSON")
+    cli.add_argument("-b", "--baseline", help="compare against saved JSON")
+    cli.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=TOLERANCE,
+        help="relative p50 change reported against the baseline",
+    )
+    cli.add_argument(
+        "-k", "--filter", default="", help="only run cases containing this"
+    )
+    return cli
+
+
+def main(
+    description: str,
+    run: Callable[[str], Dict[str, Stats]],
+    argv: Optional[Sequence[str]] = None,
+) -> int:
+    """
+    Command line entry point: runs, prints, optionally saves and compares.
+    Exits with 1 if any case regressed beyond the tolerance.
+    """
+    args = parser(description).parse_args(argv)
+    results = report(run(args.filter))
+    sys.stdout.write(format_table(results) + "\n")
+    if args.output:
+        save(results, args.output)
+    if not args.baseline:
+        return 0
+
+    changes = compare(results, load(args.baseline), args.tolerance)
+    for case, change in sorted(changes.items(), key=lambda item: item[1]):
+        sys.stderr.write(f"{case}: {change:+.1%} p50 against baseline\n")
+    return int(any(change > 0 for change in changes.values()))
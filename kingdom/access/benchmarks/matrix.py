@@ -0,0 +1,77 @@
+"""
+"Which of these users can UPDATE this selector": `authorize` once per user
+against a single PermissionMatrix query.
+
+    python -m kingdom.access.benchmarks.matrix
+"""
+import json
+import random
+import sys
+from typing import Dict
+
+from kingdom.access.base import encode_policies
+from kingdom.access.benchmarks.generators import (
+    synthetic_requests,
+    synthetic_roles,
+)
+from kingdom.access.benchmarks.harness import measure
+from kingdom.access.context import CompiledPolicyContext
+from kingdom.access.flow import NotEnoughPrivilegesErr, authorize
+from kingdom.access.matrix import PermissionMatrix
+
+SIZES = (500, 5000)
+ROLES = 30
+ROLES_PER_USER = 3
+
+
+def contexts(users: int) -> Dict:
+    rng = random.Random(users)
+    roles = synthetic_roles(ROLES, policies=10, selectors=20)
+    return {
+        f"user{u}": encode_policies(
+            [
+                policy
+                for role in rng.sample(roles, ROLES_PER_USER)
+                for policy in role.policies
+            ]
+        )
+        for u in range(users)
+    }
+
+
+def run(users: int) -> Dict:
+    by_user = contexts(users)
+    compiled = {
+        user: CompiledPolicyContext(context)
+        for user, context in by_user.items()
+    }
+    matrix = PermissionMatrix(by_user)
+    resource, _, selector = synthetic_requests(by_user["user0"], 1)[0]
+
+    def loop():
+        allowed = []
+        for user, context in compiled.items():
+            try:
+                authorize(context, resource, "UPDATE", selector)
+                allowed.append(user)
+            except NotEnoughPrivilegesErr:
+                pass
+        return allowed
+
+    def vectorized():
+        return matrix.who_can(resource, "UPDATE", selector)
+
+    assert sorted(loop()) == sorted(vectorized())
+    options = dict(samples=20, number=1, warmup=1)
+    return dict(
+        users=users,
+        loop=measure(loop, **options),
+        matrix=measure(vectorized, **options),
+        update_row=measure(
+            lambda: matrix.set_row("user0", by_user["user1"]), **options
+        ),
+    )
+
+
+if __name__ == "__main__":
+    json.dump([run(users) for users in SIZES], sys.stdout, indent=2)
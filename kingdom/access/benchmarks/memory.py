@@ -0,0 +1,74 @@
+"""
+Memory held by the policy contexts of many concurrent users, decoded from
+their tokens with and without string interning.
+
+    python -m kingdom.access.benchmarks.memory
+"""
+import json
+import random
+import sys
+import tracemalloc
+from typing import Callable, Dict, List
+
+import jwt as pyjwt
+from kingdom.access import config, jwt
+from kingdom.access.base import User
+from kingdom.access.benchmarks.generators import synthetic_roles
+from kingdom.access.types import PolicyContext
+
+ROLES = 20
+ROLES_PER_USER = 3
+SIZES = (100, 1000)
+
+
+def tokens(users: int) -> List[bytes]:
+    roles = synthetic_roles(ROLES, policies=10, selectors=20)
+    rng = random.Random(users)
+    return [
+        jwt.encode(
+            User(f"user{u}", rng.sample(roles, ROLES_PER_USER)).jwt_payload
+        )
+        for u in range(users)
+    ]
+
+
+def decode_plain(token: bytes) -> PolicyContext:
+    payload = pyjwt.decode(
+        token, key=config.RANDOM_KEY, algorithms=[config.JWT_ALGORITHM]
+    )
+    context: PolicyContext = payload[config.POLICY_CLAIM]
+    return context
+
+
+def decode_interned(token: bytes) -> PolicyContext:
+    context: PolicyContext = jwt.verify(token)[config.POLICY_CLAIM]
+    return context
+
+
+def held_bytes(
+    decode: Callable[[bytes], PolicyContext], issued: List[bytes]
+) -> int:
+    "Bytes still allocated while every decoded context is alive"
+    tracemalloc.start()
+    contexts = [decode(token) for token in issued]
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert len(contexts) == len(issued)
+    return held
+
+
+def run(users: int) -> Dict:
+    issued = tokens(users)
+    assert decode_plain(issued[0]) == decode_interned(issued[0])
+    plain = held_bytes(decode_plain, issued)
+    interned = held_bytes(decode_interned, issued)
+    return dict(
+        users=users,
+        plain_bytes=plain,
+        interned_bytes=interned,
+        saved=1 - interned / plain,
+    )
+
+
+if __name__ == "__main__":
+    json.dump([run(users) for users in SIZES], sys.stdout, indent=2)
@@ -0,0 +1,78 @@
+"""
+Memory each worker holds to serve many users' contexts, built in process
+against memory-mapped from a shared snapshot, what a lookup costs on either
+and what copying a subject's context out of the snapshot costs.
+
+    python -m kingdom.access.benchmarks.snapshot
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import tracemalloc
+from typing import Callable, Dict
+
+from kingdom.access.base import User
+from kingdom.access.benchmarks.generators import (
+    synthetic_requests,
+    synthetic_roles,
+)
+from kingdom.access.benchmarks.harness import measure
+from kingdom.access.benchmarks.suite import authorize_case
+from kingdom.access.snapshot import Snapshot, publish
+
+ROLES = 20
+ROLES_PER_USER = 3
+SIZES = (100, 1000)
+
+
+def held_bytes(build: Callable[[], object]) -> int:
+    "Bytes still allocated while what `build` returns is alive"
+    tracemalloc.start()
+    built = build()
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert built is not None
+    return held
+
+
+def run(users: int) -> Dict:
+    roles = synthetic_roles(ROLES, policies=10, selectors=20)
+    rng = random.Random(users)
+    contexts = {
+        f"user{u}": User(
+            f"user{u}", rng.sample(roles, ROLES_PER_USER)
+        ).policy_context
+        for u in range(users)
+    }
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "policies")
+        publish(path, contexts)
+        snapshot = Snapshot.open(path)
+        requests = synthetic_requests(contexts["user0"], 1000)
+        options = dict(samples=20, number=100, warmup=1)
+        return dict(
+            users=users,
+            snapshot_bytes=os.path.getsize(path),
+            dict_held_bytes=held_bytes(
+                lambda: json.loads(json.dumps(contexts))
+            ),
+            mapped_held_bytes=held_bytes(lambda: Snapshot.open(path)),
+            authorize_dict=measure(
+                authorize_case(contexts["user0"], requests), **options
+            ),
+            authorize_snapshot=measure(
+                authorize_case(snapshot["user0"], requests), **options
+            ),
+            copy_context=measure(
+                lambda: snapshot["user0"].to_dict(),
+                samples=20,
+                number=10,
+                warmup=1,
+            ),
+        )
+
+
+if __name__ == "__main__":
+    json.dump([run(users) for users in SIZES], sys.stdout, indent=2)
@@ -0,0 +1,150 @@
+"""
+suite.py
+
+End-to-end benchmarks of the policy engine as N roles x M policies x K
+selectors grow: encoding, authorization through both context flavours,
+`check_permission` and the JWT round trip.
+
+    python -m kingdom.access.benchmarks.suite -o results.json
+    python -m kingdom.access.benchmarks.suite -b results.json -k authorize
+
+Case names read `<operation>/<flavour>/<N>x<M>x<K>`. With a baseline, the
+cases whose p50 moved beyond the tolerance are reported, and the exit code
+is 1 if any of them got slower.
+"""
+import sys
+from itertools import cycle
+from typing import Callable, Dict, List, Tuple
+
+from kingdom.access import jwt
+from kingdom.access.base import User, encode_policies, role_fragments
+from kingdom.access.benchmarks import harness
+from kingdom.access.benchmarks.generators import (
+    Request,
+    synthetic_requests,
+    synthetic_roles,
+)
+from kingdom.access.context import CompiledPolicyContext, fingerprint
+from kingdom.access.flow import (
+    AccessRequest,
+    DecisionCache,
+    NotEnoughPrivilegesErr,
+    authorize,
+    check_permission,
+)
+
+# (roles, policies per role, selectors per policy)
+SIZES: Tuple[Tuple[int, int, int], ...] = (
+    (1, 10, 10),
+    (5, 20, 50),
+    (10, 50, 200),
+)
+REQUESTS = 1000
+# Encoding a whole role set is orders of magnitude slower than a lookup.
+SLOW = dict(samples=20, number=1, warmup=1)
+MEDIUM = dict(samples=50, number=5, warmup=1)
+
+Case = Callable[[], object]
+
+
+def authorize_case(context, requests: List[Request]) -> Case:
+    pending = cycle(requests)
+
+    def case():
+        resource, operation, selector = next(pending)
+        try:
+            return authorize(context, resource, operation, selector)
+        except NotEnoughPrivilegesErr:
+            return None
+
+    return case
+
+
+def cached_authorize_case(context, requests: List[Request]) -> Case:
+    "Authorizes through a DecisionCache large enough to hold every request"
+    pending = cycle(requests)
+    cache = DecisionCache(maxsize=len(requests))
+    digest = fingerprint(context)
+
+    def case():
+        resource, operation, selector = next(pending)
+        try:
+            return cache.authorize(
+                context, resource, operation, selector, digest
+            )
+        except NotEnoughPrivilegesErr:
+            return None
+
+    return case
+
+
+def check_permission_case(context, requests: List[Request]) -> Case:
+    pending = cycle(requests)
+
+    def case():
+        resource, operation, selector = next(pending)
+        return check_permission(
+            context, AccessRequest(operation, resource, selector)
+        )
+
+    return case
+
+
+def cases(roles: int, policies: int, selectors: int) -> Dict[str, Tuple]:
+    "Case name to (callable, measure keyword arguments)"
+    size = f"{roles}x{policies}x{selectors}"
+    role_set = synthetic_roles(roles, policies, selectors)
+    user = User(access_key="abbf", roles=list(role_set))
+    every_policy = [p for role in role_set for p in role.policies]
+    context = encode_policies(every_policy)
+    compiled = CompiledPolicyContext(context)
+    requests = synthetic_requests(context, REQUESTS)
+    token = jwt.encode(user.jwt_payload)
+
+    def encode_cached():
+        return user.policy_context
+
+    def roundtrip():
+        return jwt.verify(jwt.encode(user.jwt_payload))
+
+    return {
+        f"encode_policies/plain/{size}": (
+            lambda: encode_policies(every_policy),
+            SLOW,
+        ),
+        f"policy_context/cached/{size}": (encode_cached, MEDIUM),
+        f"compile/context/{size}": (
+            lambda: CompiledPolicyContext(context),
+            SLOW,
+        ),
+        f"authorize/dict/{size}": (authorize_case(context, requests), {}),
+        f"authorize/compiled/{size}": (
+            authorize_case(compiled, requests),
+            {},
+        ),
+        f"authorize/cached/{size}": (
+            cached_authorize_case(context, requests),
+            {},
+        ),
+        f"check_permission/dict/{size}": (
+            check_permission_case(context, requests),
+            {},
+        ),
+        f"jwt/roundtrip/{size}": (roundtrip, SLOW),
+        f"jwt/decode_cached/{size}": (lambda: jwt.decode(token), {}),
+    }
+
+
+def run(only: str = "") -> Dict[str, harness.Stats]:
+    results = {}
+    for size in SIZES:
+        for name, (case, options) in cases(*size).items():
+            if only not in name:
+                continue
+            results[name] = harness.measure(case, **options)
+    role_fragments.clear()
+    return results
+
+
+if __name__ == "__main__":
+    sys.exit(harness.main("kingdom.access policy engine benchmarks", run))
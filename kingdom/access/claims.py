@@ -0,0 +1,231 @@
+"""
+claims.py
+
+Compact binary encoding of a PolicyContext, meant to travel as a single JWT
+claim instead of the plain JSON dict.
+
+Layout (then base64url'd, without padding):
+    version     ::= byte
+    width       ::= byte, 2 or 4, size of a string index
+    uuids       ::= varint (16 bytes)*
+    strings     ::= varint (varint-header bytes)*
+    resources   ::= varint (varint-idx varint-n idx{n} permissions{n})*
+
+Every resource alias and selector is written once and referenced by a
+fixed-width little-endian index into uuids + strings. Permissions take a
+single byte each. A string header is `length << 1 | kind`, kind being
+STR_UTF8 or STR_HEX (lowercase hex of even length, stored as raw bytes).
+
+Since the claim is base64'd twice (once here, once by the JWT itself)
+selectors are packed as raw bytes whenever possible, and fixed-width blocks
+let the decoder rely on `bytes.hex`, `array` and `zip` instead of parsing
+one varint, or formatting one uuid, at a time. Decoded strings are
+interned, see `interning`.
+"""
+import base64
+import re
+import sys
+import uuid
+from array import array
+from typing import Dict, List, Tuple
+
+from kingdom.access.interning import intern
+from kingdom.access.types import PolicyContext
+
+FORMAT_VERSION = 1
+STR_UTF8, STR_HEX = 0, 1
+INDEX_TYPECODES = {2: "H", 4: "I"}
+
+UUID_RE = re.compile(
+    r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+)
+HEX_RE = re.compile(r"(?:[0-9a-f]{2})+")
+# Canonical uuids are laid out UUID_STRIDE characters apart, a separator
+# after each one, with hex digit i of a uuid at UUID_COLUMNS[i].
+UUID_STRIDE = 37
+UUID_COLUMNS = tuple(
+    digit + (digit >= 8) + (digit >= 12) + (digit >= 16) + (digit >= 20)
+    for digit in range(32)
+)
+
+
+class InvalidClaim(Exception):
+    def __init__(self, reason: str):
+        super().__init__(f"Unauthorized: Invalid policy claim, {reason}.")
+
+
+def write_varint(buffer: bytearray, value: int) -> None:
+    "Appends `value` to buffer as an unsigned LEB128 varint"
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def read_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    "Reads an unsigned LEB128 varint, returns it and the next offset"
+    try:
+        byte = data[offset]
+        if byte < 0x80:
+            # Fast path: almost every varint in a claim is a single byte
+            return byte, offset + 1
+        value = byte & 0x7F
+        shift = 7
+        while True:
+            offset += 1
+            byte = data[offset]
+            value |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return value, offset + 1
+            shift += 7
+    except IndexError:
+        raise InvalidClaim("truncated varint")
+
+
+def read_block(data: bytes, offset: int, length: int) -> Tuple[bytes, int]:
+    end = offset + length
+    if end > len(data):
+        raise InvalidClaim("truncated claim")
+    return data[offset:end], end
+
+
+def pack_indexes(indexes: List[int], width: int) -> bytes:
+    packed = array(INDEX_TYPECODES[width], indexes)
+    if sys.byteorder == "big":
+        packed.byteswap()
+    return packed.tobytes()
+
+
+def unpack_indexes(raw: bytes, width: int) -> array:
+    unpacked = array(INDEX_TYPECODES[width])
+    unpacked.frombytes(raw)
+    if sys.byteorder == "big":
+        unpacked.byteswap()
+    return unpacked
+
+
+def uuid_strings(raw: bytes) -> List[str]:
+    """
+    Canonical strings of the uuids packed in `raw`, 16 bytes each. All of
+    them are hexed at once and laid out one hex digit column at a time,
+    instead of formatting every uuid on its own.
+    """
+    if not raw:
+        return []
+    count = len(raw) // 16
+    hexed = raw.hex().encode("ascii")
+    laid_out = bytearray(b"-" * (UUID_STRIDE * count))
+    for digit, column in enumerate(UUID_COLUMNS):
+        laid_out[column::UUID_STRIDE] = hexed[digit::32]
+    laid_out[UUID_STRIDE - 1::UUID_STRIDE] = b" " * count
+    return laid_out.decode("ascii").split()
+
+
+def write_string(buffer: bytearray, string: str) -> None:
+    if HEX_RE.fullmatch(string):
+        write_varint(buffer, len(string) // 2 << 1 | STR_HEX)
+        buffer += bytes.fromhex(string)
+    else:
+        encoded = string.encode("utf-8")
+        write_varint(buffer, len(encoded) << 1 | STR_UTF8)
+        buffer += encoded
+
+
+def pack_context(context: PolicyContext) -> bytes:
+    uuids: Dict[str, int] = {}
+    strings: Dict[str, int] = {}
+    for resource, selector_perm in context.items():
+        for string in (resource, *selector_perm):
+            if string in uuids or string in strings:
+                continue
+            if UUID_RE.fullmatch(string):
+                uuids[string] = len(uuids)
+            else:
+                strings[string] = len(strings)
+
+    width = 2 if len(uuids) + len(strings) <= 0xFFFF else 4
+    index = {**uuids, **{s: i + len(uuids) for s, i in strings.items()}}
+
+    buffer = bytearray([FORMAT_VERSION, width])
+    write_varint(buffer, len(uuids))
+    for string in uuids:
+        buffer += uuid.UUID(string).bytes
+
+    write_varint(buffer, len(strings))
+    for string in strings:
+        write_string(buffer, string)
+
+    write_varint(buffer, len(context))
+    for resource, selector_perm in context.items():
+        write_varint(buffer, index[resource])
+        write_varint(buffer, len(selector_perm))
+        buffer += pack_indexes([index[s] for s in selector_perm], width)
+        try:
+            buffer += bytes(selector_perm.values())
+        except ValueError:
+            raise InvalidClaim("permissions must fit in a byte")
+    return bytes(buffer)
+
+
+def unpack_context(data: bytes) -> PolicyContext:
+    if len(data) < 2 or data[0] != FORMAT_VERSION:
+        raise InvalidClaim("unknown format version")
+    width = data[1]
+    if width not in INDEX_TYPECODES:
+        raise InvalidClaim("unknown index width")
+
+    count, offset = read_varint(data, 2)
+    raw, offset = read_block(data, offset, count * 16)
+    strings = list(map(intern, uuid_strings(raw)))
+
+    count, offset = read_varint(data, offset)
+    for _ in range(count):
+        header, offset = read_varint(data, offset)
+        raw, offset = read_block(data, offset, header >> 1)
+        if header & 1 == STR_HEX:
+            strings.append(intern(raw.hex()))
+            continue
+        try:
+            strings.append(intern(raw.decode("utf-8")))
+        except UnicodeDecodeError:
+            raise InvalidClaim("string is not utf-8")
+
+    context: PolicyContext = {}
+    resources, offset = read_varint(data, offset)
+    try:
+        for _ in range(resources):
+            resource, offset = read_varint(data, offset)
+            selectors, offset = read_varint(data, offset)
+            raw, offset = read_block(data, offset, selectors * width)
+            permissions, offset = read_block(data, offset, selectors)
+            context[strings[resource]] = dict(
+                zip(
+                    map(strings.__getitem__, unpack_indexes(raw, width)),
+                    permissions,
+                )
+            )
+    except IndexError:
+        raise InvalidClaim("unknown string reference")
+    return context
+
+
+def encode_claim(context: PolicyContext) -> str:
+    """
+    >>> encode_claim({"account": {"*": 2, "5f34": 1}})
+    'AQIAAw5hY2NvdW50AioFXzQBAAIBAAIAAgE'
+    """
+    packed = pack_context(context)
+    return base64.urlsafe_b64encode(packed).rstrip(b"=").decode("ascii")
+
+
+def decode_claim(claim: str) -> PolicyContext:
+    """
+    >>> decode_claim('AQIAAw5hY2NvdW50AioFXzQBAAIBAAIAAgE')
+    {"account": {"*": 2, "5f34": 1}}
+    """
+    padding = "=" * (-len(claim) % 4)
+    try:
+        packed = base64.urlsafe_b64decode(claim + padding)
+    except (ValueError, TypeError):
+        raise InvalidClaim("not base64url")
+    return unpack_context(packed)
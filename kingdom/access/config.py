@@ -2,3 +2,12 @@ TOKEN_ALL = "*"
 RANDOM_KEY = "abcd00f"
 JWT_ALGORITHM = "HS256"
 TOKEN_EXPIRATION_MIN = 30
+ROLE_CACHE_SIZE = 1024
+# Ship policies as a compact binary claim (see claims.py) instead of JSON.
+COMPACT_POLICY_CLAIM = False
+POLICY_CLAIM = "policies"
+COMPACT_POLICY_CLAIM_NAME = "pol"
+TOKEN_CACHE_SIZE = 4096
+DECISION_CACHE_SIZE = 8192
+DSL_CACHE_SIZE = 1024
+SCOPE_CACHE_SIZE = 8192
@@ -0,0 +1,376 @@
+"""
+context.py
+
+A PolicyContext is a plain nested dict, which is great for JSON claims but
+not for answering authorization questions on every resolver call.
+
+CompiledPolicyContext is built once from `encode_policies` output and
+answers read-scope and write checks through direct hash lookups: resource
+and selector strings are interned, "*" masks are precomputed and every
+scope that may be handed back is materialized at compile time.
+"""
+import hashlib
+import json
+from collections.abc import Collection
+from itertools import compress
+from types import MappingProxyType
+from typing import Dict, FrozenSet, Iterator, Mapping, Optional
+
+from kingdom.access import claims
+from kingdom.access.base import (
+    EXCLUSIONS,
+    OVERRIDE,
+    Permission,
+    is_blocked,
+    withheld_operations,
+)
+from kingdom.access.dsl import TOKEN_ALL, is_prefix
+from kingdom.access.interning import intern, intern_selectors
+from kingdom.access.scope import (
+    ALL_SCOPE,
+    EMPTY_SCOPE,
+    Scope,
+    selector_scope,
+)
+from kingdom.access.types import (
+    PermissionInt,
+    PolicyContext,
+    ResourceAlias,
+    Selector,
+    SelectorPermissionMap,
+)
+
+EMPTY_SELECTORS: Mapping[Selector, PermissionInt] = MappingProxyType({})
+EMPTY_GRANTS: Mapping[PermissionInt, FrozenSet[Selector]] = MappingProxyType(
+    {}
+)
+
+# Operation name to its integer mask, so we don't `getattr` on every call.
+OPERATIONS: Dict[str, PermissionInt] = {
+    name: permission.value
+    for name, permission in Permission.__members__.items()
+}
+WRITE_OPERATIONS = tuple(
+    permission.value
+    for permission in Permission
+    if permission is not Permission.READ
+)
+
+
+class FrozenContextErr(Exception):
+    def __init__(self):
+        super().__init__("CompiledPolicyContext is immutable.")
+
+
+def prefix_permissions(
+    owned: Mapping[Selector, PermissionInt], selector: Selector
+) -> Optional[PermissionInt]:
+    """
+    Permissions granted to `selector` by prefix wildcards of a plain
+    selector map, None if no prefix wildcard matches it.
+
+    Probes every prefix of `selector`, so its cost depends on the selector
+    length rather than on the number of owned selectors.
+
+    >>> prefix_permissions({"tenant:*": 2, "tenant:42:*": 4}, "tenant:42:7")
+    6
+    """
+    permissions = None
+    for idx in range(1, len(selector) + 1):
+        prefixed = owned.get(selector[:idx] + TOKEN_ALL)
+        if prefixed is not None:
+            permissions = (permissions or 0) | prefixed
+    return permissions
+
+
+def fingerprint(context: PolicyContext) -> str:
+    """
+    Stable digest of a PolicyContext: equal contexts have the same
+    fingerprint, whatever their key order, in any process.
+
+    >>> fingerprint({"coupon": {"*": 8}}) == fingerprint({"coupon": {"*": 8}})
+    True
+    """
+    canonical = json.dumps(context, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+class BlockedSelectors(Collection):
+    """
+    The selectors blocked by a deny policy, see `base.compile_decisions`,
+    as a view over a selector map: membership is a single lookup. Anything
+    else collects them into a set, once, so a view over a map blocking
+    nothing is empty and a Scope excluding it iterates the map as is.
+    """
+
+    __slots__ = ("_owned", "_blocked")
+
+    def __init__(self, owned: Mapping[Selector, PermissionInt]):
+        self._owned = owned
+        self._blocked: Optional[FrozenSet[Selector]] = None
+
+    def __contains__(self, selector: object) -> bool:
+        return self._owned.get(selector) == OVERRIDE  # type: ignore
+
+    def __iter__(self) -> Iterator[Selector]:
+        return iter(self.blocked)
+
+    def __len__(self) -> int:
+        return len(self.blocked)
+
+    @property
+    def blocked(self) -> FrozenSet[Selector]:
+        if self._blocked is None:
+            owned = self._owned
+            self._blocked = frozenset(
+                compress(owned, map(OVERRIDE.__eq__, owned.values()))
+            )
+        return self._blocked
+
+
+def all_scope(owned: Mapping[Selector, PermissionInt]) -> Scope:
+    "Read scope of a selector map holding \"*\", minus blocked selectors"
+    if not owned[TOKEN_ALL] & EXCLUSIONS:
+        return ALL_SCOPE
+    return Scope(
+        ALL_SCOPE,
+        excluded=frozenset(s for s, p in owned.items() if is_blocked(p)),
+    )
+
+
+class PrefixIndex:
+    """
+    A character trie of the prefix wildcards of a selector map. Each node
+    holding a wildcard stores its permissions under the `None` key.
+
+    >>> index = PrefixIndex({"tenant:*": 2, "tenant:42:*": 4, "5f34": 1})
+    >>> index.match("tenant:42:7")
+    6
+    >>> index.match("5f34")
+    None
+    """
+
+    __slots__ = ("_root",)
+
+    def __init__(self, selector_perm: Mapping[Selector, PermissionInt]):
+        self._root: Dict = {}
+        for selector, permissions in selector_perm.items():
+            if not is_prefix(selector):
+                continue
+            node = self._root
+            for char in selector[:-1]:
+                node = node.setdefault(char, {})
+            node[None] = node.get(None, 0) | permissions
+
+    def __bool__(self) -> bool:
+        return bool(self._root)
+
+    def match(self, selector: Selector) -> Optional[PermissionInt]:
+        "Unionized permissions of every wildcard `selector` starts with"
+        permissions = None
+        node = self._root
+        for char in selector:
+            child = node.get(char)
+            if child is None:
+                break
+            node = child
+            if None in node:
+                permissions = (permissions or 0) | node[None]
+        return permissions
+
+
+class CompiledPolicyContext:
+    """
+    An immutable, lookup-optimized view of a PolicyContext.
+
+    >>> ctx = CompiledPolicyContext({"coupon": {"*": 2, "ab4c": 4}})
+    >>> ctx.read_scope("coupon", "*")
+    ["*"]
+    >>> ctx.is_write_allowed("coupon", Permission.DELETE.value, "ab4c")
+    True
+
+    Scopes handed back are shared between calls and must not be mutated.
+    """
+
+    __slots__ = (
+        "_selectors",
+        "_all_masks",
+        "_bulk_masks",
+        "_read_all",
+        "_singletons",
+        "_grants",
+        "_prefixes",
+        "_fingerprint",
+    )
+
+    _selectors: Dict[ResourceAlias, Mapping[Selector, PermissionInt]]
+    _all_masks: Dict[ResourceAlias, PermissionInt]
+    _bulk_masks: Dict[ResourceAlias, PermissionInt]
+    _read_all: Dict[ResourceAlias, Scope]
+    _singletons: Dict[ResourceAlias, Dict[Selector, Scope]]
+    _grants: Dict[ResourceAlias, Dict[PermissionInt, FrozenSet[Selector]]]
+    _prefixes: Dict[ResourceAlias, PrefixIndex]
+    _fingerprint: Optional[str]
+
+    def __init__(
+        self, context: Mapping[ResourceAlias, Mapping[Selector, PermissionInt]]
+    ):
+        selectors: Dict[ResourceAlias, Mapping[Selector, PermissionInt]] = {}
+        all_masks: Dict[ResourceAlias, PermissionInt] = {}
+        bulk_masks: Dict[ResourceAlias, PermissionInt] = {}
+        read_all: Dict[ResourceAlias, Scope] = {}
+        singletons: Dict[ResourceAlias, Dict[Selector, Scope]] = {}
+        grants: Dict[ResourceAlias, Dict[PermissionInt, FrozenSet]] = {}
+        prefixes: Dict[ResourceAlias, PrefixIndex] = {}
+
+        for resource, selector_perm in context.items():
+            resource = intern(resource)
+            owned = intern_selectors(selector_perm)
+            index = PrefixIndex(owned)
+            if index:
+                prefixes[resource] = index
+            selectors[resource] = MappingProxyType(owned)
+            all_masks[resource] = owned.get(TOKEN_ALL, 0)
+            # Writes on "*" itself, minus what blocked selectors withhold.
+            bulk_masks[resource] = all_masks[resource] & ~withheld_operations(
+                owned
+            )
+            blocked = frozenset(s for s, p in owned.items() if is_blocked(p))
+            read_all[resource] = (
+                all_scope(owned)
+                if TOKEN_ALL in owned
+                else Scope(
+                    owned.keys(),
+                    index.match if index else None,
+                    blocked or None,
+                )
+            )
+            singletons[resource] = {
+                selector: EMPTY_SCOPE
+                if selector in blocked
+                else Scope((selector,))
+                for selector in owned
+            }
+            grants[resource] = {
+                operation: frozenset(
+                    selector
+                    for selector, permissions in owned.items()
+                    if permissions & operation
+                )
+                for operation in WRITE_OPERATIONS
+            }
+
+        object.__setattr__(self, "_selectors", selectors)
+        object.__setattr__(self, "_all_masks", all_masks)
+        object.__setattr__(self, "_bulk_masks", bulk_masks)
+        object.__setattr__(self, "_read_all", read_all)
+        object.__setattr__(self, "_singletons", singletons)
+        object.__setattr__(self, "_grants", grants)
+        object.__setattr__(self, "_prefixes", prefixes)
+        object.__setattr__(self, "_fingerprint", None)
+
+    @classmethod
+    def from_claim(cls, claim: str) -> "CompiledPolicyContext":
+        "Compiles a compact policy claim, see `claims.encode_claim`"
+        return cls(claims.decode_claim(claim))
+
+    def __setattr__(self, name, value):
+        raise FrozenContextErr()
+
+    def __delattr__(self, name):
+        raise FrozenContextErr()
+
+    def __contains__(self, resource: object) -> bool:
+        return resource in self._selectors
+
+    def __getitem__(self, resource: ResourceAlias) -> SelectorPermissionMap:
+        return self._selectors[resource]  # type: ignore
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, CompiledPolicyContext):
+            return self._selectors == other._selectors
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"<CompiledPolicyContext {self.to_dict()}>"
+
+    @property
+    def fingerprint(self) -> str:
+        "`fingerprint` of the compiled context, computed once"
+        if self._fingerprint is None:
+            digest = fingerprint(self.to_dict())
+            object.__setattr__(self, "_fingerprint", digest)
+        return self._fingerprint  # type: ignore
+
+    def to_dict(self) -> PolicyContext:
+        "Plain PolicyContext equivalent, e.g. for JWT claims"
+        return {
+            resource: dict(owned)
+            for resource, owned in self._selectors.items()
+        }
+
+    def read_scope(self, resource: str, selector: str = TOKEN_ALL) -> Scope:
+        """
+        Same semantics as `flow.get_read_scope`: which selectors of
+        `resource` the subject is allowed to read from.
+        """
+        if selector == TOKEN_ALL:
+            return self._read_all.get(resource, EMPTY_SCOPE)
+        singletons = self._singletons.get(resource)
+        if singletons is None:
+            return EMPTY_SCOPE
+        scope = singletons.get(selector)
+        if scope is not None:
+            return scope
+        if TOKEN_ALL in singletons:
+            return selector_scope(selector)
+        if self.prefix_permissions(resource, selector) is not None:
+            return selector_scope(selector)
+        return EMPTY_SCOPE
+
+    def prefix_permissions(
+        self, resource: str, selector: str
+    ) -> Optional[PermissionInt]:
+        "Permissions granted to `selector` by prefix wildcards, if any"
+        index = self._prefixes.get(resource)
+        return index.match(selector) if index is not None else None
+
+    def has_prefixes(self, resource: str) -> bool:
+        return resource in self._prefixes
+
+    def owned_selectors(self, resource: str) -> Mapping[Selector, int]:
+        "Read-only selector map of `resource`, empty if it's unknown"
+        return self._selectors.get(resource, EMPTY_SELECTORS)
+
+    def granted_selectors(
+        self, resource: str, operation: PermissionInt
+    ) -> FrozenSet[Selector]:
+        "Selectors of `resource` whose permissions contemplate `operation`"
+        return self._grants.get(resource, EMPTY_GRANTS).get(
+            operation, frozenset()
+        )
+
+    def is_write_allowed(
+        self, resource: str, operation: PermissionInt, selector: str
+    ) -> bool:
+        """
+        Same semantics as `flow.is_write_allowed`, without building an
+        AccessRequest.
+        """
+        owned: Optional[Mapping[Selector, PermissionInt]] = (
+            self._selectors.get(resource)
+        )
+        if owned is None:
+            return False
+        selector = selector or TOKEN_ALL
+        permissions = owned.get(selector, 0)
+        if permissions & OVERRIDE:
+            return bool(permissions & operation)
+        if selector == TOKEN_ALL:
+            return bool(self._bulk_masks[resource] & operation)
+        if self._all_masks[resource] & operation:
+            return True
+        if permissions & operation:
+            return True
+        prefixed = self.prefix_permissions(resource, selector)
+        return bool(prefixed and prefixed & operation)
@@ -8,193 +8,186 @@ dsl.py
  simplifications:
    primary     ::= "resource"
    identifier  ::= "id"
-   selector    ::= "*" | string
+   selector    ::= "*" | string | string "*"
    attrref     ::= primary "." identifier
    or_expr     ::= "||"
    compr_op    ::= "=="
    cond        ::= attrref compr_op selector
    conds       ::= (cond or_expr)*
 
- There are two available selectors:
+ There are three available selectors:
    1. All instances:        "*"
    2. Individual instances: "<uuid>"
+   3. Prefixed instances:   "tenant:42:*", i.e. every id starting with
+                            "tenant:42:"
 
  There are some conditions to selectors:
    1. All selector must **always** be alone.
+   2. A prefix selector has a single "*", as its last character.
 
 OBS.: This is in WIP and should be thoroughly simplified & documented.
 """
 
-import string
-from typing import List
+import re
+from functools import lru_cache
+from typing import Iterator, List, NamedTuple, Optional, Tuple, cast
+
+from kingdom.access import config
 
 TOKEN_ALL = "*"
+TOKEN_SEPARATOR = ":"
 VALID_OPS = {"==", ">", "<", ">=", "<=", "!="}
-VALID_OPS_TOKEN = {token for operator in VALID_OPS for token in operator}
-
-
-def conditionals_split(sequence: str):
-    expressions = sequence.split("||")
-    if "" in expressions or " " in expressions:
-        # meaning that we had a loose OR
-        return False
-
-    parsed_expr = [expression.strip() for expression in expressions]
-    for expr in parsed_expr:
-        for char in expr:
-            if char.isspace():
-                # illegal whitespaces
-                return False
-
-            if char in set(string.punctuation):
-                # illegal characteres
-                return False
-
-    return tuple(parsed_expr)
-
-
-def parse_identifier(expression):
-    # since it's the beginning, we can strip this, to avoid overly
-    # complicated iterations :-)
-    expression = expression.strip()
-    identifier = ""
-    for idx, token in enumerate(expression):
-        if token.isidentifier():
-            identifier += token
-        else:
-            if token == "." and len(identifier) > 0:
-                return identifier, expression[idx:]
-            return (False,)
-
-
-def parse_reference(reference_expr):
-    reference = ""
-    parsing_idx = -1
-
-    # first we try to read all valid tokens after "." and before a valid
-    # operator
-    for idx, token in enumerate(reference_expr):
-        if idx == 0:
-            # first token **must** be a ".", no other one allowed
-            if token != ".":
-                return (False,)
-            parsing_idx = idx
-            continue
-
-        if token.isspace() or token in VALID_OPS_TOKEN:
-            # we have found our potential reference
-            parsing_idx = idx
-            break
-
-        if token.isidentifier():
-            reference += token
-        else:
-            return (False,)
-
-    # check for illegality on the rest of the expression
-    # meaning we must only accept white spaces between end of ref and operator
-    rest = reference_expr[parsing_idx:]
-    for idx, token in enumerate(rest):
-        if token in VALID_OPS_TOKEN:
-            return (reference, rest[idx:])
-
-        if token.isspace():
-            # the only acceptable token between a ref and operator
-            continue
-        else:
-            return (False,)
-
-
-def parse_identifier_reference(expression):
-    identifier, *reference_expr = parse_identifier(expression)
-    if identifier is False:
-        return False
-    reference, *operator_expr = parse_reference(*reference_expr)
-    if reference is False:
-        return False
-
-    return (identifier.upper(), reference.upper())
-
-
-def parse_operator(operator_expr):
-    operator_expr = operator_expr.strip()  # just to make sure
-
-    operator = ""
-    parsing_idx = -1
-    # First we parse a known operator.
-    for idx, token in enumerate(operator_expr):
-        if token in VALID_OPS_TOKEN:
-            # the only valid thing that is being parsed
-            operator += token
-        else:
-            parsing_idx = idx
-            break
-
-    # Then we check if the rest is OK.
-    rest = operator_expr[parsing_idx:]
-    for idx, token in enumerate(rest):
-        if token == "'":
-            # valid stopping point
-            if operator in VALID_OPS:
-                return (operator, rest[idx:])
-            # invalid operator
-            return (False,)
-
-        if token.isspace():
-            continue
-        else:
-            # illegal characteres
-            return (False,)
-
 
-def parse_selector(selector_expr):
-    selector_expr = selector_expr.strip()
-    selector = ""
-    parsing_idx = -1
 
-    def isselector(token):
-        return token.isnumeric() or token.isidentifier() or token == TOKEN_ALL
-
-    # First we try to find a selector.
-    for idx, token in enumerate(selector_expr):
-        if idx == 0:
-            # first token
-            if token != "'":
-                return (False,)
+def is_prefix(selector: str) -> bool:
+    "Whether selector is a prefix wildcard, e.g. tenant:42:*"
+    return len(selector) > 1 and selector[-1] == TOKEN_ALL
+
+
+# `parse_conditionals` consumes a whole `||` chain in one left-to-right
+# scan, one compiled regex match per conditional, into an immutable tuple of
+# Condition. Only invalid sequences go through the (slower) tokenizer, to
+# report where they went wrong.
+
+CONDITION_RE = re.compile(
+    r"\s*([^\W\d]+)\.([^\W\d]+)"  # attrref
+    r"\s*(==|!=|>=|<=|>|<)"  # compr_op
+    r"\s*'(\*|[\w:]+\*?)'"  # selector
+    r"\s*(\|\||\Z)"  # or_expr or end of sequence
+)
+
+TOKEN_SPEC = (
+    ("WS", r"\s+"),
+    ("OR", r"\|\|"),
+    ("NAME", r"[^\W\d]+"),
+    ("DOT", r"\."),
+    ("OP", r"==|!=|>=|<=|>|<"),
+    ("SELECTOR", r"'[^']*'"),
+    ("MISMATCH", r"."),
+)
+TOKEN_RE = re.compile(
+    "|".join(f"(?P<{kind}>{spec})" for kind, spec in TOKEN_SPEC)
+)
+SELECTOR_RE = re.compile(r"\*|[\w:]+\*?")
+
+# Expected tokens of a single conditional, and whether whitespace may
+# precede each one of them.
+CONDITION_GRAMMAR = (
+    ("NAME", True),
+    ("DOT", False),
+    ("NAME", False),
+    ("OP", True),
+    ("SELECTOR", True),
+)
+
+
+class Token(NamedTuple):
+    kind: str
+    value: str
+    position: int
+
+
+class Condition(NamedTuple):
+    """cond ::= attrref compr_op selector, e.g. resource.id == '5f34'"""
+
+    identifier: str
+    reference: str
+    operator: str
+    selector: str
+
+
+Conditionals = Tuple[Condition, ...]
+
+
+class InvalidConditional(Exception):
+    def __init__(self, sequence: str, position: int, reason: str):
+        super().__init__(
+            f"Invalid conditional {sequence!r} at position {position}: "
+            f"{reason}."
+        )
+
+
+@lru_cache(maxsize=config.DSL_CACHE_SIZE)
+def parse_conditionals(sequence: str) -> Conditionals:
+    """
+    Parses a whole conditional sequence in a single pass. Results are
+    memoized, as the same handful of conditionals are parsed over and over.
+
+    >>> parse_conditionals("resource.id == '5f34' || resource.id == '*'")
+    (
+        Condition("resource", "id", "==", "5f34"),
+        Condition("resource", "id", "==", "*"),
+    )
+    >>> parse_conditionals("resource.id == '5f34' ||")
+    InvalidConditional: ...
+    """
+    conditions: List[Condition] = []
+    match_condition = CONDITION_RE.match
+    position = 0
+    while True:
+        match = match_condition(sequence, position)
+        if match is None:
+            raise explain(sequence)
+        conditions.append(Condition(*match.group(1, 2, 3, 4)))
+        if not match.group(5):
+            return tuple(conditions)
+        position = match.end()
+
+
+def tokenize(sequence: str) -> Iterator[Token]:
+    for match in TOKEN_RE.finditer(sequence):
+        # Every alternative of TOKEN_RE is a named group.
+        kind = cast(str, match.lastgroup)
+        yield Token(kind, match.group(), match.start())
+
+
+def explain(sequence: str) -> InvalidConditional:
+    "Walks an invalid sequence token by token to tell what is wrong with it"
+    current: List[Token] = []
+    for token in tokenize(sequence):
+        if token.kind == "MISMATCH":
+            return InvalidConditional(
+                sequence, token.position, f"illegal {token.value!r}"
+            )
+        if token.kind == "OR":
+            error = explain_condition(sequence, current, token.position)
+            if error:
+                return error
+            current = []
             continue
-
-        if token == "'":
-            parsing_idx = idx + 1
-            break
-
-        if isselector(token):
-            selector += token
-        else:
-            return (False,)
-
-    # Edge case: are we dealig with an *?
-    if TOKEN_ALL in selector and selector != TOKEN_ALL:
-        # plain comparison
-        return (False,)
-
-    rest = selector_expr[parsing_idx + 1:]
-    if len(rest) > 0 or len(selector) == 0:
-        # we shouldn't have anything left
-        return (False,)
-    return (selector,)
-
-
-def parse_expression(expr):
-    identifier, *reference_expr = parse_identifier(expr)
-    if identifier is False:
-        return False
-    reference, *operator_expr = parse_reference(*reference_expr)
-    if reference is False:
-        return False
-    operator, *selector_expr = parse_operator(*operator_expr)
-    if operator is False:
-        return False
-    selector, *end = parse_selector(*selector_expr)
-    if selector is False:
-        return False
-    return (identifier, reference, operator, selector)
+        current.append(token)
+    error = explain_condition(sequence, current, len(sequence))
+    return error or InvalidConditional(sequence, 0, "unknown error")
+
+
+def explain_condition(
+    sequence: str, tokens: List[Token], end: int
+) -> Optional[InvalidConditional]:
+    tokens_iter = iter(tokens)
+    for kind, spaced in CONDITION_GRAMMAR:
+        token = next(tokens_iter, None)
+        if token is not None and token.kind == "WS":
+            if not spaced:
+                return InvalidConditional(
+                    sequence, token.position, "unexpected whitespace"
+                )
+            token = next(tokens_iter, None)
+        if token is None:
+            return InvalidConditional(sequence, end, f"expected {kind}")
+        if token.kind != kind:
+            return InvalidConditional(
+                sequence,
+                token.position,
+                f"expected {kind}, got {token.value!r}",
+            )
+        if kind == "SELECTOR" and not SELECTOR_RE.fullmatch(token.value[1:-1]):
+            return InvalidConditional(
+                sequence, token.position, f"invalid selector {token.value}"
+            )
+
+    for token in tokens_iter:
+        if token.kind != "WS":
+            return InvalidConditional(
+                sequence, token.position, f"unexpected {token.value!r}"
+            )
+    return None
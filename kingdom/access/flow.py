@@ -1,15 +1,50 @@
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, List, Tuple, TypeVar
+from functools import partial
+from itertools import compress
+from operator import itemgetter, not_
+from typing import (
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    KeysView,
+    List,
+    Mapping,
+    Tuple,
+    TypeVar,
+    Union,
+)
 
-from kingdom.access import jwt
-from kingdom.access.base import Optional, Permission, Resource
-from kingdom.access.dsl import TOKEN_ALL
+from kingdom.access import claims, config, jwt, observers
+from kingdom.access.base import (
+    EXCLUSIONS,
+    OVERRIDE,
+    WRITE_MASK,
+    Optional,
+    Permission,
+    Resource,
+    is_blocked,
+    is_excepted,
+    withheld_operations,
+)
+from kingdom.access.context import (
+    OPERATIONS,
+    BlockedSelectors,
+    CompiledPolicyContext,
+    all_scope,
+    fingerprint,
+    prefix_permissions,
+)
+from kingdom.access.dsl import TOKEN_ALL, is_prefix
+from kingdom.access.scope import EMPTY_SCOPE, Scope, selector_scope
 from kingdom.access.types import (
     JWT,
     AuthResponse,
+    Partition,
     Payload,
     PolicyContext,
-    Scope,
     SelectorPermissionMap,
     UserKey,
 )
@@ -51,21 +86,59 @@ def authenticate(token: JWT) -> AuthResponse:
         Exception, if credentials (JWT) are not accepted.
     """
     payload = jwt.decode(token)
-    return payload["policies"], payload["access_key"]
+    return policies_from_payload(payload), payload["access_key"]
+
+
+def policies_from_payload(payload: Payload) -> PolicyContext:
+    "Reads the policy claim from a JWT payload, whether compact or not"
+    if config.COMPACT_POLICY_CLAIM_NAME in payload:
+        return claims.decode_claim(payload[config.COMPACT_POLICY_CLAIM_NAME])
+    context: PolicyContext = payload[config.POLICY_CLAIM]
+    return context
 
 
 def authorize(
-    context: PolicyContext, resource: str, operation: str, selector: str = "",
+    context: Union[PolicyContext, CompiledPolicyContext],
+    resource: str,
+    operation: str,
+    selector: str = "",
 ) -> Scope:
     """
     Checks if, given a subject `context`, if system allows it to `operate` on
     instance `selector` of `resource`.
 
+    A CompiledPolicyContext is answered by direct lookups, a plain
+    PolicyContext goes through `check_permission`.
+
     Outputs:
-        Scope, list of resource identifiers that subject is allowed to
+        Scope, resource identifiers that subject is allowed to
                 perform asked operation.
         Exception, if subject is not authorized to perform asked operation.
+
+    Decisions are reported to attached observers, see `observers.attach`.
     """
+    if observers.active:
+        return observers.observe(
+            "authorize",
+            resource,
+            operation,
+            decide,
+            (context, resource, operation, selector),
+            denials=(NotEnoughPrivilegesErr,),
+        )
+    return decide(context, resource, operation, selector)
+
+
+def decide(
+    context: Union[PolicyContext, CompiledPolicyContext],
+    resource: str,
+    operation: str,
+    selector: str = "",
+) -> Scope:
+    "`authorize`, without instrumentation"
+    if isinstance(context, CompiledPolicyContext):
+        return authorize_compiled(context, resource, operation, selector)
+
     request = AccessRequest(
         resource=resource, operation=operation, selector=selector
     )
@@ -75,6 +148,241 @@ def authorize(
     return scope
 
 
+def authorize_compiled(
+    context: CompiledPolicyContext,
+    resource: str,
+    operation: str,
+    selector: str = "",
+) -> Scope:
+    """
+    `authorize` counterpart for a CompiledPolicyContext. An AccessRequest is
+    only built when the subject is denied, to report it.
+    """
+    op = OPERATIONS[operation]
+    selector = selector or TOKEN_ALL
+    if op == Permission.READ.value:
+        scope = context.read_scope(resource, selector)
+        if scope:
+            return scope
+    elif context.is_write_allowed(resource, op, selector):
+        return selector_scope(selector)
+
+    request = AccessRequest(
+        resource=resource, operation=operation, selector=selector
+    )
+    raise NotEnoughPrivilegesErr(request)
+
+
+# Fingerprint, resource, operation and selector of a decision.
+DecisionKey = Tuple[str, str, str, str]
+
+
+class DecisionCache:
+    """
+    Within a GraphQL request, and across requests bearing the same token,
+    the same subject asks for the same (resource, operation, selector) over
+    and over. Decisions are kept in a bounded LRU cache keyed by the
+    `fingerprint` of the subject's context plus the request triple, so a
+    repeated check is a dictionary hit.
+
+    >>> cache = DecisionCache(maxsize=2)
+    >>> cache.authorize(context, "coupon", "READ")  # authorizes
+    >>> cache.authorize(context, "coupon", "READ")  # cache hit
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    A CompiledPolicyContext computes its fingerprint once. For a plain
+    PolicyContext, compute `fingerprint(context)` once per request and pass
+    it along, or it's computed on every call. Only misses are reported to
+    observers, and contexts must not be mutated once fingerprinted.
+    Cached scopes are shared and must not be mutated either.
+    """
+
+    def __init__(self, maxsize: int = config.DECISION_CACHE_SIZE):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        # Denied decisions are cached as None.
+        self._entries: "OrderedDict[DecisionKey, Optional[Scope]]" = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def authorize(
+        self,
+        context: Union[PolicyContext, CompiledPolicyContext],
+        resource: str,
+        operation: str,
+        selector: str = "",
+        digest: Optional[str] = None,
+    ) -> Scope:
+        "Cached `authorize`, `digest` being the context's fingerprint"
+        if digest is None:
+            digest = (
+                context.fingerprint
+                if isinstance(context, CompiledPolicyContext)
+                else fingerprint(context)
+            )
+        key = (digest, resource, operation, selector or TOKEN_ALL)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                scope = self._entries[key]
+                cached = True
+            else:
+                self.misses += 1
+                cached = False
+
+        if not cached:
+            try:
+                scope = authorize(context, resource, operation, selector)
+            except NotEnoughPrivilegesErr:
+                scope = None
+            self._put(key, scope)
+
+        if scope is None:
+            raise NotEnoughPrivilegesErr(
+                AccessRequest(
+                    resource=resource, operation=operation, selector=selector
+                )
+            )
+        return scope
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def _put(self, key: DecisionKey, scope: Optional[Scope]) -> None:
+        with self._lock:
+            self._entries[key] = scope
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+decision_cache = DecisionCache()
+
+
+def authorize_many(
+    context: Union[PolicyContext, CompiledPolicyContext],
+    resource: str,
+    operation: str,
+    selectors: Iterable[str],
+) -> Partition:
+    """
+    Batch counterpart of `authorize` for list-shaped requests, e.g. the
+    elements of a GraphQL connection. Partitions `selectors` into the ones
+    subject is allowed to `operate` on and the ones it is not, keeping
+    their order.
+
+    Instead of one AccessRequest per element, the set of granted selectors
+    is resolved once and the partition is a single membership mask, built
+    and applied at C level with `map` and `itertools.compress`.
+
+    >>> authorize_many(
+        {"coupon": {"ab4c": READ, "bc3f": READ | UPDATE}},
+        resource="coupon",
+        operation="UPDATE",
+        selectors=["ab4c", "bc3f", "cc4a"],
+    )
+    (["bc3f"], ["ab4c", "cc4a"])
+    """
+    selectors = list(selectors)
+    op = OPERATIONS[operation]
+    owned: Mapping[str, int]
+    if isinstance(context, CompiledPolicyContext):
+        owned = context.owned_selectors(resource)
+    else:
+        owned = context.get(resource, {})
+    allowed_set: Union[FrozenSet, KeysView]
+    all_perms = owned.get(TOKEN_ALL)
+    if all_perms is not None and (
+        op == Permission.READ.value or all_perms & op
+    ):
+        if not all_perms & EXCLUSIONS:
+            return selectors, []
+        # Allowed by "*", unless a deny policy says otherwise.
+        mask = [not is_excepted(owned.get(s), op) for s in selectors]
+        if op != Permission.READ.value and TOKEN_ALL in selectors:
+            # A write on "*" itself would reach the selectors denied it.
+            if withheld_operations(owned) & op:
+                mask = [m and s != TOKEN_ALL for s, m in zip(selectors, mask)]
+        return (
+            list(compress(selectors, mask)),
+            list(compress(selectors, map(not_, mask))),
+        )
+
+    if op == Permission.READ.value:
+        # If it has an entry, it is allowed to read it.
+        allowed_set = owned.keys()
+    elif isinstance(context, CompiledPolicyContext):
+        allowed_set = context.granted_selectors(resource, op)
+    else:
+        allowed_set = frozenset(
+            selector
+            for selector, permissions in owned.items()
+            if permissions & op
+        )
+
+    if not allowed_set:
+        return [], selectors
+
+    mask = list(map(membership(context, resource, op, allowed_set), selectors))
+    return (
+        list(compress(selectors, mask)),
+        list(compress(selectors, map(not_, mask))),
+    )
+
+
+def membership(
+    context: Union[PolicyContext, CompiledPolicyContext],
+    resource: str,
+    op: int,
+    allowed_set: Union[FrozenSet, KeysView],
+) -> Callable[[str], bool]:
+    """
+    Tells whether a selector is allowed, given the set of owned selectors
+    allowed to `op`. Prefix wildcards are only looked up if the subject
+    owns any of them on `resource`.
+    """
+    if isinstance(context, CompiledPolicyContext):
+        if not context.has_prefixes(resource):
+            return allowed_set.__contains__
+        owned = context.owned_selectors(resource)
+        match = partial(context.prefix_permissions, resource)
+    else:
+        owned = context[resource]
+        if not any(map(is_prefix, owned)):
+            return allowed_set.__contains__
+        match = partial(prefix_permissions, owned)
+
+    def is_allowed(selector: str) -> bool:
+        permissions = owned.get(selector)
+        if permissions is not None and permissions & OVERRIDE:
+            # Prefix wildcards don't apply to an entry a deny policy made
+            # final, see `compile_decisions`.
+            return not is_excepted(permissions, op)
+        if selector in allowed_set:
+            return True
+        permissions = match(selector)
+        return permissions is not None and (
+            op == Permission.READ.value or bool(permissions & op)
+        )
+
+    return is_allowed
+
+
 def check_permission(
     owned_policies: PolicyContext, access_request: AccessRequest
 ) -> Tuple[Scope, bool]:
@@ -91,11 +399,27 @@ def check_permission(
     as a circuit breaker, as it is a all-or-nothing operation.
     Obs.: In this case, scope is always [access_request.selector]
     """
+    if observers.active:
+        return observers.observe(
+            "check_permission",
+            access_request.resource,
+            Permission(access_request.operation).name,
+            resolve_permission,
+            (owned_policies, access_request),
+            verdict=itemgetter(1),
+        )
+    return resolve_permission(owned_policies, access_request)
+
+
+def resolve_permission(
+    owned_policies: PolicyContext, access_request: AccessRequest
+) -> Tuple[Scope, bool]:
+    "`check_permission`, without instrumentation"
     if access_request.operation == Permission.READ.value:
         scope = get_read_scope(owned_policies, access_request)
-        return scope, len(scope) > 0
+        return scope, bool(scope)
     return (
-        [access_request.selector],
+        selector_scope(access_request.selector),
         is_write_allowed(owned_policies, access_request),
     )
 
@@ -136,18 +460,33 @@ def get_read_scope(
     resource = access_request.resource
     if resource not in owned_policies:
         # Subject has no permission related to requested resource.
-        return []
+        return EMPTY_SCOPE
 
     owned_selectors: SelectorPermissionMap = owned_policies[resource]
     if selector == TOKEN_ALL:
         # If it has an entry, it is allowed to read it.
         return (
-            [TOKEN_ALL]
+            all_scope(owned_selectors)
             if TOKEN_ALL in owned_selectors
-            else list(owned_selectors.keys())
+            else Scope(
+                owned_selectors.keys(),
+                partial(prefix_permissions, owned_selectors),
+                BlockedSelectors(owned_selectors),
+            )
         )
 
-    return list(filter(lambda s: s == selector, owned_selectors))
+    permissions = owned_selectors.get(selector)
+    if permissions is not None:
+        if is_blocked(permissions):
+            return EMPTY_SCOPE
+        return selector_scope(selector)
+    if TOKEN_ALL in owned_selectors:
+        # Contemplated by "*", whose read scope holds every selector.
+        return selector_scope(selector)
+    if prefix_permissions(owned_selectors, selector) is not None:
+        # Contemplated by a prefix wildcard, e.g. "tenant:42:*"
+        return selector_scope(selector)
+    return EMPTY_SCOPE
 
 
 def is_write_allowed(
@@ -192,9 +531,7 @@ def is_write_allowed(
         """
         return bool(owned_permissions & requested_operation)
 
-    assert access_request.operation & (
-        Permission.CREATE | Permission.UPDATE | Permission.DELETE
-    )
+    assert access_request.operation & WRITE_MASK
 
     resource = access_request.resource
     operation = access_request.operation
@@ -203,6 +540,15 @@ def is_write_allowed(
         return False
 
     permissions = owned_policies[resource].get(access_request.selector, 0)
+    if permissions & OVERRIDE:
+        # A deny policy made this entry final, see `compile_decisions`.
+        return mask_pass(permissions, operation)
+
+    if access_request.selector == TOKEN_ALL and mask_pass(
+        withheld_operations(owned_policies[resource]), operation
+    ):
+        # Writing on "*" would reach selectors a deny policy holds back.
+        return False
 
     if TOKEN_ALL in owned_policies[resource]:
         # We might be asking for a specific instance but we have a "*" policy
@@ -210,4 +556,11 @@ def is_write_allowed(
         if mask_pass(owned_policies[resource][TOKEN_ALL], operation):
             return True
 
+    if not mask_pass(permissions, operation):
+        # Or a prefix wildcard, e.g. "tenant:42:*", might contemplate it.
+        prefixed = prefix_permissions(
+            owned_policies[resource], access_request.selector
+        )
+        permissions |= prefixed or 0
+
     return mask_pass(permissions, operation)
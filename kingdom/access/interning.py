@@ -0,0 +1,57 @@
+"""
+interning.py
+
+Every decoded token brings its own copies of the same resource aliases and
+selector uuids, while thousands of users hold contexts built out of the
+same few thousand strings.
+
+Resource aliases and selectors are interned in the interpreter-wide table
+(`sys.intern`) wherever a context is built: by `encode_policies`, when a
+token is verified and when a compact claim is unpacked. Contexts then share
+one copy of each string, and dict lookups with an interned key succeed on
+the identity check without comparing characters. Interned strings are
+released once no context refers to them anymore.
+
+>>> a = intern_context(json.loads('{"user": {"5f34": 8}}'))
+>>> b = intern_context(json.loads('{"user": {"5f34": 2}}'))
+>>> next(iter(a["user"])) is next(iter(b["user"]))
+True
+"""
+import sys
+from typing import Mapping
+
+from kingdom.access import config
+from kingdom.access.types import (
+    Payload,
+    PermissionInt,
+    PolicyContext,
+    Selector,
+    SelectorPermissionMap,
+)
+
+intern = sys.intern
+
+
+def intern_selectors(
+    selector_perm: Mapping[Selector, PermissionInt]
+) -> SelectorPermissionMap:
+    return {
+        intern(selector): permissions
+        for selector, permissions in selector_perm.items()
+    }
+
+
+def intern_context(context: PolicyContext) -> PolicyContext:
+    "A copy of `context` whose resources and selectors are interned"
+    return {
+        intern(resource): intern_selectors(selector_perm)
+        for resource, selector_perm in context.items()
+    }
+
+
+def intern_payload(payload: Payload) -> Payload:
+    "Interns the JSON policy claim of a freshly decoded JWT payload, if any"
+    policies = payload.get(config.POLICY_CLAIM)
+    if isinstance(policies, dict):
+        payload[config.POLICY_CLAIM] = intern_context(policies)
+    return payload
@@ -1,8 +1,12 @@
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Dict, Optional, Tuple
+from typing import Callable, Dict, Optional, Tuple, Union
 
 import jwt
-from kingdom.access import config
+from kingdom.access import config, observers
+from kingdom.access.interning import intern_payload
 from kingdom.access.types import JWT, Payload
 
 MaybeJWT = Tuple[Optional[JWT], Optional[Exception]]
@@ -14,6 +18,91 @@ class InvalidToken(Exception):
         super().__init__("Unauthorized: Invalid token.")
 
 
+class TokenCache:
+    """
+    A client sends the same bearer token for its whole lifetime, so verified
+    payloads are kept in a bounded LRU cache keyed by the token itself and
+    dropped once the token's `exp` claim is reached. Tokens without `exp`
+    are never cached.
+
+    Lookups never await, and a lock guards them against handlers offloaded
+    to threads, so one cache can be shared by every asyncio task.
+
+    >>> cache = TokenCache(maxsize=2)
+    >>> cache.decode(token, verify)  # runs verify
+    >>> cache.decode(token, verify)  # cache hit
+    >>> cache.hits, cache.misses
+    (1, 1)
+
+    Cached payloads are shared and must not be mutated.
+    """
+
+    def __init__(
+        self,
+        maxsize: int = config.TOKEN_CACHE_SIZE,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.maxsize = maxsize
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, Tuple[float, Payload]]" = (
+            OrderedDict()
+        )
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(token: Union[str, bytes]) -> bytes:
+        return token if isinstance(token, bytes) else token.encode("utf-8")
+
+    def get(self, token: Union[str, bytes]) -> Optional[Payload]:
+        key = self.key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                # Expired, it'll have to be verified (and refused) again.
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, token: Union[str, bytes], payload: Payload) -> None:
+        expiration = payload.get("exp")
+        if not isinstance(expiration, (int, float)):
+            return
+        key = self.key(token)
+        with self._lock:
+            self._entries[key] = (expiration, payload)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def decode(
+        self, token: Union[str, bytes], verify: Callable[..., Payload]
+    ) -> Payload:
+        "Cached `verify(token)`, failed verifications are not cached"
+        payload = self.get(token)
+        if payload is None:
+            payload = verify(token)
+            self.put(token, payload)
+        return payload
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+token_cache = TokenCache()
+
+
 def encode(payload: Payload) -> JWT:
     try:
         return jwt.encode(
@@ -27,11 +116,25 @@ def encode(payload: Payload) -> JWT:
 
 
 def decode(token: JWT) -> Payload:
+    if observers.active:
+        return observers.observe(
+            "jwt.decode",
+            None,
+            None,
+            token_cache.decode,
+            (token, verify),
+            denials=(InvalidToken,),
+        )
+    return token_cache.decode(token, verify)
+
+
+def verify(token: JWT) -> Payload:
     try:
-        return jwt.decode(
+        payload = jwt.decode(
             jwt=token,
             key=config.RANDOM_KEY,
             algorithms=[config.JWT_ALGORITHM],
         )
     except jwt.PyJWTError:
         raise InvalidToken()
+    return intern_payload(payload)
@@ -0,0 +1,215 @@
+"""
+matrix.py
+
+Bulk "who can do what" queries, e.g. which of these 5k users can UPDATE a
+given coupon, without calling `authorize` once per user.
+
+PermissionMatrix stacks many users' contexts into a users x
+(resource, selector) matrix of permission masks, stored column-wise: one
+`bytearray` per (resource, selector), holding one byte per user. A query
+only touches the columns that may grant it ("*", the selector itself and
+the prefix wildcards it matches), and each column is reduced at C level:
+`bytes.translate` maps every mask to 1 or 0 for the requested operation,
+and columns are OR'd as big integers.
+
+>>> matrix = PermissionMatrix({
+    "abbf": {"coupon": {"*": 8, "ab4c": 2}},
+    "0bf3": {"coupon": {"ab4c": 8}},
+})
+>>> matrix.who_can("coupon", "UPDATE", "ab4c")
+["abbf"]
+>>> matrix.who_can("coupon", "READ")
+["abbf", "0bf3"]
+"""
+from itertools import compress
+from typing import Dict, Iterable, List, Mapping, Optional
+
+from kingdom.access.base import OVERRIDE, Permission, User
+from kingdom.access.context import OPERATIONS
+from kingdom.access.dsl import TOKEN_ALL, is_prefix
+from kingdom.access.types import (
+    PolicyContext,
+    ResourceAlias,
+    Selector,
+    UserKey,
+)
+
+# Cells are `PRESENT | mask`, so an owned selector with an empty mask still
+# grants reading it, and empty cells are 0. Masks must fit in 7 bits.
+PRESENT = 0x80
+
+Column = bytearray
+
+
+def translation(operation: int) -> bytes:
+    "`bytes.translate` table mapping a cell to 1 if it grants `operation`"
+    if operation == Permission.READ.value:
+        # Any owned entry but a blocked one, see `base.compile_decisions`.
+        return bytes(
+            1 if cell & PRESENT and cell != PRESENT | OVERRIDE else 0
+            for cell in range(256)
+        )
+    return bytes(1 if cell & operation else 0 for cell in range(256))
+
+
+TRANSLATIONS: Dict[int, bytes] = {
+    operation: translation(operation) for operation in OPERATIONS.values()
+}
+# Cells whose mask is final: "*" and prefix wildcards don't apply to them.
+OVERRIDES = bytes(1 if cell & OVERRIDE else 0 for cell in range(256))
+# Final cells refused a write operation, which a write on "*" would reach.
+WITHHOLDINGS: Dict[int, bytes] = {
+    operation: bytes(
+        1 if cell & OVERRIDE and not cell & operation else 0
+        for cell in range(256)
+    )
+    for operation in OPERATIONS.values()
+    if operation != Permission.READ.value
+}
+
+
+class PermissionMatrix:
+    """
+    Rows are added, replaced and removed one user at a time, touching only
+    that user's cells. A removed row is reused by the next user added.
+
+    Decisions follow `flow.authorize`: READ on "*" is granted by any owned
+    selector of the resource, READ on a selector by owning "*", the
+    selector itself or a matching prefix wildcard, and writes by the masks
+    of "*", the selector and the prefix wildcards it matches. A selector
+    entry a deny policy made final overrides the other columns, and keeps
+    writes on "*" from being granted what it's refused.
+    """
+
+    def __init__(
+        self, contexts: Optional[Mapping[UserKey, PolicyContext]] = None
+    ):
+        self._users: List[Optional[UserKey]] = []
+        self._rows: Dict[UserKey, int] = {}
+        self._free: List[int] = []
+        # Columns set by each row, so it can be cleared without a scan.
+        self._cells: Dict[int, List[Column]] = {}
+        self._columns: Dict[ResourceAlias, Dict[Selector, Column]] = {}
+        self._prefixes: Dict[ResourceAlias, Dict[Selector, Column]] = {}
+        for user, context in (contexts or {}).items():
+            self.set_row(user, context)
+
+    @classmethod
+    def from_users(cls, users: Iterable[User]) -> "PermissionMatrix":
+        return cls({user.access_key: user.policy_context for user in users})
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, user: object) -> bool:
+        return user in self._rows
+
+    @property
+    def users(self) -> List[UserKey]:
+        "Users in row order"
+        return [user for user in self._users if user is not None]
+
+    def set_row(self, user: UserKey, context: PolicyContext) -> None:
+        "Adds `user`, or replaces its row if it's already in the matrix"
+        row = self._rows.get(user)
+        if row is None:
+            row = self._allocate(user)
+        else:
+            self._clear(row)
+
+        cells = []
+        for resource, selector_perm in context.items():
+            for selector, permissions in selector_perm.items():
+                if permissions >= PRESENT:
+                    raise ValueError(f"Mask {permissions} is too wide")
+                column = self._column(resource, selector)
+                column[row] = PRESENT | permissions
+                cells.append(column)
+        self._cells[row] = cells
+
+    def remove_row(self, user: UserKey) -> None:
+        row = self._rows.pop(user)
+        self._clear(row)
+        self._users[row] = None
+        self._free.append(row)
+
+    def allowed(
+        self, resource: str, operation: str, selector: str = TOKEN_ALL
+    ) -> bytes:
+        """
+        One byte per row, 1 if that row's user is allowed to `operation`
+        on `selector` of `resource`. Aligned with the matrix rows, whose
+        users are `PermissionMatrix.who_can`'s output order.
+        """
+        op = OPERATIONS[operation]
+        selector = selector or TOKEN_ALL
+        columns = self._columns.get(resource, {})
+        table = TRANSLATIONS[op]
+        if op == Permission.READ.value and selector == TOKEN_ALL:
+            return self._reduce(columns.values(), table)
+
+        granting = [
+            column
+            for prefix, column in self._prefixes.get(resource, {}).items()
+            if selector.startswith(prefix[:-1]) and prefix != selector
+        ]
+        if TOKEN_ALL in columns:
+            granting.append(columns[TOKEN_ALL])
+        result = self._reduce(granting, table)
+        own = columns.get(selector)
+        if selector == TOKEN_ALL:
+            withheld = self._reduce(columns.values(), WITHHOLDINGS[op])
+            granted = int.from_bytes(result, "little")
+            return self._bytes(granted & ~int.from_bytes(withheld, "little"))
+        if own is None:
+            return result
+        overrides = int.from_bytes(own.translate(OVERRIDES), "little")
+        allowed = int.from_bytes(own.translate(table), "little")
+        return self._bytes(
+            int.from_bytes(result, "little") & ~overrides | allowed
+        )
+
+    def _reduce(self, columns: Iterable[Column], table: bytes) -> bytes:
+        "Rows granted by any of `columns`"
+        result = 0
+        for column in columns:
+            result |= int.from_bytes(column.translate(table), "little")
+        return self._bytes(result)
+
+    def _bytes(self, rows: int) -> bytes:
+        return rows.to_bytes(len(self._users), "little")
+
+    def who_can(
+        self, resource: str, operation: str, selector: str = TOKEN_ALL
+    ) -> List[UserKey]:
+        "Users allowed to `operation` on `selector` of `resource`"
+        allowed = self.allowed(resource, operation, selector)
+        # Rows of removed users are cleared, so they're never allowed.
+        users = compress(self._users, allowed)
+        return [user for user in users if user is not None]
+
+    def _allocate(self, user: UserKey) -> int:
+        if self._free:
+            row = self._free.pop()
+        else:
+            row = len(self._users)
+            self._users.append(None)
+            for columns in self._columns.values():
+                for column in columns.values():
+                    column.append(0)
+        self._users[row] = user
+        self._rows[user] = row
+        return row
+
+    def _clear(self, row: int) -> None:
+        for column in self._cells.pop(row, ()):
+            column[row] = 0
+
+    def _column(self, resource: str, selector: str) -> Column:
+        columns = self._columns.setdefault(resource, {})
+        column = columns.get(selector)
+        if column is None:
+            column = columns[selector] = bytearray(len(self._users))
+            if is_prefix(selector):
+                self._prefixes.setdefault(resource, {})[selector] = column
+        return column
@@ -0,0 +1,169 @@
+"""
+observers.py
+
+Instrumentation of authorization decisions. `flow.authorize`,
+`flow.check_permission` and `jwt.decode` report a Decision to every
+attached observer: which event, on which resource and operation, whether
+it was allowed and how long it took.
+
+Instrumented functions only check the module-level `active` flag while no
+observer is attached, so instrumentation costs a single attribute lookup
+per call until someone is listening.
+
+>>> stats = DecisionStats()
+>>> attach(stats)
+>>> authorize(context, resource="coupon", operation="READ")
+>>> stats.counts
+{("authorize", "coupon", "READ"): [1, 0], ...}
+>>> detach(stats)
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+)
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Upper bounds, in seconds, of latency histogram buckets: 1us up to ~1s.
+BUCKETS: Tuple[float, ...] = tuple(2 ** i * 1e-6 for i in range(21))
+
+
+class Decision(NamedTuple):
+    event: str
+    resource: Optional[str]
+    operation: Optional[str]
+    allowed: bool
+    seconds: float
+
+
+Observer = Callable[[Decision], None]
+Key = Tuple[str, Optional[str], Optional[str]]
+
+observers: List[Observer] = []
+active = False
+
+
+def attach(observer: Observer) -> None:
+    global active
+    if observer not in observers:
+        observers.append(observer)
+    active = True
+
+
+def detach(observer: Observer) -> None:
+    global active
+    if observer in observers:
+        observers.remove(observer)
+    active = bool(observers)
+
+
+def notify(decision: Decision) -> None:
+    "A failing observer is logged, it never fails the decision itself"
+    for observer in tuple(observers):
+        try:
+            observer(decision)
+        except Exception:
+            logger.exception("Observer %r failed on %s", observer, decision)
+
+
+def observe(
+    event: str,
+    resource: Optional[str],
+    operation: Optional[str],
+    call: Callable[..., T],
+    args: Sequence[Any],
+    verdict: Optional[Callable[[T], bool]] = None,
+    denials: Tuple[Type[Exception], ...] = (),
+) -> T:
+    """
+    Times `call(*args)` and notifies its Decision. The call is allowed
+    unless it raises one of `denials`, or `verdict(result)` says otherwise.
+    Any other exception goes through unreported.
+    """
+    start = time.perf_counter()
+    try:
+        result = call(*args)
+    except denials:
+        elapsed = time.perf_counter() - start
+        notify(Decision(event, resource, operation, False, elapsed))
+        raise
+    elapsed = time.perf_counter() - start
+    allowed = verdict(result) if verdict is not None else True
+    notify(Decision(event, resource, operation, allowed, elapsed))
+    return result
+
+
+class DecisionStats:
+    """
+    An observer counting allowed and denied decisions and bucketing their
+    latencies per (event, resource, operation).
+
+    `counts[key]` is `[allowed, denied]`. `histograms[key][i]` counts the
+    decisions that took at most `buckets[i]` seconds, the last slot counting
+    the ones slower than every bucket.
+    """
+
+    def __init__(self, buckets: Sequence[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts: Dict[Key, List[int]] = {}
+        self.histograms: Dict[Key, List[int]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, decision: Decision) -> None:
+        key = (decision.event, decision.resource, decision.operation)
+        bucket = bisect_left(self.buckets, decision.seconds)
+        with self._lock:
+            counts = self.counts.get(key)
+            if counts is None:
+                counts = self.counts[key] = [0, 0]
+                self.histograms[key] = [0] * (len(self.buckets) + 1)
+            counts[0 if decision.allowed else 1] += 1
+            self.histograms[key][bucket] += 1
+
+    def percentile(self, key: Key, q: float) -> float:
+        """
+        Upper bound of the bucket holding the `q`th percentile latency of
+        `key`, infinity if it's beyond the last bucket.
+        """
+        histogram = self.histograms[key]
+        rank = sum(histogram) * q / 100
+        seen = 0
+        for bound, count in zip(self.buckets + (float("inf"),), histogram):
+            seen += count
+            if seen >= rank and count:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        "JSON-friendly copy of every counter"
+        with self._lock:
+            return [
+                dict(
+                    event=key[0],
+                    resource=key[1],
+                    operation=key[2],
+                    allowed=counts[0],
+                    denied=counts[1],
+                    histogram=list(self.histograms[key]),
+                )
+                for key, counts in self.counts.items()
+            ]
+
+    def clear(self) -> None:
+        with self._lock:
+            self.counts.clear()
+            self.histograms.clear()
@@ -0,0 +1,181 @@
+"""
+predicates.py
+
+Compiles parsed conditionals (see `dsl.parse_conditionals`) into predicate
+callables, so conditional policies can be evaluated against resource
+attributes with any of the `dsl.VALID_OPS`.
+
+Predicates evaluate either a single row or whole batches column-wise: a
+column is compared against the selector with `map` over an `operator`
+function, and masks of a `||` chain are combined the same way, so no Python
+loop runs per row.
+
+>>> predicate = compile_conditionals(
+    "resource.id == '5f34' || resource.level >= '3'", casts={"level": int}
+)
+>>> predicate.evaluate({"id": ["5f34", "0000", "0001"], "level": [1, 2, 3]})
+[True, False, True]
+"""
+import operator
+from itertools import compress, repeat
+from typing import (
+    Any,
+    Callable,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from kingdom.access.dsl import (
+    TOKEN_ALL,
+    Condition,
+    Conditionals,
+    is_prefix,
+    parse_conditionals,
+)
+
+Row = Mapping[str, Any]
+Columns = Mapping[str, Sequence[Any]]
+Mask = List[bool]
+Cast = Callable[[str], Any]
+
+OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    "<": operator.lt,
+    ">=": operator.ge,
+    "<=": operator.le,
+}
+
+
+class InvalidPredicate(Exception):
+    def __init__(self, condition: Condition, reason: str):
+        super().__init__(f"Invalid predicate {condition}: {reason}.")
+
+
+class Predicate:
+    """
+    A single compiled `attrref compr_op selector` conditional. The attribute
+    is looked up by its lowercased reference, e.g. "id" for `resource.id`.
+
+    The "*" selector is a constant: `== '*'` holds for every row and
+    `!= '*'` for none. A prefix wildcard, e.g. `== 'tenant:42:*'`, holds for
+    every attribute starting with "tenant:42:".
+    """
+
+    __slots__ = (
+        "condition",
+        "column",
+        "compare",
+        "literal",
+        "constant",
+        "prefix",
+        "negate",
+    )
+
+    def __init__(self, condition: Condition, cast: Optional[Cast] = None):
+        self.condition = condition
+        self.column = condition.reference.lower()
+        self.compare: Callable[[Any, Any], bool] = OPERATORS[
+            condition.operator
+        ]
+        self.constant: Optional[bool] = None
+        self.prefix = is_prefix(condition.selector)
+        self.negate = False
+        self.literal: Any = condition.selector
+        if condition.selector == TOKEN_ALL or self.prefix:
+            if condition.operator not in ("==", "!="):
+                raise InvalidPredicate(condition, "wildcards can't be ordered")
+        if condition.selector == TOKEN_ALL:
+            self.constant = condition.operator == "=="
+        elif self.prefix:
+            self.compare = str.startswith
+            self.negate = condition.operator == "!="
+            self.literal = condition.selector[:-1]
+        elif cast:
+            self.literal = cast(condition.selector)
+
+    def __call__(self, row: Row) -> bool:
+        if self.constant is not None:
+            return self.constant
+        return self.negate ^ self.compare(row[self.column], self.literal)
+
+    def __repr__(self) -> str:
+        return f"<Predicate {self.condition}>"
+
+    def evaluate(self, columns: Columns) -> Mask:
+        "Column-wise evaluation, one boolean per row"
+        column = columns[self.column]
+        if self.constant is not None:
+            return [self.constant] * len(column)
+        mask = map(self.compare, column, repeat(self.literal))
+        return list(map(operator.not_, mask) if self.negate else mask)
+
+
+class AnyPredicate:
+    """A `||` chain of predicates: a row passes if any of them holds"""
+
+    __slots__ = ("predicates", "always")
+
+    def __init__(self, predicates: Iterable[Predicate]):
+        predicates = tuple(predicates)
+        # Constant predicates are resolved right away.
+        self.always = any(predicate.constant for predicate in predicates)
+        self.predicates: Tuple[Predicate, ...] = tuple(
+            predicate
+            for predicate in predicates
+            if predicate.constant is None
+        )
+
+    def __call__(self, row: Row) -> bool:
+        return self.always or any(
+            predicate(row) for predicate in self.predicates
+        )
+
+    def __repr__(self) -> str:
+        return f"<AnyPredicate {self.predicates}>"
+
+    def evaluate(self, columns: Columns) -> Mask:
+        if self.always or not self.predicates:
+            rows = len(next(iter(columns.values()), ()))
+            return [self.always] * rows
+
+        mask = self.predicates[0].evaluate(columns)
+        for predicate in self.predicates[1:]:
+            mask = list(map(operator.or_, mask, predicate.evaluate(columns)))
+        return mask
+
+    def filter(self, rows: Sequence[Row]) -> List[Row]:
+        "Rows passing the predicate, keeping their order"
+        if self.always or not self.predicates:
+            return list(rows) if self.always else []
+        columns = {
+            predicate.column: list(
+                map(operator.itemgetter(predicate.column), rows)
+            )
+            for predicate in self.predicates
+        }
+        return list(compress(rows, self.evaluate(columns)))
+
+
+def compile_conditionals(
+    conditionals: Union[str, Conditionals, Sequence[Tuple[str, ...]]],
+    casts: Optional[Mapping[str, Cast]] = None,
+) -> AnyPredicate:
+    """
+    Compiles a conditional sequence, or its parsed form, into an
+    AnyPredicate. Selectors are strings, `casts` converts them per
+    attribute before comparison, e.g. `{"level": int}`.
+    """
+    if isinstance(conditionals, str):
+        conditionals = parse_conditionals(conditionals)
+    casts = casts or {}
+    return AnyPredicate(
+        Predicate(condition, casts.get(condition.reference.lower()))
+        for condition in map(Condition._make, conditionals)
+    )
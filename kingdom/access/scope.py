@@ -0,0 +1,123 @@
+"""
+scope.py
+
+A read Scope tells which selectors of a resource a subject may read. It
+used to be a plain list, copied out of the owned selector map on every
+call, making `row_id in scope` linear.
+
+Scope is a read-only, list-like view over any collection of selectors,
+usually the keys of the owned selector map itself: nothing is copied, and
+membership is a hash lookup. A scope holding "*" contains every selector.
+
+>>> scope = Scope({"ab4c": 8, "bc3f": 10}.keys())
+>>> "ab4c" in scope, "0000" in scope
+(True, False)
+>>> scope == ["ab4c", "bc3f"]
+True
+>>> ALL_SCOPE.is_all, "0000" in ALL_SCOPE
+(True, True)
+"""
+from collections.abc import Sequence
+from functools import lru_cache
+from itertools import islice
+from typing import Any, Callable, Collection, Iterator, Optional
+
+from kingdom.access import config
+from kingdom.access.dsl import TOKEN_ALL
+
+# Prefix wildcard lookup, see `context.PrefixIndex.match`.
+PrefixMatch = Callable[[str], Optional[int]]
+
+
+class Scope(Sequence):
+    """
+    `selectors` is kept, not copied: it must support hashed membership
+    (a dict keys view, a set or a tuple of a few items) and must not change
+    while the scope is in use.
+
+    `match`, when given, makes selectors contemplated by a prefix wildcard
+    of the scope, e.g. "tenant:*", members too.
+
+    `excluded` are selectors the scope does not contain although "*" or a
+    prefix wildcard contemplates them, e.g. the ones a deny policy blocks.
+    They are left out when iterating too. `is_all`, telling that every
+    selector is in scope, is False as soon as some are excluded.
+    """
+
+    __slots__ = ("_selectors", "_match", "_all", "is_all", "excluded")
+
+    def __init__(
+        self,
+        selectors: Collection[str],
+        match: Optional[PrefixMatch] = None,
+        excluded: Optional[Collection[str]] = None,
+    ):
+        self._selectors = selectors
+        self._match = match
+        self._all = TOKEN_ALL in selectors
+        self.is_all: bool = self._all and not excluded
+        self.excluded = excluded
+
+    def __contains__(self, selector: object) -> bool:
+        if self.excluded is not None and selector in self.excluded:
+            return False
+        if self._all or selector in self._selectors:
+            return True
+        if self._match is None or not isinstance(selector, str):
+            return False
+        return self._match(selector) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        excluded = self.excluded
+        if not excluded:
+            return iter(self._selectors)
+        if not isinstance(excluded, (set, frozenset)):
+            excluded = frozenset(excluded)
+        return (s for s in self._selectors if s not in excluded)
+
+    def __len__(self) -> int:
+        if not self.excluded:
+            return len(self._selectors)
+        return sum(1 for _ in self)
+
+    def __bool__(self) -> bool:
+        # Only walks selectors up to the first one not excluded.
+        excluded = self.excluded
+        if excluded is None:
+            return len(self._selectors) > 0
+        return any(s not in excluded for s in self._selectors)
+
+    def __getitem__(self, index: Any) -> Any:
+        # Positional access walks the view, it's never on a hot path.
+        if isinstance(index, slice):
+            return list(self)[index]
+        size = len(self)
+        if index < 0:
+            index += size
+        if not 0 <= index < size:
+            raise IndexError("Scope index out of range")
+        return next(islice(self, index, None))
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (Scope, list, tuple)):
+            return len(self) == len(other) and all(
+                mine == theirs for mine, theirs in zip(self, other)
+            )
+        return NotImplemented
+
+    __hash__ = None  # type: ignore
+
+    def __repr__(self) -> str:
+        if self.excluded:
+            return f"Scope({list(self)}, excluded={sorted(self.excluded)})"
+        return f"Scope({list(self)})"
+
+
+EMPTY_SCOPE = Scope(())
+ALL_SCOPE = Scope((TOKEN_ALL,))
+
+
+@lru_cache(maxsize=config.SCOPE_CACHE_SIZE)
+def selector_scope(selector: str) -> Scope:
+    "Scope of `selector` alone, shared instead of allocated on every check"
+    return Scope((selector,))
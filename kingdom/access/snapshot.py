@@ -0,0 +1,359 @@
+"""
+snapshot.py
+
+Uvicorn runs one process per worker, and each of them would build and keep
+its own copy of every subject's policy context. A snapshot is a flat,
+array-backed serialization of many contexts, e.g. every user's or every
+role's, keyed by subject. It's written once by a publisher and memory-mapped
+by every worker: the OS shares its pages between processes, and opening it
+neither parses nor copies anything. Lookups binary search its fixed-width
+tables in place.
+
+Layout, made of native-endian u32 words then a blob of UTF-8 strings:
+    header    ::= "KSNP" version strings keys resources entries
+    offsets   ::= offset{strings + 1}, of each string in the blob
+    keys      ::= (string first-resource resources){keys}
+    resources ::= (string first-entry entries){resources}, the top bit of
+                  entries set if the resource has prefix wildcards
+    entries   ::= (string permissions){entries}
+
+Strings are deduplicated and sorted by their UTF-8 bytes, so comparing two
+string indexes compares the strings. Keys, the resources of a key and the
+entries of a resource are sorted by string index, and a lookup binary
+searches only the rows it's interested in, e.g. one resource's entries.
+Snapshots are meant for processes of the same host, hence native byte
+order.
+
+`publish` writes a snapshot beside its destination and renames it over,
+which is atomic: readers either see the previous snapshot or the new one,
+never a partial write. A SnapshotReader remaps the file once it has been
+replaced, and views of the previous snapshot stay valid while referenced.
+Put snapshots on a tmpfs, e.g. /dev/shm, to keep them in shared memory.
+
+>>> publish("/dev/shm/policies", {"abbf": {"coupon": {"*": 8}}})
+>>> reader = SnapshotReader("/dev/shm/policies")
+>>> authorize(reader.current["abbf"], "coupon", "READ")
+["*"]
+"""
+import mmap
+import os
+import tempfile
+import time
+from array import array
+from collections.abc import ItemsView, Mapping
+from itertools import chain
+from typing import Any, Callable, Iterator, Optional, Tuple, Union
+
+from kingdom.access.dsl import is_prefix
+from kingdom.access.interning import intern
+from kingdom.access.types import PermissionInt, PolicyContext, Selector
+
+MAGIC = b"KSNP"
+FORMAT_VERSION = 1
+HEADER_WORDS = 6
+KEY_WORDS = RESOURCE_WORDS = 3
+ENTRY_WORDS = 2
+PREFIXED = 0x8000_0000
+
+Buffer = Union[bytes, bytearray, mmap.mmap]
+
+
+class InvalidSnapshot(Exception):
+    def __init__(self, reason: str):
+        super().__init__(f"Invalid policy snapshot, {reason}.")
+
+
+def pack_snapshot(contexts: Mapping) -> bytes:
+    "Serializes a mapping of subject key to PolicyContext"
+    encoded = sorted(
+        {
+            string.encode("utf-8")
+            for key, context in contexts.items()
+            for string in chain(
+                (key,), context, *(owned for owned in context.values())
+            )
+        }
+    )
+    index = {string.decode("utf-8"): idx for idx, string in enumerate(encoded)}
+
+    offsets = array("I", [0])
+    for string in encoded:
+        offsets.append(offsets[-1] + len(string))
+    keys, resources, entries = array("I"), array("I"), array("I")
+    for key in sorted(contexts, key=index.__getitem__):
+        context = contexts[key]
+        keys.extend(
+            (index[key], len(resources) // RESOURCE_WORDS, len(context))
+        )
+        for resource in sorted(context, key=index.__getitem__):
+            owned = context[resource]
+            count = len(owned)
+            if any(map(is_prefix, owned)):
+                count |= PREFIXED
+            resources.extend(
+                (index[resource], len(entries) // ENTRY_WORDS, count)
+            )
+            for selector in sorted(owned, key=index.__getitem__):
+                entries.extend((index[selector], owned[selector]))
+
+    header = array("I", [FORMAT_VERSION, len(encoded), len(contexts)])
+    header.extend(
+        (len(resources) // RESOURCE_WORDS, len(entries) // ENTRY_WORDS)
+    )
+    tables = [header, offsets, keys, resources, entries]
+    return b"".join(
+        chain([MAGIC], (table.tobytes() for table in tables), encoded)
+    )
+
+
+class Snapshot(Mapping):
+    """
+    Read-only view of a packed snapshot, mapping subject keys to their
+    SnapshotContext. `buffer` is kept, not copied.
+    """
+
+    def __init__(self, buffer: Buffer):
+        view = memoryview(buffer)
+        if bytes(view[:4]) != MAGIC:
+            raise InvalidSnapshot("bad magic number")
+        header = view[4:HEADER_WORDS * 4].cast("I")
+        if header[0] != FORMAT_VERSION:
+            raise InvalidSnapshot(f"unknown format version {header[0]}")
+        strings, keys, resources, entries = header[1:]
+
+        bounds = [HEADER_WORDS, strings + 1, keys * KEY_WORDS]
+        bounds += [resources * RESOURCE_WORDS, entries * ENTRY_WORDS]
+        size = sum(bounds) * 4
+        if len(view) < size:
+            raise InvalidSnapshot("truncated tables")
+        words = view[:size].cast("I")
+        tables = []
+        start = 0
+        for length in bounds:
+            tables.append(words[start:start + length])
+            start += length
+        _, self._offsets, self._keys, self._resources, self._entries = tables
+        self._blob = view[size:]
+        if len(self._blob) < self._offsets[-1]:
+            raise InvalidSnapshot("truncated strings")
+        self._buffer = buffer
+
+    @classmethod
+    def open(cls, path: str) -> "Snapshot":
+        "Memory-maps the snapshot file at `path`"
+        with open(path, "rb") as file:
+            mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(mapped)
+
+    def __getitem__(self, key: str) -> "SnapshotContext":
+        row = self.search(self._keys, KEY_WORDS, 0, len(self), key)
+        if row < 0:
+            raise KeyError(key)
+        _, first, count = self._row(self._keys, KEY_WORDS, row)
+        return SnapshotContext(self, first, count)
+
+    def __iter__(self) -> Iterator[str]:
+        for row in range(len(self)):
+            yield self.string(self._keys[row * KEY_WORDS])
+
+    def __len__(self) -> int:
+        return len(self._keys) // KEY_WORDS
+
+    def to_dict(self) -> dict:
+        return {key: context.to_dict() for key, context in self.items()}
+
+    def string(self, idx: int) -> str:
+        start, end = self._offsets[idx], self._offsets[idx + 1]
+        return intern(bytes(self._blob[start:end]).decode("utf-8"))
+
+    def search(
+        self, table: memoryview, stride: int, lo: int, hi: int, string: str
+    ) -> int:
+        "Row of `table`, between rows lo and hi, keyed by `string`, or -1"
+        needle = string.encode("utf-8")
+        offsets, blob = self._offsets, self._blob
+        while lo < hi:
+            mid = (lo + hi) // 2
+            idx = table[mid * stride]
+            found = bytes(blob[offsets[idx]:offsets[idx + 1]])
+            if found < needle:
+                lo = mid + 1
+            elif found > needle:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    @staticmethod
+    def _row(table: memoryview, stride: int, row: int) -> Tuple[int, ...]:
+        return tuple(table[row * stride:(row + 1) * stride])
+
+
+class SnapshotContext(Mapping):
+    "A subject's PolicyContext, read in place from a Snapshot"
+
+    __slots__ = ("_snapshot", "_first", "_count")
+
+    def __init__(self, snapshot: Snapshot, first: int, count: int):
+        self._snapshot = snapshot
+        self._first = first
+        self._count = count
+
+    def __getitem__(self, resource: str) -> "SnapshotSelectors":
+        snapshot = self._snapshot
+        row = snapshot.search(
+            snapshot._resources,
+            RESOURCE_WORDS,
+            self._first,
+            self._first + self._count,
+            resource,
+        )
+        if row < 0:
+            raise KeyError(resource)
+        _, first, count = snapshot._row(
+            snapshot._resources, RESOURCE_WORDS, row
+        )
+        return SnapshotSelectors(snapshot, first, count)
+
+    def __iter__(self) -> Iterator[str]:
+        resources = self._snapshot._resources
+        for row in range(self._first, self._first + self._count):
+            yield self._snapshot.string(resources[row * RESOURCE_WORDS])
+
+    def __len__(self) -> int:
+        return self._count
+
+    def items(self) -> "RowItems":
+        return RowItems(self)
+
+    def rows(self) -> Iterator[Tuple[str, "SnapshotSelectors"]]:
+        "(resource, selector map) pairs, read in order without searching"
+        snapshot = self._snapshot
+        resources = snapshot._resources
+        for row in range(self._first, self._first + self._count):
+            idx, first, count = snapshot._row(resources, RESOURCE_WORDS, row)
+            yield snapshot.string(idx), SnapshotSelectors(
+                snapshot, first, count
+            )
+
+    def to_dict(self) -> PolicyContext:
+        """
+        Plain PolicyContext copy. Views search the snapshot on every lookup:
+        a subject checked over and over is better served by a copy, or by
+        a CompiledPolicyContext of it.
+        """
+        return {
+            resource: dict(owned.items()) for resource, owned in self.rows()
+        }
+
+
+class SnapshotSelectors(Mapping):
+    """
+    The selector map of one resource of a SnapshotContext. Probing a prefix
+    wildcard of a resource without any, as `context.prefix_permissions`
+    does for every prefix of a selector, doesn't search the snapshot.
+    """
+
+    __slots__ = ("_snapshot", "_first", "_count", "_prefixed")
+
+    def __init__(self, snapshot: Snapshot, first: int, count: int):
+        self._snapshot = snapshot
+        self._first = first
+        self._count = count & ~PREFIXED
+        self._prefixed = bool(count & PREFIXED)
+
+    def __getitem__(self, selector: Selector) -> PermissionInt:
+        if not self._prefixed and is_prefix(selector):
+            raise KeyError(selector)
+        entries = self._snapshot._entries
+        last = self._first + self._count
+        row = self._snapshot.search(
+            entries, ENTRY_WORDS, self._first, last, selector
+        )
+        if row < 0:
+            raise KeyError(selector)
+        return entries[row * ENTRY_WORDS + 1]
+
+    def __iter__(self) -> Iterator[Selector]:
+        entries = self._snapshot._entries
+        for row in range(self._first, self._first + self._count):
+            yield self._snapshot.string(entries[row * ENTRY_WORDS])
+
+    def __len__(self) -> int:
+        return self._count
+
+    def items(self) -> "RowItems":
+        return RowItems(self)
+
+    def rows(self) -> Iterator[Tuple[Selector, PermissionInt]]:
+        "(selector, permissions) pairs, read in order without searching"
+        snapshot = self._snapshot
+        entries = snapshot._entries
+        for row in range(self._first, self._first + self._count):
+            yield (
+                snapshot.string(entries[row * ENTRY_WORDS]),
+                entries[row * ENTRY_WORDS + 1],
+            )
+
+
+class RowItems(ItemsView):
+    "Items view of a snapshot mapping, iterated row by row"
+
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        return self._mapping.rows()  # type: ignore
+
+
+def publish(path: str, contexts: Mapping) -> None:
+    "Atomically replaces the snapshot at `path` with one of `contexts`"
+    data = pack_snapshot(contexts)
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary = tempfile.mkstemp(dir=directory, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
+
+
+class SnapshotReader:
+    """
+    Follows the snapshot published at `path`. `current` checks the file at
+    most once every `interval` seconds and remaps it when it was replaced.
+    Swapping is a single attribute assignment, so concurrent readers get
+    either snapshot, both valid.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        interval: float = 1.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.path = path
+        self.interval = interval
+        self.clock = clock
+        self.snapshot: Optional[Snapshot] = None
+        self._stamp: Optional[Tuple[int, int, int]] = None
+        self._checked = -float("inf")
+
+    @property
+    def current(self) -> Snapshot:
+        now = self.clock()
+        if self.snapshot is None or now - self._checked >= self.interval:
+            self._checked = now
+            self.refresh()
+        return self.snapshot  # type: ignore
+
+    def refresh(self) -> bool:
+        "Remaps the snapshot if it was replaced, tells whether it was"
+        stat = os.stat(self.path)
+        stamp = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if stamp == self._stamp:
+            return False
+        self.snapshot = Snapshot.open(self.path)
+        self._stamp = stamp
+        return True
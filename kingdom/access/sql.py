@@ -0,0 +1,118 @@
+"""
+sql.py
+
+Pushes authorization down to the database: a read scope, or compiled DSL
+conditionals, become a SQLAlchemy `ColumnElement` to be used in a WHERE
+clause. Postgres can then use its indexes, and pagination counts only take
+rows the subject is allowed to read into account.
+
+>>> users = table("users", column("id"))
+>>> scope = authorize(context, resource="user", operation="READ")
+>>> select([users]).where(scope_clause(users.c.id, scope))
+"""
+import re
+from typing import (
+    Any,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
+
+from sqlalchemy import and_, false, or_, true
+from sqlalchemy.sql.elements import ColumnElement, False_, True_
+
+from kingdom.access.dsl import TOKEN_ALL, Conditionals, is_prefix
+from kingdom.access.predicates import Cast, compile_conditionals
+from kingdom.access.scope import Scope
+from kingdom.access.types import Selector
+
+
+def scope_clause(
+    column: ColumnElement, scope: Iterable[Selector]
+) -> ColumnElement:
+    """
+    >>> scope_clause(users.c.id, ["*"])
+    true
+    >>> scope_clause(users.c.id, [])
+    false
+    >>> scope_clause(users.c.id, ["5f34", "0bf3"])
+    users.id IN (:id_1, :id_2)
+    >>> scope_clause(users.c.id, ["5f34", "tenant:42:*"])
+    users.id IN (:id_1) OR users.id LIKE :id_2
+    >>> scope_clause(users.c.id, Scope(["*"], excluded={"5f34"}))
+    users.id NOT IN (:id_1)
+    """
+    excluded = (
+        sorted(scope.excluded)
+        if isinstance(scope, Scope) and scope.excluded
+        else []
+    )
+    clause = selectors_clause(column, scope)
+    if not excluded or isinstance(clause, False_):
+        return clause
+    if isinstance(clause, True_):
+        return ~column.in_(excluded)
+    return and_(clause, ~column.in_(excluded))
+
+
+def selectors_clause(
+    column: ColumnElement, scope: Iterable[Selector]
+) -> ColumnElement:
+    if isinstance(scope, Scope) and scope.is_all:
+        return true()
+    selectors = list(scope)
+    if TOKEN_ALL in selectors:
+        return true()
+
+    exact = [selector for selector in selectors if not is_prefix(selector)]
+    clauses: List[Any] = [column.in_(exact)] if exact else []
+    clauses.extend(
+        prefix_clause(column, selector[:-1])
+        for selector in selectors
+        if is_prefix(selector)
+    )
+    if not clauses:
+        return false()
+    return or_(*clauses) if len(clauses) > 1 else clauses[0]
+
+
+def prefix_clause(column: ColumnElement, prefix: str) -> ColumnElement:
+    "column LIKE 'prefix%', with LIKE wildcards in prefix escaped"
+    escaped = re.sub(r"([\\%_])", r"\\\1", prefix)
+    return column.like(f"{escaped}%", escape="\\")
+
+
+def conditionals_clause(
+    columns: Mapping[str, ColumnElement],
+    conditionals: Union[str, Conditionals, Sequence[Tuple[str, ...]]],
+    casts: Optional[Mapping[str, Cast]] = None,
+) -> ColumnElement:
+    """
+    Translates a conditional sequence into an OR of comparisons, looking up
+    each attribute by its lowercased reference on `columns`.
+
+    >>> conditionals_clause(
+        {"id": users.c.id, "level": users.c.level},
+        "resource.id == '5f34' || resource.level >= '3'",
+        casts={"level": int},
+    )
+    users.id = :id_1 OR users.level >= :level_1
+    """
+    predicate = compile_conditionals(conditionals, casts)
+    if predicate.always:
+        return true()
+    if not predicate.predicates:
+        return false()
+
+    clauses: List[Any] = []
+    for p in predicate.predicates:
+        if p.prefix:
+            clause = prefix_clause(columns[p.column], p.literal)
+            clauses.append(~clause if p.negate else clause)
+        else:
+            clauses.append(p.compare(columns[p.column], p.literal))
+    return or_(*clauses) if len(clauses) > 1 else clauses[0]
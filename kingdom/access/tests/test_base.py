@@ -1,16 +1,30 @@
+from datetime import datetime, timedelta
+from typing import List
+
 from kingdom.access.base import (
+    EXCLUSIONS,
+    OVERRIDE,
+    ContextEncoder,
+    CyclicRoleErr,
     Permission,
+    PermissionTupleOrInt,
     Policy,
     Resource,
     Role,
+    RoleFragmentCache,
     Statement,
     User,
+    compile_decisions,
+    encode_policies,
+    ptoi,
+    role_fragments,
 )
+from pytest import raises
 
-CREATE = Permission.CREATE | 0
-READ = Permission.READ | 0
-UPDATE = Permission.UPDATE | 0
-DELETE = Permission.DELETE | 0
+CREATE = Permission.CREATE.value
+READ = Permission.READ.value
+UPDATE = Permission.UPDATE.value
+DELETE = Permission.DELETE.value
 
 
 def test_simple_policy_packing():
@@ -64,7 +78,7 @@ def test_simple_policy_packing():
 
     policy_ctx = {
         "product": {"*": 1, "ab4f": 2, "13fa": 2, },
-        "account": {"*": 0, "0bf3": 2, "bc0e": 2, },
+        "account": {"*": READ, "0bf3": 2, "bc0e": 2, },
     }
 
     assert user.policy_context == policy_ctx
@@ -128,7 +142,13 @@ def test_cumulative_policy_packing():
     # A ficticious supervisor
     user = User("abbf", roles=[store_manager, christmas_ops])
     policy_ctx = {
-        "product": {"*": 1, "044e": 6, "0e0e": 2, "bc0e": 6, "aac0": 4, }
+        "product": {
+            "*": READ | CREATE,
+            "044e": 6,
+            "0e0e": 2,
+            "bc0e": 6,
+            "aac0": 4,
+        }
     }
     assert user.policy_context == policy_ctx
 
@@ -183,3 +203,398 @@ def test_redundant_policy_packing():
     }
 
     assert sales_coord.policy_context == policy_ctx
+
+
+def test_permission_masks():
+    input: List[PermissionTupleOrInt] = [
+        (Permission.READ,),
+        (Permission.UPDATE, Permission.CREATE),
+        (Permission.DELETE, Permission.READ, Permission.DELETE),
+        (),
+        Permission.READ | Permission.UPDATE,
+        5,
+    ]
+    want = [8, 3, 12, 0, 10, 5]
+    got = [ptoi(permissions) for permissions in input]
+    assert got == want
+    assert all(type(mask) is int for mask in got)
+    assert len({p.value for p in Permission}) == len(Permission)
+
+
+def test_incremental_encoding():
+    """Applying and retracting policies one by one must always be equivalent
+    to encoding the remaining policies from scratch"""
+
+    all_products = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.CREATE, Permission.UPDATE),
+        conditionals=[Statement("resource.id", "*"), ],
+    )
+    read_products = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.READ,),
+        conditionals=[Statement("resource.id", "*"), ],
+    )
+    some_products = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.READ, Permission.UPDATE, Permission.DELETE),
+        conditionals=[
+            Statement("resource.id", "7fb4"),
+            Statement("resource.id", "49f3"),
+        ],
+    )
+    ya_some_products = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.UPDATE,),
+        conditionals=[Statement("resource.id", "49f3"), ],
+    )
+    accounts = Policy(
+        resource=Resource("Account"),
+        permissions=(Permission.READ,),
+        conditionals=[Statement("resource.id", "0bf3"), ],
+    )
+    policies = [
+        some_products,
+        all_products,
+        accounts,
+        ya_some_products,
+        read_products,
+    ]
+
+    encoder = ContextEncoder()
+    for idx, policy in enumerate(policies):
+        encoder.apply(policy)
+        assert encoder.context == encode_policies(policies[: idx + 1])
+
+    for idx, policy in enumerate(policies):
+        encoder.retract(policy)
+        assert encoder.context == encode_policies(policies[idx + 1:])
+
+    assert encoder.context == {}
+    with raises(ValueError):
+        encoder.retract(accounts)
+
+
+def test_retracting_unapplied_permissions():
+    "Retracting must never grant what no applied policy granted"
+
+    def x(permissions):
+        return Policy(
+            resource=Resource("Acc"),
+            permissions=permissions,
+            conditionals=[Statement("resource.id", "x")],
+        )
+
+    encoder = ContextEncoder(
+        [x((Permission.UPDATE,)), x((Permission.CREATE,))]
+    )
+    input = [
+        x((Permission.DELETE,)),
+        x((Permission.UPDATE, Permission.DELETE)),
+        Policy(
+            resource=Resource("Acc"),
+            permissions=(Permission.UPDATE,),
+            conditionals=[
+                Statement("resource.id", "x"),
+                Statement("resource.id", "x"),
+            ],
+        ),
+    ]
+    for policy in input:
+        with raises(ValueError):
+            encoder.retract(policy)
+        assert encoder.context == {"acc": {"x": 3}}
+
+    encoder.retract(x((Permission.CREATE,)))
+    assert encoder.context == {"acc": {"x": 2}}
+
+
+def test_role_fragments_are_cached_per_version():
+    "Users sharing a role reuse its fragment until the role changes"
+
+    product_policy = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.UPDATE,),
+        conditionals=[Statement("resource.id", "ab4f"), ],
+    )
+    store_manager = Role("Store management group", policies=[product_policy])
+    cache = RoleFragmentCache(maxsize=1)
+
+    fragment = cache.get(store_manager)
+    assert fragment == {"product": {"ab4f": 2}}
+    assert cache.get(store_manager) is fragment
+
+    store_manager.policies.append(
+        Policy(
+            resource=Resource("Product"),
+            permissions=(Permission.CREATE,),
+            conditionals=[Statement("resource.id", "*"), ],
+        )
+    )
+    assert cache.get(store_manager) == {"product": {"*": 1, "ab4f": 2}}
+
+    # A policy changed in place is stale until the version is bumped.
+    fragment = cache.get(store_manager)
+    product_policy.permissions = (Permission.DELETE,)
+    assert cache.get(store_manager) is fragment
+    store_manager.version += 1
+    assert cache.get(store_manager) == {"product": {"*": 1, "ab4f": 4}}
+
+    # A role of the same name holding other policies isn't served stale.
+    fragment = cache.get(Role(store_manager.name, policies=[]))
+    assert fragment == {}
+
+    cache.invalidate(store_manager.name)
+    assert len(cache) == 0
+
+    site_manager = Role("Site management group", policies=[])
+    cache.get(store_manager)
+    cache.get(site_manager)
+    assert len(cache) == 1
+
+    user = User("abbf", roles=[store_manager, site_manager])
+    assert user.policy_context == {"product": {"*": 1, "ab4f": 4}}
+
+
+def test_role_hierarchy():
+    "Roles inherit their ancestors' policies, cached per transitive closure"
+
+    def policy(selector, *permissions):
+        return Policy(
+            resource=Resource("Product"),
+            permissions=permissions,
+            conditionals=[Statement("resource.id", selector)],
+        )
+
+    shared = policy("00df", Permission.READ)
+    staff = Role("staff", policies=[shared])
+    clerk = Role("clerk", policies=[policy("ab4f", Permission.UPDATE)])
+    auditor = Role("auditor", policies=[shared], parents=[staff])
+    manager = Role(
+        "manager",
+        policies=[policy("*", Permission.CREATE)],
+        parents=[clerk, auditor],
+    )
+    cache = RoleFragmentCache()
+
+    assert [role.name for role in cache.closure(manager)] == [
+        "manager",
+        "clerk",
+        "auditor",
+        "staff",
+    ]
+    assert len(cache.policies(manager)) == 3
+    assert User("abbf", roles=[manager]).policy_context == encode_policies(
+        list(cache.policies(manager))
+    )
+    encoder = ContextEncoder()
+    encoder.apply_role(manager)
+    assert encoder.decisions == User("abbf", roles=[manager]).policy_context
+    encoder.retract_role(manager)
+    assert encoder.context == {}
+
+    clerk_fragment = cache.get(clerk)
+    auditor_fragment = cache.get(auditor)
+    staff.policies.append(policy("*", Permission.DELETE))
+    staff.version += 1
+    # Descendants of staff are encoded again, clerk is untouched.
+    assert cache.get(manager)["product"]["*"] == CREATE | DELETE
+    assert cache.get(auditor) is not auditor_fragment
+    assert cache.get(clerk) is clerk_fragment
+
+    cache.invalidate("staff")
+    assert len(cache) == 1
+
+    staff.parents.append(manager)
+    with raises(CyclicRoleErr):
+        cache.get(manager)
+
+
+def test_role_fragment_cache_evictions():
+    "Evicted roles are forgotten by their parents too"
+
+    staff = Role("staff", policies=[])
+    clerk = Role("clerk", policies=[], parents=[staff])
+    cache = RoleFragmentCache(maxsize=2)
+
+    cache.get(clerk)
+    assert cache._children == {"staff": {"clerk"}}
+    cache.get(Role("auditor", policies=[]))
+    cache.get(Role("manager", policies=[]))
+    assert len(cache) == 2
+    assert cache._children == {}
+
+
+def test_deny_policies():
+    "Deny policies take precedence over any allow policy, '*' included"
+
+    all_products = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.READ, Permission.UPDATE, Permission.DELETE),
+        conditionals=[Statement("resource.id", "*"), ],
+    )
+    some_products = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.CREATE,),
+        conditionals=[Statement("resource.id", "7fb4"), ],
+    )
+    no_delete = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.DELETE,),
+        conditionals=[Statement("resource.id", "7fb4"), ],
+        deny=True,
+    )
+    hidden = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.READ,),
+        conditionals=[Statement("resource.id", "49f3"), ],
+        deny=True,
+    )
+    no_update = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.UPDATE,),
+        conditionals=[Statement("resource.id", "*"), ],
+        deny=True,
+    )
+
+    input = [
+        [all_products, no_delete],
+        [all_products, some_products, no_delete],
+        [all_products, hidden],
+        [all_products, some_products, no_update],
+        [some_products, no_delete],
+        [some_products, hidden],
+        [no_delete],
+    ]
+    want = [
+        {
+            "product": {
+                "*": EXCLUSIONS | READ | UPDATE | DELETE,
+                "7fb4": OVERRIDE | READ | UPDATE,
+            }
+        },
+        {
+            "product": {
+                "*": EXCLUSIONS | READ | UPDATE | DELETE,
+                "7fb4": OVERRIDE | READ | CREATE | UPDATE,
+            }
+        },
+        {
+            "product": {
+                "*": EXCLUSIONS | READ | UPDATE | DELETE,
+                "49f3": OVERRIDE,
+            }
+        },
+        {"product": {"*": READ | DELETE, "7fb4": CREATE}},
+        {"product": {"7fb4": CREATE}},
+        {"product": {"7fb4": CREATE}},
+        {},
+    ]
+    got = [encode_policies(policies) for policies in input]
+    for got_ctx, want_ctx in zip(got, want):
+        assert got_ctx == want_ctx
+
+    role = Role("Curator", [all_products])
+    user = User("abbf", [role, Role("Guarded", [hidden])])
+    assert user.policy_context == want[2]
+
+    encoder = ContextEncoder()
+    policies = input[1] + [hidden, no_update]
+    for idx, policy in enumerate(policies):
+        encoder.apply(policy)
+        assert encoder.decisions == encode_policies(policies[: idx + 1])
+    for idx, policy in enumerate(policies):
+        encoder.retract(policy)
+        assert encoder.decisions == encode_policies(policies[idx + 1:])
+
+    prefixed = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.UPDATE,),
+        conditionals=[Statement("resource.id", "tenant:*"), ],
+        deny=True,
+    )
+    with raises(ValueError):
+        encode_policies([all_products, prefixed])
+
+
+def test_time_bounded_policies():
+    "Policies only count from not_before until not_after"
+
+    start = datetime(2030, 1, 1)
+    hour = timedelta(hours=1)
+    products = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.READ,),
+        conditionals=[Statement("resource.id", "*"), ],
+    )
+    temporary = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.UPDATE,),
+        conditionals=[Statement("resource.id", "7fb4"), ],
+        not_before=start + hour,
+        not_after=start + 3 * hour,
+    )
+    frozen = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.UPDATE,),
+        conditionals=[Statement("resource.id", "7fb4"), ],
+        deny=True,
+        not_after=start + 2 * hour,
+    )
+    with raises(ValueError):
+        Policy(Resource("Product"), (), [], not_before=start, not_after=start)
+
+    encoder = ContextEncoder([products, temporary, frozen], now=start)
+    assert encoder.next_transition == start + hour
+
+    input = [0, 1, 2, 3, 4]
+    want = [
+        {"product": {"*": READ}},
+        {"product": {"*": READ}},
+        {"product": {"*": READ, "7fb4": UPDATE}},
+        {"product": {"*": READ}},
+        {"product": {"*": READ}},
+    ]
+    for hours, want_ctx in zip(input, want):
+        encoder.refresh(start + hours * hour)
+        got_ctx = compile_decisions(encoder.context, encoder.denials)
+        assert got_ctx == want_ctx
+    assert encoder.next_transition is None
+    # Not yet holding, for now at least.
+    assert encode_policies([products, temporary, frozen]) == want[0]
+
+    encoder = ContextEncoder([products, temporary], now=start + hour)
+    assert encoder.context == want[2]
+    encoder.retract(temporary)
+    assert encoder.context == want[0]
+    assert encoder.next_transition is None
+    with raises(ValueError):
+        encoder.retract(temporary)
+
+    role = Role("Temporary", [products, temporary])
+    user = User("abbf", [role])
+    assert user.policy_context_at(start) == want[0]
+    assert user.policy_context_at(start + 2 * hour) == want[2]
+    assert role_fragments.next_transition(role, start) == start + hour
+    assert role_fragments.next_transition(role, start + 2 * hour) == (
+        start + 3 * hour
+    )
+    assert user.policy_context_at(start + 3 * hour) == want[0]
+    assert role_fragments.next_transition(role, start + 3 * hour) is None
+    # Fragments follow the moment asked for, previews included.
+    assert user.policy_context_at(start + 2 * hour) == want[2]
+    assert user.policy_context_at(start) == want[0]
+    cache = RoleFragmentCache()
+    assert cache.next_transition(role, start + 2 * hour) == start + 3 * hour
+
+    # Tokens expire as soon as their context would be stale.
+    soon = datetime.utcnow() + timedelta(minutes=5)
+    expiring = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.READ,),
+        conditionals=[Statement("resource.id", "*"), ],
+        not_after=soon,
+    )
+    payload = User("abbf", [Role("Expiring", [expiring])]).jwt_payload
+    assert payload["exp"] == soon
+    assert payload["policies"] == want[0]
@@ -0,0 +1,39 @@
+from kingdom.access.base import encode_policies
+from kingdom.access.benchmarks.generators import (
+    synthetic_requests,
+    synthetic_roles,
+)
+from kingdom.access.benchmarks.harness import compare, measure, percentile
+
+
+def test_synthetic_roles_are_deterministic():
+    roles = synthetic_roles(roles=3, policies=4, selectors=5)
+    assert [len(role.policies) for role in roles] == [4, 4, 4]
+    assert roles == synthetic_roles(roles=3, policies=4, selectors=5)
+
+    context = encode_policies([p for role in roles for p in role.policies])
+    requests = synthetic_requests(context, 50)
+    assert len(requests) == 50
+    assert requests == synthetic_requests(context, 50)
+
+
+def test_percentile():
+    input = [([4, 1, 3, 2], 50), ([4, 1, 3, 2], 99), (list(range(100)), 99)]
+    want = [2, 4, 98]
+    got = [percentile(samples, q) for samples, q in input]
+    assert got == want
+
+
+def test_compare_against_baseline():
+    stats = measure(lambda: None, samples=5, number=2, warmup=0)
+    assert stats["p50_us"] <= stats["p99_us"]
+
+    baseline = dict(cases={"a": {"p50_us": 1.0}, "b": {"p50_us": 1.0}})
+    results = dict(
+        cases={
+            "a": {"p50_us": 1.5},
+            "b": {"p50_us": 1.05},
+            "c": {"p50_us": 9.0},
+        }
+    )
+    assert compare(results, baseline, tolerance=0.1) == {"a": 0.5}
@@ -0,0 +1,72 @@
+import uuid
+from typing import List
+
+from kingdom.access import config
+from kingdom.access.base import (
+    Permission,
+    Policy,
+    Resource,
+    Role,
+    Statement,
+    User,
+)
+from kingdom.access.claims import InvalidClaim, decode_claim, encode_claim
+from kingdom.access.context import CompiledPolicyContext
+from kingdom.access.flow import policies_from_payload
+from kingdom.access.types import PolicyContext
+from pytest import raises
+
+
+def test_claim_roundtrip():
+    contexts: List[PolicyContext] = [
+        {},
+        {"account": {}},
+        {"account": {"*": 2, "5f34": 1}},
+        {
+            "product": {"*": 1, "044e": 6, "0e0e": 2, "bc0e": 6, "aac0": 4},
+            "coupon": {"044e": 0, "çç": 7},
+            "user": {"*": 0, "3fa85f64-5717-4562-b3fc-2c963f66afa6": 6},
+        },
+        {"role": {f"{i:032x}": i % 8 for i in range(300)}},
+        {
+            "user": {str(uuid.UUID(int=i << 96 | i)): i % 8 for i in range(50)},
+            "coupon": {str(uuid.UUID(int=2 ** 128 - 1)): 1, "*": 8},
+        },
+    ]
+    for context in contexts:
+        claim = encode_claim(context)
+        assert decode_claim(claim) == context
+        assert CompiledPolicyContext.from_claim(claim).to_dict() == context
+
+
+def test_invalid_claims():
+    claim = encode_claim({"account": {"*": 2, "5f34": 1}})
+    invalid = [
+        "",
+        "%%%%",
+        "AA",  # unknown version
+        claim[:-4],  # truncated
+        claim[:10],
+        "AQIAAQL_AA",  # string not in utf-8
+    ]
+    for corrupted in invalid:
+        with raises(InvalidClaim):
+            decode_claim(corrupted)
+
+
+def test_compact_jwt_payload(monkeypatch):
+    product_policy = Policy(
+        resource=Resource("Product"),
+        permissions=(Permission.UPDATE, Permission.CREATE),
+        conditionals=[Statement("resource.id", "ab4f")],
+    )
+    user = User("abbf", roles=[Role("Store", policies=[product_policy])])
+
+    payload = user.jwt_payload
+    assert "pol" not in payload
+    assert policies_from_payload(payload) == {"product": {"ab4f": 3}}
+
+    monkeypatch.setattr(config, "COMPACT_POLICY_CLAIM", True)
+    payload = user.jwt_payload
+    assert "policies" not in payload
+    assert policies_from_payload(payload) == {"product": {"ab4f": 3}}
@@ -0,0 +1,225 @@
+from typing import List
+
+from kingdom.access.base import Permission, compile_decisions
+from kingdom.access.context import CompiledPolicyContext, FrozenContextErr
+from kingdom.access.flow import (
+    NotEnoughPrivilegesErr,
+    authorize,
+    authorize_many,
+)
+from kingdom.access.types import PolicyContext
+from pytest import raises
+
+CREATE = Permission.CREATE.value
+READ = Permission.READ.value
+UPDATE = Permission.UPDATE.value
+DELETE = Permission.DELETE.value
+
+
+SUP_POLICIES: PolicyContext = {
+    "user": {"*": READ, "00df": READ | UPDATE},
+    "product": {"*": READ | CREATE | UPDATE},
+    "coupon": {"ab4c": READ, "bc3f": READ | UPDATE, "b4a3": DELETE},
+    "account": {"tenant:*": READ, "tenant:42:*": UPDATE, "tenant:4": DELETE},
+}
+
+REQUESTS = [
+    ("user", "READ", ""),
+    ("user", "READ", "00df"),
+    ("user", "UPDATE", "00df"),
+    ("user", "UPDATE", "0f0f"),
+    ("user", "CREATE", ""),
+    ("product", "READ", ""),
+    ("product", "CREATE", ""),
+    ("product", "UPDATE", "ff00"),
+    ("product", "DELETE", "ff00"),
+    ("coupon", "READ", ""),
+    ("coupon", "READ", "bc3f"),
+    ("coupon", "READ", "d3f4"),
+    ("coupon", "UPDATE", "bc3f"),
+    ("coupon", "UPDATE", "ab4c"),
+    ("coupon", "DELETE", "b4a3"),
+    ("coupon", "CREATE", ""),
+    ("ticket", "READ", ""),
+    ("ticket", "CREATE", ""),
+    ("account", "READ", ""),
+    ("account", "READ", "tenant:42:7"),
+    ("account", "READ", "tenant"),
+    ("account", "READ", "other:42:7"),
+    ("account", "UPDATE", "tenant:42:7"),
+    ("account", "UPDATE", "tenant:42:*"),
+    ("account", "UPDATE", "tenant:4"),
+    ("account", "UPDATE", "tenant:43:7"),
+    ("account", "DELETE", "tenant:4"),
+    ("account", "DELETE", "tenant:42"),
+]
+
+
+def _decide(context, resource, operation, selector):
+    try:
+        return authorize(context, resource, operation, selector)
+    except NotEnoughPrivilegesErr:
+        return None
+
+
+def test_compiled_context_matches_plain_context():
+    "Both context flavours must take exactly the same decisions"
+    compiled = CompiledPolicyContext(SUP_POLICIES)
+    for resource, operation, selector in REQUESTS:
+        want = _decide(SUP_POLICIES, resource, operation, selector)
+        got = _decide(compiled, resource, operation, selector)
+        assert got == want, (resource, operation, selector)
+
+
+def test_prefix_wildcards():
+    compiled = CompiledPolicyContext(SUP_POLICIES)
+    for context in (SUP_POLICIES, compiled):
+        assert _decide(context, "account", "READ", "tenant:42:7") == [
+            "tenant:42:7"
+        ]
+        assert _decide(context, "account", "READ", "other:42:7") is None
+        assert _decide(context, "account", "UPDATE", "tenant:42:7") == [
+            "tenant:42:7"
+        ]
+        assert _decide(context, "account", "UPDATE", "tenant:43:7") is None
+
+        allowed, denied = authorize_many(
+            context,
+            resource="account",
+            operation="UPDATE",
+            selectors=["tenant:42:1", "tenant:4", "tenant:42:2", "other"],
+        )
+        assert allowed == ["tenant:42:1", "tenant:42:2"]
+        assert denied == ["tenant:4", "other"]
+
+
+DENIED_POLICIES: PolicyContext = compile_decisions(
+    SUP_POLICIES,
+    {
+        "user": {"00df": UPDATE, "0f0f": READ},
+        "product": {"ff00": UPDATE, "0f0f": READ},
+        "account": {"tenant:42:7": UPDATE, "tenant:4": READ},
+    },
+)
+
+
+def test_denials():
+    compiled = CompiledPolicyContext(DENIED_POLICIES)
+    for context in (DENIED_POLICIES, compiled):
+        for resource, operation, selector in REQUESTS:
+            if not selector:
+                continue
+            want = _decide(SUP_POLICIES, resource, operation, selector)
+            got = _decide(context, resource, operation, selector)
+            if (resource, selector) in {
+                ("user", "00df"),
+                ("product", "ff00"),
+                ("account", "tenant:42:7"),
+                ("account", "tenant:4"),
+            } and operation != "READ":
+                want = None
+            assert got == want, (resource, operation, selector)
+
+        assert _decide(context, "user", "READ", "0f0f") is None
+        assert _decide(context, "account", "READ", "tenant:4") is None
+        assert _decide(context, "account", "READ", "tenant:42:7") == [
+            "tenant:42:7"
+        ]
+        scope = _decide(context, "product", "READ", "")
+        assert "ff00" in scope and "0f0f" not in scope
+        scope = _decide(context, "account", "READ", "")
+        assert "tenant:42:7" in scope and "tenant:4" not in scope
+
+        input = ["READ", "UPDATE", "CREATE"]
+        want = [["00df", "ab12"], [], []]
+        got = [
+            authorize_many(context, "user", operation, ["00df", "0f0f", "ab12"])
+            for operation in input
+        ]
+        assert [allowed for allowed, _ in got] == want
+        allowed, denied = authorize_many(
+            context, "product", "UPDATE", ["00df", "ff00", "0f0f"]
+        )
+        assert (allowed, denied) == (["00df"], ["ff00", "0f0f"])
+        allowed, denied = authorize_many(
+            context,
+            resource="account",
+            operation="UPDATE",
+            selectors=["tenant:42:1", "tenant:42:7", "tenant:4"],
+        )
+        assert allowed == ["tenant:42:1"]
+        allowed, denied = authorize_many(
+            context,
+            resource="account",
+            operation="READ",
+            selectors=["tenant:42:7", "tenant:4", "tenant:5"],
+        )
+        assert allowed == ["tenant:42:7", "tenant:5"]
+
+
+def test_authorize_many_matches_authorize():
+    "A batch decision must be the single decision of each selector"
+    selectors = sorted(
+        {selector for _, _, selector in REQUESTS if selector}
+        | {"ab12", "0f0f", "ff00", "tenant:4:1"}
+    )
+    input: List[PolicyContext] = [
+        SUP_POLICIES,
+        DENIED_POLICIES,
+        {"user": {"*": READ}},
+        {"user": {"*": UPDATE, "ab12": DELETE}},
+    ]
+    for context in input:
+        for flavour in (context, CompiledPolicyContext(context)):
+            for resource in {resource for resource, _, _ in REQUESTS}:
+                for operation in ("READ", "CREATE", "UPDATE", "DELETE"):
+                    allowed, denied = authorize_many(
+                        flavour, resource, operation, selectors
+                    )
+                    want = [
+                        selector
+                        for selector in selectors
+                        if _decide(flavour, resource, operation, selector)
+                    ]
+                    assert allowed == want, (resource, operation)
+                    assert sorted(allowed + denied) == selectors
+
+    assert _decide({"user": {"*": READ}}, "user", "READ", "ab12") == ["ab12"]
+
+
+def test_denied_selectors_hold_back_writes_on_all():
+    "A write on \"*\" must not reach a selector denied that write"
+    context = compile_decisions(
+        {"account": {"*": READ | UPDATE}}, {"account": {"5f34": UPDATE}}
+    )
+    for flavour in (context, CompiledPolicyContext(context)):
+        for selector in ("", "*"):
+            with raises(NotEnoughPrivilegesErr):
+                authorize(flavour, "account", "UPDATE", selector)
+        assert authorize(flavour, "account", "UPDATE", "0000") == ["0000"]
+        assert authorize_many(flavour, "account", "UPDATE", ["*", "0000"]) == (
+            ["0000"],
+            ["*"],
+        )
+
+    assert authorize(context, "account", "READ").is_all
+
+    blocked = compile_decisions(
+        {"account": {"*": READ}}, {"account": {"5f34": READ}}
+    )
+    for flavour in (blocked, CompiledPolicyContext(blocked)):
+        scope = authorize(flavour, "account", "READ")
+        assert "5f34" not in scope and not scope.is_all
+
+
+def test_compiled_context_is_frozen():
+    compiled = CompiledPolicyContext(SUP_POLICIES)
+    with raises(FrozenContextErr):
+        compiled.extra = {}
+
+    with raises(TypeError):
+        compiled["user"]["00df"] = DELETE
+
+    assert compiled.to_dict() == SUP_POLICIES
+    assert "product" in compiled
+    assert "ticket" not in compiled
@@ -1,222 +1,80 @@
+from pytest import raises
+
 from kingdom.access.dsl import (
-    conditionals_split,
-    parse_expression,
-    parse_identifier,
-    parse_identifier_reference,
-    parse_operator,
-    parse_reference,
-    parse_selector,
+    Condition,
+    InvalidConditional,
+    parse_conditionals,
 )
 
 
-def test_conditionals_split():
-    input = [
-        "expr || newexpr",  # valid
-        "expr||newexpr",  # valid
-        "  expr || newexpr    ",  # valid
-        "  expr || ",  # invalid
-        " ||  expr ",  # invalid
-        " ||  expr || ",  # invalid
-        "expr|newexpr",  # invalid
-        "expr   || newexpr||neewexpr||",  # invalid
-        "ex pr   || new expr ||  ",  # invalid
-        "  expr ||| newexpr    ",  # invalid
-        "  expr|||newexpr    ",  # invalid
-    ]
-
-    want = [
-        ("expr", "newexpr"),
-        ("expr", "newexpr"),
-        ("expr", "newexpr"),
-        False,
-        False,
-        False,
-        False,
-        False,
-        False,
-        False,
-        False,
-    ]
-
-    got = [conditionals_split(sequence) for sequence in input]
-    assert got == want
-
-
-def test_parse_identifier():
-    input = [
-        ".id",
-        "resource.id",
-        "   resourceeee.id",
-        "r es ource.id",
-        "resource .id",
-        " r esource.id",
-        "resource..id",
-    ]
-    want = [
-        (False,),
-        ("resource", ".id"),
-        ("resourceeee", ".id"),
-        (False,),
-        (False,),
-        (False,),
-        ("resource", "..id"),
-    ]
-    got = [parse_identifier(i) for i in input]
-    assert got == want
-
-
-def test_parse_reference():
+def test_parse_conditionals():
     input = [
-        ".",
-        ".id==",
-        " .id>",
-        " id==",
-        ".id   === ",
-        "..id..",
-        ".nope    =",
-        ".that!=",
-        "[index]>=",
-        ".fine0  ==",
-        ".name@ <=",
-        ".n a m e ===",
-        ".name >>",
+        "resource.id == '5f34'",
+        "resource.id=='5f34'||resource.id   >= '*'",
+        "  resource.name != 'bob'  ||  account.id<'0012'  ",
+        "resource.id == '5f34' ||",  # invalid
+        "|| resource.id == '5f34'",  # invalid
+        "resource .id == '5f34'",  # invalid
+        "resource. id == '5f34'",  # invalid
+        "resource.id === '5f34'",  # invalid
+        "resource.id == '5f 34'",  # invalid
+        "resource.id == '**'",  # invalid
+        "resource.id == ''",  # invalid
+        "resource.id == '5f34' resource.id == '5f35'",  # invalid
+        "resource.id == '5f34' | resource.id == '5f35'",  # invalid
+        "resource.id == '5f34' ||| resource.id == '5f35'",  # invalid
+        "reso4rce.id == '5f34'",  # invalid
+        "resource.id == 'tenant:*:42'",  # invalid
+        "resource.id == 'tenant:42:*' || resource.id == 'tenant:1'",
+        "   resourceeee.id>'12839712893791823'   ",
+        "resource.id == 'tenant*'",
+        "r es ource.id == '5f34'",  # invalid
+        "resource..id == '5f34'",  # invalid
+        "resource.na me != '5f34'",  # invalid
+        "rsrc!name == '5f34'",  # invalid
+        "resource.fine0 == '5f34'",  # invalid
+        "resource.id = '*'",  # invalid
+        "resource.id >> '*'",  # invalid
+        "resource.id + '*'",  # invalid
+        "resource.id =+ '*'",  # invalid
+        'resource.id == "5f34"',  # invalid
+        "resource.id == '5f34",  # invalid
+        "resource.id == '123123'123123'",  # invalid
+        "resource.id == 'f5f65b65c!!'",  # invalid
+        "resource.id == 'tenant:**'",  # invalid
+        "resource.id == '5f34' || ||",  # invalid
+        "resource.id == '5f34' || resource.id == '5f35' ||",  # invalid
     ]
-
     want = [
-        (False,),
-        ("id", "=="),
-        (False,),
-        (False,),
-        ("id", "=== "),
-        (False,),
-        ("nope", "="),
-        ("that", "!="),
-        (False,),
-        (False,),
-        (False,),
-        (False,),
-        ("name", ">>"),
-    ]
-
-    got = [parse_reference(ref) for ref in input]
-    assert got == want
-
-
-def test_parse_identifier_reference():
-    input = [
-        "resource.id==",
-        "resourceeee.id>=",
-        "r esource.id  ==",
-        "resource .id <=",
-        " r esource.id =",
-        "resource.id  <<",
-        "resource.name <=",
-        "resource.na me !=",
-        "resource.name ===",
-        "rsrc!name ==",
-    ]
-    want = [
-        ("RESOURCE", "ID"),
-        ("RESOURCEEEE", "ID"),
-        False,
-        False,
-        False,
-        ("RESOURCE", "ID"),
-        ("RESOURCE", "NAME"),
-        False,
-        ("RESOURCE", "NAME"),
-        False,
-    ]
-    got = [parse_identifier_reference(expr) for expr in input]
-    assert got == want
-
-
-def test_parse_operator():
-    input = [
-        "== 'd8f7s9d8f7'",  # valid
-        "== '8dfs8d7f9'",  # valid
-        "== ''",  # valid
-        "== \"'21f90912'\"  ",  # invalid
-        "== '21f90912'  ",  # valid
-        "= '*' ",  # invalid
-        '< "ddx"',  # invalid
-        "  < '3030fk30'",  # valid
-        " >    ''",  # valid
-        " >>    ''",  # invalid
-        "=== '*'",  # invalid
-        ">= '2fd04'",  # valid
-        "!= '*'",  # valid
-        " + '*'",  # invalid
-        "-- 'd'",  # invalid
-        "/   'xxvc'",  # invalid
-        "=+ '*'",  # invalid
-        "=- '*'",  # invalid
-    ]
-    want = [
-        ("==", "'d8f7s9d8f7'"),  # valid
-        ("==", "'8dfs8d7f9'"),  # valid
-        ("==", "''"),  # valid
-        (False,),  # invalid
-        ("==", "'21f90912'"),  # valid
-        (False,),  # invalid
-        (False,),  # invalid
-        ("<", "'3030fk30'"),  # valid
-        (">", "''"),  # valid
-        (False,),  # valid
-        (False,),  # invalid
-        (">=", "'2fd04'"),  # valid
-        ("!=", "'*'"),  # valid
-        (False,),  # invalid
-        (False,),  # invalid
-        (False,),  # invalid
-        (False,),  # invalid
-        (False,),  # invalid
-    ]
-    got = [parse_operator(op) for op in input]
-    assert got == want
-
-
-def test_parse_valid_selector():
-    input = [
-        "   '128f12334hjg'",
-        "   '128f12334hjg'",
-        "'12839712893791823'",
-        " '12839712893791823'",
-        " '128f12334hjg'",
-        "'*'",
-        " '*'",
-        " '**'",
-        " '!'",
-        "'12837891ff",
-        "'123123'123123'",
-        "''",
-        "'fff\"dddsd'",
-        "'''",
-        "';1234234fgds00x;;",
-        "'f5f65b65c!!'",
-        "f4'dfadf7'",
-    ]
-
-    want = [
-        ("128f12334hjg",),
-        ("128f12334hjg",),
-        ("12839712893791823",),
-        ("12839712893791823",),
-        ("128f12334hjg",),
-        ("*",),
-        ("*",),
-        (False,),
-        (False,),
-        (False,),
-        (False,),
-        (False,),
-        (False,),
-        (False,),
-        (False,),
-        (False,),
-        (False,),
-    ]
-
-    got = [parse_selector(cond) for cond in input]
-
-    assert got == want
+        (Condition("resource", "id", "==", "5f34"),),
+        (
+            Condition("resource", "id", "==", "5f34"),
+            Condition("resource", "id", ">=", "*"),
+        ),
+        (
+            Condition("resource", "name", "!=", "bob"),
+            Condition("account", "id", "<", "0012"),
+        ),
+    ] + [InvalidConditional] * 13 + [
+        (
+            Condition("resource", "id", "==", "tenant:42:*"),
+            Condition("resource", "id", "==", "tenant:1"),
+        ),
+        (Condition("resourceeee", "id", ">", "12839712893791823"),),
+        (Condition("resource", "id", "==", "tenant*"),),
+    ] + [InvalidConditional] * 16
+
+    assert len(input) == len(want)
+    for sequence, expected in zip(input, want):
+        if expected is InvalidConditional:
+            with raises(InvalidConditional):
+                parse_conditionals(sequence)
+        else:
+            assert parse_conditionals(sequence) == expected
+
+
+def test_parse_conditionals_is_memoized():
+    chain = " || ".join(f"resource.id == '{i:04x}'" for i in range(2000))
+    parsed = parse_conditionals(chain)
+    assert len(parsed) == 2000
+    assert parse_conditionals(chain) is parsed
@@ -1,10 +1,13 @@
 from typing import List, Tuple
 
 from kingdom.access.base import Permission, Policy, Resource
+from kingdom.access.context import CompiledPolicyContext, fingerprint
 from kingdom.access.flow import (
     AccessRequest,
+    DecisionCache,
     NotEnoughPrivilegesErr,
     authorize,
+    authorize_many,
     check_permission,
     get_read_scope,
     is_write_allowed,
@@ -12,10 +15,10 @@ from kingdom.access.flow import (
 from kingdom.access.types import PolicyContext
 from pytest import raises
 
-CREATE = Permission.CREATE | 0
-READ = Permission.READ | 0
-UPDATE = Permission.UPDATE | 0
-DELETE = Permission.DELETE | 0
+CREATE = Permission.CREATE.value
+READ = Permission.READ.value
+UPDATE = Permission.UPDATE.value
+DELETE = Permission.DELETE.value
 
 
 class TestAuthorize:
@@ -128,6 +131,103 @@ class TestAuthorize:
         assert scope == ["3043"]
 
 
+class TestAuthorizeMany:
+    fn = authorize_many
+
+    policies: PolicyContext = {
+        "user": {"*": READ | CREATE},
+        "coupon": {
+            "ab4c": READ,
+            "bc3f": READ | UPDATE,
+            "cc4a": UPDATE | DELETE,
+        },
+    }
+
+    def test_partition_keeps_order(self):
+        for context in (self.policies, CompiledPolicyContext(self.policies)):
+            allowed, denied = authorize_many(
+                context,
+                resource="coupon",
+                operation="UPDATE",
+                selectors=["cc4a", "0f0f", "ab4c", "bc3f"],
+            )
+            assert allowed == ["cc4a", "bc3f"]
+            assert denied == ["0f0f", "ab4c"]
+
+            allowed, denied = authorize_many(
+                context,
+                resource="coupon",
+                operation="READ",
+                selectors=["cc4a", "0f0f", "ab4c"],
+            )
+            assert allowed == ["cc4a", "ab4c"]
+            assert denied == ["0f0f"]
+
+    def test_all_or_nothing(self):
+        selectors = [f"{i:04x}" for i in range(10000)]
+        for context in (self.policies, CompiledPolicyContext(self.policies)):
+            assert authorize_many(
+                context, resource="user", operation="CREATE",
+                selectors=selectors,
+            ) == (selectors, [])
+
+            assert authorize_many(
+                context, resource="user", operation="DELETE",
+                selectors=selectors,
+            ) == ([], selectors)
+
+            assert authorize_many(
+                context, resource="ticket", operation="READ",
+                selectors=selectors,
+            ) == ([], selectors)
+
+
+class TestDecisionCache:
+    policies: PolicyContext = {
+        "user": {"*": READ | CREATE},
+        "coupon": {"ab4c": READ, "bc3f": READ | UPDATE},
+    }
+
+    def test_repeated_decisions_are_hits(self):
+        cache = DecisionCache(maxsize=8)
+        compiled = CompiledPolicyContext(self.policies)
+        digest = fingerprint(self.policies)
+        assert compiled.fingerprint == digest
+        for _ in range(3):
+            assert cache.authorize(compiled, "user", "READ") == ["*"]
+            assert cache.authorize(
+                self.policies, "coupon", "UPDATE", "bc3f", digest
+            ) == ["bc3f"]
+            with raises(NotEnoughPrivilegesErr):
+                cache.authorize(compiled, "coupon", "UPDATE", "ab4c")
+
+        assert (cache.hits, cache.misses) == (6, 3)
+        assert cache.hit_rate == 6 / 9
+
+        # Same context, same fingerprint, whatever its key order.
+        reordered = dict(reversed(list(self.policies.items())))
+        assert cache.authorize(reordered, "user", "READ") == ["*"]
+        assert cache.hits == 7
+
+        other = {"user": {"00df": READ}}
+        with raises(NotEnoughPrivilegesErr):
+            cache.authorize(other, "user", "CREATE")
+        assert cache.misses == 4
+
+    def test_cache_is_bounded(self):
+        cache = DecisionCache(maxsize=2)
+        for selector in ("ab4c", "bc3f", "ab4c"):
+            cache.authorize(self.policies, "coupon", "READ", selector)
+        assert len(cache) == 2
+        assert (cache.hits, cache.misses) == (1, 2)
+        cache.authorize(self.policies, "user", "READ")
+        cache.authorize(self.policies, "coupon", "READ", "bc3f")
+        assert (cache.hits, cache.misses) == (1, 4)
+
+        cache.clear()
+        assert len(cache) == 0 and cache.hit_rate == 0.0
+
+
 class TestReadPermission:
     "Test permissions on a read scenario"
     fn = get_read_scope
@@ -0,0 +1,26 @@
+import json
+
+from kingdom.access import claims, jwt
+from kingdom.access.interning import intern_context
+
+
+def _strings(context):
+    return [
+        string
+        for resource, selector_perm in context.items()
+        for string in (resource, *selector_perm)
+    ]
+
+
+def test_decoded_contexts_share_strings():
+    raw = '{"coupon": {"5f34": 8, "*": 2}, "account-%d": {"ab4c": 4}}'
+    contexts = [
+        intern_context(json.loads(raw % 1)),
+        intern_context(json.loads(raw % 1)),
+        claims.decode_claim(claims.encode_claim(json.loads(raw % 1))),
+        jwt.verify(jwt.encode({"policies": json.loads(raw % 1)}))["policies"],
+    ]
+    first = _strings(contexts[0])
+    for context in contexts[1:]:
+        assert context == contexts[0]
+        assert all(a is b for a, b in zip(first, _strings(context)))
@@ -0,0 +1,50 @@
+import time
+from datetime import datetime, timedelta
+
+from kingdom.access import jwt
+from kingdom.access.jwt import InvalidToken, TokenCache
+from pytest import raises
+
+
+class Clock:
+    now = time.time()
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_verified_tokens_are_cached_until_expiration():
+    clock = Clock()
+    cache = TokenCache(maxsize=2, clock=clock)
+    expiration = datetime.utcnow() + timedelta(minutes=30)
+    token = jwt.encode(dict(sub="abbf", exp=expiration))
+
+    payload = cache.decode(token, jwt.verify)
+    assert payload["sub"] == "abbf"
+    assert cache.decode(token, jwt.verify) is payload
+    assert cache.decode(token.decode("utf-8"), jwt.verify) is payload
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    clock.now += 31 * 60
+    assert cache.get(token) is None
+    assert len(cache) == 0
+
+
+def test_cache_is_bounded_and_skips_invalid_tokens():
+    cache = TokenCache(maxsize=2)
+    expiration = datetime.utcnow() + timedelta(minutes=30)
+    tokens = [
+        jwt.encode(dict(sub=str(i), exp=expiration)) for i in range(3)
+    ]
+    for token in tokens:
+        cache.decode(token, jwt.verify)
+    assert len(cache) == 2
+    assert cache.get(tokens[0]) is None
+
+    # No expiration, no caching
+    cache.decode(jwt.encode(dict(sub="abbf")), jwt.verify)
+    assert len(cache) == 2
+
+    with raises(InvalidToken):
+        cache.decode(b"not.a.token", jwt.verify)
+    assert cache.get(b"not.a.token") is None
@@ -0,0 +1,84 @@
+import random
+
+from kingdom.access.base import compile_decisions, encode_policies
+from kingdom.access.benchmarks.generators import (
+    synthetic_requests,
+    synthetic_roles,
+)
+from kingdom.access.flow import NotEnoughPrivilegesErr, authorize
+from kingdom.access.matrix import PermissionMatrix
+from kingdom.access.types import PolicyContext
+from pytest import raises
+
+
+def _who_can(contexts, resource, operation, selector):
+    allowed = []
+    for user, context in contexts.items():
+        try:
+            authorize(context, resource, operation, selector)
+            allowed.append(user)
+        except NotEnoughPrivilegesErr:
+            pass
+    return allowed
+
+
+def _contexts(users, seed):
+    rng = random.Random(seed)
+    roles = synthetic_roles(roles=8, policies=6, selectors=4, resources=3)
+    return {
+        f"user{u}": encode_policies(
+            [p for role in rng.sample(roles, 2) for p in role.policies]
+        )
+        for u in range(users)
+    }
+
+
+def test_matrix_matches_authorize():
+    contexts = _contexts(50, seed=1)
+    contexts["prefixed"] = {"resource0": {"tenant:*": 8, "tenant:4*": 2}}
+    contexts["denied"] = compile_decisions(
+        {"resource0": {"*": 10, "tenant:4*": 4}},
+        {"resource0": {"tenant:42": 2, "tenant:52": 8}},
+    )
+    matrix = PermissionMatrix(contexts)
+
+    merged: PolicyContext = {}
+    for context in contexts.values():
+        for resource, selector_perm in context.items():
+            merged.setdefault(resource, {}).update(selector_perm)
+    requests = synthetic_requests(merged, 300) + [
+        ("resource0", "READ", "tenant:42"),
+        ("resource0", "UPDATE", "tenant:42"),
+        ("resource0", "UPDATE", "tenant:52"),
+        ("resource0", "READ", "tenant:52"),
+        ("resource0", "READ", "other"),
+        ("resource0", "DELETE", "tenant:42"),
+        ("resource0", "DELETE", "tenant:43"),
+        ("resource0", "READ", ""),
+    ]
+    for resource, operation, selector in requests:
+        want = _who_can(contexts, resource, operation, selector)
+        got = matrix.who_can(resource, operation, selector)
+        assert sorted(got) == sorted(want), (resource, operation, selector)
+
+
+def test_matrix_rows_are_updated_incrementally():
+    matrix = PermissionMatrix(
+        {"abbf": {"coupon": {"*": 8}}, "0bf3": {"coupon": {"ab4c": 10}}}
+    )
+    assert matrix.who_can("coupon", "UPDATE", "ab4c") == ["0bf3"]
+
+    matrix.set_row("abbf", {"coupon": {"*": 2}})
+    matrix.set_row("0bf3", {"user": {"00df": 8}})
+    assert matrix.who_can("coupon", "UPDATE", "ab4c") == ["abbf"]
+    assert matrix.who_can("user", "READ") == ["0bf3"]
+
+    matrix.remove_row("abbf")
+    assert matrix.who_can("coupon", "UPDATE", "ab4c") == []
+    matrix.set_row("c0fe", {"coupon": {"ab4c": 8}})
+    assert matrix.users == ["c0fe", "0bf3"]
+    assert matrix.who_can("coupon", "READ") == ["c0fe"]
+    assert len(matrix) == 2 and "abbf" not in matrix
+
+    with raises(ValueError):
+        matrix.set_row("abbf", {"coupon": {"*": 0x80}})
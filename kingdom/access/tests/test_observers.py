@@ -0,0 +1,74 @@
+from kingdom.access import jwt, observers
+from kingdom.access.base import Permission
+from kingdom.access.flow import (
+    AccessRequest,
+    NotEnoughPrivilegesErr,
+    authorize,
+    check_permission,
+)
+from kingdom.access.observers import Decision, DecisionStats
+from pytest import fixture, raises
+
+READ = Permission.READ.value
+UPDATE = Permission.UPDATE.value
+
+
+@fixture
+def stats():
+    stats = DecisionStats()
+    observers.attach(stats)
+    yield stats
+    observers.detach(stats)
+
+
+def test_decisions_are_counted(stats):
+    context = {"coupon": {"ab4c": READ | UPDATE}}
+    authorize(context, resource="coupon", operation="READ")
+    authorize(context, resource="coupon", operation="UPDATE", selector="ab4c")
+    with raises(NotEnoughPrivilegesErr):
+        authorize(context, resource="user", operation="READ")
+    check_permission(context, AccessRequest("UPDATE", "coupon", "0000"))
+
+    assert stats.counts == {
+        ("authorize", "coupon", "READ"): [1, 0],
+        ("authorize", "coupon", "UPDATE"): [1, 0],
+        ("authorize", "user", "READ"): [0, 1],
+        ("check_permission", "coupon", "READ"): [1, 0],
+        ("check_permission", "coupon", "UPDATE"): [1, 1],
+        ("check_permission", "user", "READ"): [0, 1],
+    }
+    histogram = stats.histograms["authorize", "coupon", "READ"]
+    assert sum(histogram) == 1
+    assert stats.percentile(("authorize", "coupon", "READ"), 99) > 0
+    assert len(stats.snapshot()) == 6
+
+
+def test_jwt_decode_is_observed(stats):
+    token = jwt.encode(dict(sub="abbf"))
+    jwt.decode(token)
+    with raises(jwt.InvalidToken):
+        jwt.decode(token + b"x")
+    assert stats.counts == {("jwt.decode", None, None): [1, 1]}
+
+
+def test_failing_observer_never_fails_a_decision():
+    seen = []
+
+    def failing(decision: Decision):
+        seen.append(decision)
+        raise RuntimeError()
+
+    observers.attach(failing)
+    try:
+        assert authorize({"coupon": {"*": READ}}, "coupon", "READ") == ["*"]
+    finally:
+        observers.detach(failing)
+
+    assert [decision.event for decision in seen] == [
+        "check_permission",
+        "authorize",
+    ]
+    assert all(decision.allowed for decision in seen)
+    assert not observers.active
+    authorize({"coupon": {"*": READ}}, "coupon", "READ")
+    assert len(seen) == 2
@@ -0,0 +1,77 @@
+from kingdom.access.dsl import Condition
+from kingdom.access.predicates import (
+    InvalidPredicate,
+    Predicate,
+    compile_conditionals,
+)
+from pytest import raises
+
+ROWS = [
+    {"id": "044e", "level": 1, "name": "bob:ops"},
+    {"id": "0e0e", "level": 3, "name": "alice"},
+    {"id": "5f34", "level": 5, "name": "carol"},
+    {"id": "bc0e", "level": 7, "name": "dave:ops"},
+]
+COLUMNS = {
+    "id": [row["id"] for row in ROWS],
+    "level": [row["level"] for row in ROWS],
+    "name": [row["name"] for row in ROWS],
+}
+
+
+def test_every_valid_operator():
+    input = [
+        ("resource.id == '5f34'", None),
+        ("resource.id != '5f34'", None),
+        ("resource.level > '3'", {"level": int}),
+        ("resource.level < '3'", {"level": int}),
+        ("resource.level >= '3'", {"level": int}),
+        ("resource.level <= '3'", {"level": int}),
+        ("resource.name >= 'c'", None),
+        ("resource.id == '5f34' || resource.level <= '1'", {"level": int}),
+        ("resource.id == '5f34' || resource.name == 'dave:ops'", None),
+        ("resource.id == '*'", None),
+        ("resource.id != '*'", None),
+        ("resource.id != '*' || resource.name == 'bob:ops'", None),
+        ("resource.id == '*' || resource.name == 'bob'", None),
+        ("resource.name == 'dave:*' || resource.name == 'bob:*'", None),
+        ("resource.name != 'dave:*'", None),
+    ]
+    want = [
+        [False, False, True, False],
+        [True, True, False, True],
+        [False, False, True, True],
+        [True, False, False, False],
+        [False, True, True, True],
+        [True, True, False, False],
+        [False, False, True, True],
+        [True, False, True, False],
+        [False, False, True, True],
+        [True, True, True, True],
+        [False, False, False, False],
+        [True, False, False, False],
+        [True, True, True, True],
+        [True, False, False, True],
+        [True, True, True, False],
+    ]
+
+    for (sequence, casts), expected in zip(input, want):
+        predicate = compile_conditionals(sequence, casts)
+        assert predicate.evaluate(COLUMNS) == expected, sequence
+        assert [predicate(row) for row in ROWS] == expected, sequence
+        assert predicate.filter(ROWS) == [
+            row for row, passed in zip(ROWS, expected) if passed
+        ]
+
+
+def test_parsed_tuples_are_accepted():
+    predicate = compile_conditionals([("resource", "id", "==", "0e0e")])
+    assert predicate.filter(ROWS) == [ROWS[1]]
+
+
+def test_wildcard_cannot_be_ordered():
+    with raises(InvalidPredicate):
+        Predicate(Condition("resource", "id", ">=", "*"))
+
+    with raises(InvalidPredicate):
+        Predicate(Condition("resource", "id", "<", "tenant:*"))
@@ -0,0 +1,66 @@
+from kingdom.access.context import CompiledPolicyContext, PrefixIndex
+from kingdom.access.flow import AccessRequest, get_read_scope
+from kingdom.access.scope import ALL_SCOPE, EMPTY_SCOPE, Scope, selector_scope
+from pytest import raises
+
+
+def test_scope_is_list_like():
+    scope = Scope({"ab4c": 8, "bc3f": 10, "00df": 2}.keys())
+    assert scope == ["ab4c", "bc3f", "00df"]
+    assert scope != ["ab4c", "bc3f"]
+    assert list(scope) == ["ab4c", "bc3f", "00df"]
+    assert len(scope) == 3 and scope
+    assert scope[0] == "ab4c" and scope[-1] == "00df"
+    assert scope[1:] == ["bc3f", "00df"]
+    with raises(IndexError):
+        scope[3]
+
+    assert not EMPTY_SCOPE
+    assert EMPTY_SCOPE == []
+    assert ALL_SCOPE == ["*"]
+
+
+def test_scope_membership():
+    scope = Scope({"ab4c": 8, "tenant:*": 8}.keys())
+    assert "ab4c" in scope
+    assert "tenant:4" not in scope
+    assert "*" not in scope and not scope.is_all
+
+    owned = {"ab4c": 8, "tenant:*": 8}
+    prefixed = Scope(owned.keys(), PrefixIndex(owned).match)
+    assert "tenant:4" in prefixed
+    assert "other:4" not in prefixed
+
+    assert ALL_SCOPE.is_all
+    assert "anything" in ALL_SCOPE
+
+    excluded = Scope(("*",), excluded={"ab4c"})
+    assert not excluded.is_all and "anything" in excluded
+    assert "ab4c" not in excluded
+    prefixed = Scope(owned.keys(), PrefixIndex(owned).match, {"ab4c"})
+    assert "ab4c" not in prefixed and "tenant:4" in prefixed
+    assert prefixed == ["tenant:*"] and len(prefixed) == 1
+
+
+def test_read_scope_is_a_view_over_owned_selectors():
+    owned = {"ab4c": 8, "bc3f": 10}
+    scope = get_read_scope(
+        {"coupon": owned}, AccessRequest("READ", "coupon", "*")
+    )
+    assert scope == ["ab4c", "bc3f"]
+
+    owned["d3f4"] = 8
+    assert "d3f4" in scope
+
+    compiled = CompiledPolicyContext(
+        {"coupon": {"ab4c": 8, "tenant:*": 8}, "user": {"*": 8}}
+    )
+    assert compiled.read_scope("user").is_all
+    assert "tenant:42" in compiled.read_scope("coupon")
+    assert compiled.read_scope("coupon") is compiled.read_scope("coupon")
+    # Selectors contemplated by "*" or a prefix share a single scope.
+    assert compiled.read_scope("user", "5f34") == ["5f34"]
+    assert compiled.read_scope("user", "5f34") is selector_scope("5f34")
+    assert compiled.read_scope("coupon", "tenant:42") is selector_scope(
+        "tenant:42"
+    )
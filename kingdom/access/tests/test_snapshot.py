@@ -0,0 +1,73 @@
+import os
+
+from kingdom.access.context import CompiledPolicyContext
+from kingdom.access.flow import NotEnoughPrivilegesErr, authorize
+from kingdom.access.snapshot import (
+    InvalidSnapshot,
+    Snapshot,
+    SnapshotReader,
+    pack_snapshot,
+    publish,
+)
+from kingdom.access.tests.test_context import REQUESTS, SUP_POLICIES
+from pytest import raises
+
+CONTEXTS = {
+    "abbf": SUP_POLICIES,
+    "0bf3": {"coupon": {"ab4c": 8}, "ünïcode": {"sélecteur": 2}},
+    "c0fe": {},
+}
+
+
+def _decide(context, resource, operation, selector):
+    "Allowed scope, sorted as snapshots sort selectors, None if denied"
+    try:
+        return sorted(authorize(context, resource, operation, selector))
+    except NotEnoughPrivilegesErr:
+        return None
+
+
+def test_snapshot_roundtrip():
+    snapshot = Snapshot(pack_snapshot(CONTEXTS))
+    assert snapshot.to_dict() == CONTEXTS
+    assert sorted(snapshot) == sorted(CONTEXTS)
+    assert "dead" not in snapshot
+    assert "user" in snapshot["abbf"]
+    assert "ticket" not in snapshot["abbf"]
+    assert snapshot["0bf3"]["ünïcode"] == {"sélecteur": 2}
+    with raises(KeyError):
+        snapshot["abbf"]["coupon"]["d3f4"]
+
+
+def test_snapshot_contexts_take_the_same_decisions():
+    snapshot = Snapshot(pack_snapshot(CONTEXTS))
+    context = snapshot["abbf"]
+    compiled = CompiledPolicyContext(context)
+    for resource, operation, selector in REQUESTS:
+        want = _decide(SUP_POLICIES, resource, operation, selector)
+        assert _decide(context, resource, operation, selector) == want
+        assert _decide(compiled, resource, operation, selector) == want
+
+
+def test_invalid_snapshots():
+    packed = pack_snapshot(CONTEXTS)
+    input = [b"", b"JUNK" + packed[4:], packed[:40], packed[:-1]]
+    for data in input:
+        with raises(InvalidSnapshot):
+            Snapshot(data)
+
+
+def test_publish_swaps_snapshots_atomically(tmp_path):
+    path = str(tmp_path / "policies")
+    publish(path, CONTEXTS)
+    reader = SnapshotReader(path, interval=0)
+    previous = reader.current
+    assert previous["0bf3"]["coupon"] == {"ab4c": 8}
+    assert reader.refresh() is False
+
+    publish(path, {"0bf3": {"coupon": {"ab4c": 10}}})
+    assert reader.current["0bf3"]["coupon"] == {"ab4c": 10}
+    assert "abbf" not in reader.current
+    # Views of the previous snapshot stay valid.
+    assert previous["0bf3"]["coupon"] == {"ab4c": 8}
+    assert os.listdir(tmp_path) == ["policies"]
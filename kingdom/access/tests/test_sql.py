@@ -0,0 +1,61 @@
+from kingdom.access.scope import Scope
+from kingdom.access.sql import conditionals_clause, scope_clause
+from sqlalchemy import column, select, table
+from sqlalchemy.dialects import postgresql
+
+users = table("users", column("id"), column("level"))
+
+
+def compile(clause) -> str:
+    query = select([users.c.id]).where(clause)
+    compiled = query.compile(
+        dialect=postgresql.dialect(),
+        compile_kwargs={"literal_binds": True},
+    )
+    return str(compiled).split("WHERE ")[1]
+
+
+def test_scope_clause():
+    assert compile(scope_clause(users.c.id, ["*"])) == "true"
+    assert compile(scope_clause(users.c.id, [])) == "false"
+    assert (
+        compile(scope_clause(users.c.id, ["5f34", "0bf3"]))
+        == "users.id IN ('5f34', '0bf3')"
+    )
+    assert compile(scope_clause(users.c.id, ["5f34", "t_1:%:*"])) == (
+        r"users.id IN ('5f34') OR users.id LIKE 't\\_1:\\%%:%%' ESCAPE '\\'"
+    )
+
+    excluded = Scope(["*"], excluded={"0bf3", "5f34"})
+    assert compile(scope_clause(users.c.id, excluded)) == (
+        "users.id NOT IN ('0bf3', '5f34')"
+    )
+    excluded = Scope(["t:*"], excluded={"t:1"})
+    assert compile(scope_clause(users.c.id, excluded)) == (
+        r"users.id LIKE 't:%%' ESCAPE '\\' AND users.id NOT IN ('t:1')"
+    )
+
+
+def test_conditionals_clause():
+    columns = {"id": users.c.id, "level": users.c.level}
+    input = [
+        "resource.id == '5f34'",
+        "resource.id == '5f34' || resource.level >= '3'",
+        "resource.id != '5f34' || resource.level < '3'",
+        "resource.id == '*' || resource.level < '3'",
+        "resource.id != '*'",
+        "resource.id != 'tenant:*'",
+    ]
+    want = [
+        "users.id = '5f34'",
+        "users.id = '5f34' OR users.level >= 3",
+        "users.id != '5f34' OR users.level < 3",
+        "true",
+        "false",
+        r"users.id NOT LIKE 'tenant:%%' ESCAPE '\\'",
+    ]
+    got = [
+        compile(conditionals_clause(columns, seq, casts={"level": int}))
+        for seq in input
+    ]
+    assert got == want
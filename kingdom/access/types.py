@@ -1,5 +1,7 @@
 from typing import Dict, List, Optional, Tuple
 
+from kingdom.access.scope import Scope
+
 # Pure.
 ResourceAlias = str
 Selector = str
@@ -10,6 +12,6 @@ JWT = bytes
 # Derived.
 SelectorPermissionMap = Dict[Selector, PermissionInt]
 PolicyContext = Dict[ResourceAlias, SelectorPermissionMap]
-Scope = List[Selector]
-AuthResponse = Tuple[Scope, UserKey]
+AuthResponse = Tuple[PolicyContext, UserKey]
+Partition = Tuple[List[Selector], List[Selector]]
 Payload = Dict
@@ -1,6 +1,7 @@
 import jwt
 from graphql import GraphQLError
 
+from kingdom.access.jwt import TokenCache
 from src.auth import config
 from src.core.exceptions import ServerException
 
@@ -10,7 +11,15 @@ class InvalidToken(ServerException):
         super().__init__("Invalid Token")
 
 
+# Verified tokens, until they expire. Must be cleared if the secret changes.
+token_cache = TokenCache()
+
+
 def parse_token(token: str) -> dict:
+    return token_cache.decode(token, verify_token)
+
+
+def verify_token(token: str) -> dict:
     try:
         return jwt.decode(
             jwt=token,
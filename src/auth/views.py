@@ -1,8 +1,16 @@
 from typing import List, Dict, Optional, Any
 
+from sqlalchemy import MetaData, func, select
+
+from kingdom.access.sql import scope_clause
+from kingdom.access.types import Scope
 from src.core.utils import group_rows, create_connection
+from src.auth.adapters import orm
 from src.auth.services import unit_of_work
 
+# The ORM table definition, on a metadata of its own: it's only read here.
+users_view = orm.users(MetaData())
+
 
 def query_role(
     code: str, uow: unit_of_work.AuthSqlAlchemyUnitOfWork
@@ -127,21 +135,30 @@ def query_user(
 
 @create_connection
 def query_users(
-    uow: unit_of_work.AuthSqlAlchemyUnitOfWork, pagination_info: Dict
+    uow: unit_of_work.AuthSqlAlchemyUnitOfWork,
+    pagination_info: Dict,
+    scope: Optional[Scope] = None,
 ) -> Any:
-    with uow:
-        users = uow.session.execute(
-            """
-            SELECT access_key, name, email, created_at,
-            COUNT(*) OVER() AS elements_count
-            FROM users
-            ORDER BY name
-            LIMIT :limit
-            OFFSET :offset
-            """,
-            dict(
-                offset=pagination_info["offset"],
-                limit=pagination_info["limit"],
-            ),
+    """Lists users. If a read `scope` of user ids is given (see
+    kingdom.access.flow.authorize), it is applied by Postgres itself so
+    pagination and elements_count only consider readable users."""
+    query = (
+        select(
+            [
+                users_view.c.access_key,
+                users_view.c.name,
+                users_view.c.email,
+                users_view.c.created_at,
+                func.count().over().label("elements_count"),
+            ]
         )
+        .order_by(users_view.c.name)
+        .limit(pagination_info["limit"])
+        .offset(pagination_info["offset"])
+    )
+    if scope is not None:
+        query = query.where(scope_clause(users_view.c.id, scope))
+
+    with uow:
+        users = uow.session.execute(query)
     return [dict(user) for user in users]
@@ -1,28 +1,103 @@
-from typing import Dict
+import functools
+import inspect
+from concurrent.futures import (
+    Executor,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+)
+from typing import Any, Callable, Dict, Optional
 
 from src.core import messagebus, utils
 from src.core.ports.unit_of_work import AbstractUnitOfWork
 
+THREAD = "thread"
+PROCESS = "process"
+EXECUTORS = {THREAD: ThreadPoolExecutor, PROCESS: ProcessPoolExecutor}
+
+
+class OffloadNotAllowed(ValueError):
+    def __init__(self, handler: Callable, reason: str):
+        super().__init__(
+            f"Handler {handler.__name__} can't run on an executor, {reason}"
+        )
+
+
+def with_frame_uow(handler: Callable) -> Callable:
+    "Passes `handler` the unit of work of the message being handled"
+
+    @functools.wraps(handler)
+    def bound(message: Any) -> Any:
+        return handler(message, uow=messagebus.current_frame().uow)
+
+    return bound
+
 
 def create(
     dependencies: Dict,
     command_handlers: Dict,
     event_handlers: Dict,
     uow: AbstractUnitOfWork,
+    concurrent: bool = False,
+    max_concurrency: Optional[int] = None,
+    executors: Optional[Dict[Callable, str]] = None,
+    max_workers: Optional[int] = None,
+    uow_factory: Optional[Callable[[], AbstractUnitOfWork]] = None,
 ) -> messagebus.MessageBus:
     """
     Creates a message bus with its handlers dependencies set programmatically
     Default dependencies do matter and are used on production environments
+
+    `concurrent` and `max_concurrency` set how handlers of a same event run,
+    see MessageBus
+
+    Handlers run on the event loop, coroutine ones awaited. `executors`
+    opts sync handlers out of it: a `THREAD` handler runs on a pool of at
+    most `max_workers` threads, e.g. one sending emails, and a `PROCESS`
+    handler on a pool of processes, e.g. a CPU bound one hashing passwords,
+    and gives its result back by returning it. Handlers working with the
+    unit of work stay on the event loop, as its session isn't thread safe
+    and a process would only get a copy of it
+
+    Given a `uow_factory`, every `handle` call works with a unit of work of
+    its own, which handlers get as their `uow` argument, see MessageBus
     """
+    kinds = executors or {}
+    unknown = set(kinds.values()) - set(EXECUTORS)
+    if unknown:
+        raise ValueError(f"Unknown handler executors {sorted(unknown)}")
+    pools: Dict[str, Executor] = {}
+    # Dependencies of handlers getting the unit of work of each call.
+    per_call = {
+        name: dependency
+        for name, dependency in dependencies.items()
+        if name != "uow"
+    }
+
+    def inject(handler: Callable) -> Callable:
+        params = inspect.signature(handler).parameters
+        kind = kinds.get(handler)
+        if kind is None:
+            if uow_factory is not None and "uow" in params:
+                return with_frame_uow(
+                    utils.inject_dependencies(handler, per_call)
+                )
+            return utils.inject_dependencies(handler, dependencies)
+        if inspect.iscoroutinefunction(handler):
+            raise OffloadNotAllowed(handler, "it's a coroutine function")
+        if "uow" in params or any(
+            dependencies.get(param) is uow for param in params
+        ):
+            raise OffloadNotAllowed(handler, "it uses the unit of work")
+        if kind not in pools:
+            pools[kind] = EXECUTORS[kind](max_workers=max_workers)
+        return utils.inject_dependencies(handler, dependencies, pools[kind])
+
     command_injected = {
-        command_type: utils.inject_dependencies(command_handler, dependencies)
+        command_type: inject(command_handler)
         for command_type, command_handler in command_handlers.items()
     }
     event_injected = {
-        event_type: [
-            utils.inject_dependencies(handler, dependencies)
-            for handler in event_handlers
-        ]
+        event_type: [inject(handler) for handler in event_handlers]
         for event_type, event_handlers in event_handlers.items()
     }
     return messagebus.MessageBus(
@@ -30,4 +105,8 @@ def create(
         event_handlers=event_injected,
         command_handlers=command_injected,
         dependencies=dependencies,
+        concurrent=concurrent,
+        max_concurrency=max_concurrency,
+        executors=list(pools.values()),
+        uow_factory=uow_factory,
     )
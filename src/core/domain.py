@@ -20,6 +20,8 @@ class Aggregate:
 
 
 class Message:
+    """`delay`, in seconds, defers a message's handling by the message bus,
+    and among messages due together, those of higher `priority` go first"""
     kind: str
     raised_at: datetime
 
@@ -28,6 +30,7 @@ class Message:
         self.kind = self.__class__.__name__
         self.raised_at = datetime.now()
         self.delay = 0
+        self.priority = 0
 
     def __str__(self) -> str:
         return str(self.__repr__())
@@ -1,5 +1,23 @@
+import asyncio
+import heapq
+import inspect
 import logging
-from typing import Any, Callable, Dict, List, Type
+from collections import deque
+from concurrent.futures import Executor
+from contextvars import Context, ContextVar
+from dataclasses import dataclass, field
+from itertools import count
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Type,
+)
 
 from src.core.ports import unit_of_work
 from src.core.domain import Command, Event, Message
@@ -11,6 +29,37 @@ class UnknownMessage(Exception):
     pass
 
 
+@dataclass
+class DispatchFrame:
+    """State of one `MessageBus.handle` call: the message it was called with,
+    the unit of work its handlers use and the queue of messages it still has
+    to handle"""
+    message: Message
+    uow: unit_of_work.AbstractUnitOfWork
+    queue: Deque[Message] = field(default_factory=deque)
+
+
+class Scheduled(NamedTuple):
+    due: float
+    priority: int
+    sequence: int
+    message: Message
+
+
+# Tasks started by a `handle` call, e.g. concurrent event handlers, inherit
+# its context and so its frame, while concurrent calls each get their own.
+dispatch_frame: ContextVar[Optional[DispatchFrame]] = ContextVar(
+    "dispatch_frame", default=None
+)
+
+
+def current_frame() -> DispatchFrame:
+    frame = dispatch_frame.get()
+    if frame is None:
+        raise RuntimeError("No message is being handled")
+    return frame
+
+
 class MessageBus:
     """A MessageBus has only one responsibility:
     - Controlling execution flow in service layer
@@ -19,41 +68,198 @@ class MessageBus:
     It does that by operating a few tasks:
     1. Maps events to handlers
     2. Injects adapters' dependencies in those handlers
-    3. Chains event execution flow by consuming aggregate's event store"""
+    3. Chains event execution flow by consuming aggregate's event store
+
+    Handlers of an event run one after another by default. With
+    `concurrent` set, they run as concurrent asyncio tasks instead, at most
+    `max_concurrency` at once per event when it's set. Either way a failing
+    event handler is logged and doesn't stop the others.
+
+    `executors` are the pools sync handlers are offloaded to, see
+    bootstrap.create, and are shut down along with the bus.
+
+    The queue of a `handle` call lives in its DispatchFrame, scoped to the
+    call's context, along with the unit of work whose events it collects.
+    Given a `uow_factory`, every call gets a unit of work of its own, so
+    concurrent calls on one event loop run in parallel. Otherwise they share
+    `uow` and run one at a time. A `handle` call made while handling a
+    message uses that message's unit of work.
+
+    Messages with a `delay` are scheduled instead of handled right away:
+    they wait in a heap ordered by due time until a background task, started
+    with the first of them, hands them to `handle`. Messages falling due
+    together are handled by decreasing `priority`, then in due order."""
     def __init__(
         self,
         uow: unit_of_work.AbstractUnitOfWork,
         event_handlers: Dict[Type[Event], List[Callable]],
         command_handlers: Dict[Type[Command], Callable],
         dependencies: Dict[str, Any],
+        concurrent: bool = False,
+        max_concurrency: Optional[int] = None,
+        executors: Optional[List[Executor]] = None,
+        uow_factory: Optional[
+            Callable[[], unit_of_work.AbstractUnitOfWork]
+        ] = None,
     ):
+        if max_concurrency is not None and max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
         self.uow = uow
         self.dependencies = dependencies
         self.event_handlers = event_handlers
         self.command_handlers = command_handlers
-        self.queue = []
+        self.concurrent = concurrent
+        self.max_concurrency = max_concurrency
+        self.executors = executors or []
+        self.uow_factory = uow_factory
+        # Serializes the calls sharing `uow`, created on the running loop.
+        self._shared: Optional[asyncio.Lock] = None
+        self.scheduled: List[Scheduled] = []
+        self._sequence = count()
+        self._scheduler: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+
+    @property
+    def queue(self) -> Deque[Message]:
+        """Messages left to handle by the current `handle` call, a
+        RuntimeError outside of one"""
+        return current_frame().queue
 
     async def handle_event(self, event: Event) -> None:
-        for handler in self.event_handlers[type(event)]:
-            logger.info(
-                "Handling event %s with handler %s", event, handler.__name__
+        handlers = self.event_handlers[type(event)]
+        if not self.concurrent:
+            for handler in handlers:
+                await self.run_event_handler(event, handler)
+            return
+
+        limit = None
+        if self.max_concurrency is not None:
+            limit = asyncio.Semaphore(self.max_concurrency)
+        await asyncio.gather(
+            *(
+                self.run_event_handler(event, handler, limit)
+                for handler in handlers
             )
-            try:
-                handler(event)
-                self.queue.extend(self.uow.collect_new_events())
-            except Exception as ex:
-                logger.exception("Exception handling event %s: %s", event, ex)
+        )
+
+    async def run_event_handler(
+        self,
+        event: Event,
+        handler: Callable,
+        limit: Optional[asyncio.Semaphore] = None,
+    ) -> None:
+        logger.info(
+            "Handling event %s with handler %s", event, handler.__name__
+        )
+        try:
+            if limit is None:
+                await self.call(handler, event)
+            else:
+                async with limit:
+                    await self.call(handler, event)
+            self.enqueue(current_frame().uow.collect_new_events())
+        except Exception as ex:
+            logger.exception("Exception handling event %s: %s", event, ex)
 
     async def handle_command(self, command: Command) -> None:
         logger.info("Handling command %s", command)
         try:
             handler = self.command_handlers[type(command)]
-            handler(command)
-            self.queue.extend(self.uow.collect_new_events())
+            await self.call(handler, command)
+            self.enqueue(current_frame().uow.collect_new_events())
         except Exception as ex:
             logger.exception("Exception handling command %s: %s", command, ex)
             raise
 
+    @staticmethod
+    async def call(handler: Callable, message: Message) -> Any:
+        """Runs a handler, awaiting its result when it's awaitable, so
+        coroutine handlers yield to the others while they wait"""
+        result = handler(message)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
+
+    def enqueue(self, messages: Iterable[Message]) -> None:
+        """Queues messages for the current `handle` call, or schedules them
+        if they're delayed"""
+        for message in messages:
+            if message.delay > 0:
+                self.schedule(message)
+            else:
+                self.queue.append(message)
+
+    def schedule(
+        self, message: Message, delay: Optional[float] = None
+    ) -> None:
+        """Handles `message` after `delay` seconds, its own delay by default.
+        Must be called from a running event loop."""
+        loop = asyncio.get_running_loop()
+        due = loop.time() + (message.delay if delay is None else delay)
+        entry = Scheduled(due, message.priority, next(self._sequence), message)
+        heapq.heappush(self.scheduled, entry)
+        if self._scheduler is None or self._scheduler.done():
+            self._wakeup = asyncio.Event()
+            # Not from the current context, which may be a `handle` call's.
+            self._scheduler = Context().run(
+                loop.create_task, self.run_scheduler()
+            )
+        elif self.scheduled[0] is entry:
+            self._wakeup.set()  # type: ignore
+
+    async def run_scheduler(self) -> None:
+        """Hands scheduled messages to `handle` as they fall due"""
+        loop = asyncio.get_running_loop()
+        wakeup: asyncio.Event = self._wakeup  # type: ignore
+        while True:
+            wakeup.clear()
+            if not self.scheduled:
+                await wakeup.wait()
+                continue
+            timeout = self.scheduled[0].due - loop.time()
+            if timeout > 0:
+                try:
+                    await asyncio.wait_for(wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            for entry in self.release(loop.time()):
+                try:
+                    await self.dispatch(entry.message)
+                except Exception as ex:
+                    logger.exception(
+                        "Exception handling scheduled message %s: %s",
+                        entry.message,
+                        ex,
+                    )
+
+    def release(self, now: float) -> List[Scheduled]:
+        """Pops the messages due by `now`, by decreasing priority"""
+        due = []
+        while self.scheduled and self.scheduled[0].due <= now:
+            due.append(heapq.heappop(self.scheduled))
+        due.sort(
+            key=lambda entry: (-entry.priority, entry.due, entry.sequence)
+        )
+        return due
+
+    async def stop(self) -> List[Message]:
+        """Stops the scheduler, returns the messages it had yet to handle"""
+        if self._scheduler is not None:
+            self._scheduler.cancel()
+            try:
+                await self._scheduler
+            except asyncio.CancelledError:
+                pass
+            self._scheduler = None
+        pending = [entry.message for entry in sorted(self.scheduled)]
+        self.scheduled.clear()
+        return pending
+
+    def shutdown(self, wait: bool = True) -> None:
+        for executor in self.executors:
+            executor.shutdown(wait=wait)
+
     def handle_map(self, message) -> Callable:
         if isinstance(message, Event):
             return self.handle_event
@@ -63,12 +269,35 @@ class MessageBus:
             raise UnknownMessage()
 
     async def handle(self, message: Message) -> Any:
-        self.queue: List[Message] = [message]
-        while self.queue:
-            # ever consuming queue
-            current_msg = self.queue.pop(0)
-            handle = self.handle_map(current_msg)
-            await handle(current_msg)
-
-        if self.queue:
-            logger.warning(f"Not awaitable tasks: {self.queue}")
+        if message.delay > 0:
+            self.schedule(message)
+            return
+        await self.dispatch(message)
+
+    async def dispatch(self, message: Message) -> None:
+        """Handles `message` and what it raises, regardless of delays"""
+        parent = dispatch_frame.get()
+        if parent is not None:
+            await self.run_frame(DispatchFrame(message, parent.uow))
+        elif self.uow_factory is not None:
+            await self.run_frame(DispatchFrame(message, self.uow_factory()))
+        else:
+            if self._shared is None:
+                self._shared = asyncio.Lock()
+            async with self._shared:
+                await self.run_frame(DispatchFrame(message, self.uow))
+
+    async def run_frame(self, frame: DispatchFrame) -> None:
+        frame.queue.append(frame.message)
+        token = dispatch_frame.set(frame)
+        try:
+            while frame.queue:
+                # ever consuming queue
+                current_msg = frame.queue.popleft()
+                handle = self.handle_map(current_msg)
+                await handle(current_msg)
+        finally:
+            dispatch_frame.reset(token)
+
+        if frame.queue:
+            logger.warning(f"Not awaitable tasks: {frame.queue}")
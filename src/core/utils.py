@@ -1,7 +1,9 @@
+import asyncio
 import functools
 import inspect
 import logging
 import unicodedata
+from concurrent.futures import Executor
 from datetime import date, datetime
 from typing import Callable, Dict, Any, Iterable, Optional, Set, List
 from rapidfuzz.utils import default_process
@@ -10,14 +12,22 @@ logger = logging.getLogger("__utils__")
 
 
 def inject_dependencies(
-    handler: Callable, dependencies: Dict[str, Any]
+    handler: Callable,
+    dependencies: Dict[str, Any],
+    executor: Optional[Executor] = None,
 ) -> Callable:
     """
     Inspects a handler function to figure out its arguments and returns the
     same handler with its arguments already set given a dependencies
     mapping
 
-    TODO: This could be done also by using functools.partial
+    Coroutine handlers stay coroutine functions, awaited natively by the
+    message bus. A sync handler given an `executor` is wrapped in one that
+    runs it on that executor, so it doesn't block the event loop while it
+    waits on SMTP or hashes a password. A handler sent to a process pool
+    works on copies of its message and dependencies, so what it returns is
+    its only effect: it must be a module level function and its
+    dependencies picklable.
     """
     params = inspect.signature(handler).parameters
     set_dependencies = {
@@ -25,7 +35,18 @@ def inject_dependencies(
         for param, dependency in dependencies.items()
         if param in params
     }
-    return lambda message: handler(message, **set_dependencies)
+    injected = functools.update_wrapper(
+        functools.partial(handler, **set_dependencies), handler
+    )
+    if executor is None or inspect.iscoroutinefunction(handler):
+        return injected
+
+    @functools.wraps(handler)
+    async def offloaded(message: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, injected, message)
+
+    return offloaded
 
 
 def group_rows(
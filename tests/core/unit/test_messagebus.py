@@ -0,0 +1,317 @@
+import asyncio
+import threading
+
+import pytest
+
+from src.core import bootstrap, messagebus
+
+from tests.fakes.core import FakeUnitOfWork, Ping, Pinged
+
+
+def create_bus(event_handlers, command_handlers=None, **options):
+    uow = FakeUnitOfWork()
+    return bootstrap.create(
+        dependencies={"uow": uow},
+        command_handlers=command_handlers or {},
+        event_handlers={Pinged: event_handlers},
+        uow=uow,
+        **options,
+    )
+
+
+class Tracker:
+    "Records how many handlers run at once"
+
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self.done = []
+
+    def handler(self, name: str, pause: float = 0.01):
+        async def handler(event):
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+            await asyncio.sleep(pause)
+            self.running -= 1
+            self.done.append(name)
+
+        handler.__name__ = name
+        return handler
+
+
+@pytest.mark.asyncio
+async def test_event_handlers_run_sequentially_by_default():
+    tracker = Tracker()
+    bus = create_bus([tracker.handler(name) for name in "abc"])
+
+    await bus.handle(Pinged("x"))
+
+    assert tracker.peak == 1
+    assert tracker.done == ["a", "b", "c"]
+
+
+@pytest.mark.asyncio
+async def test_concurrent_event_handlers_respect_the_limit():
+    input = [None, 2, 1]
+    want = [4, 2, 1]
+    got = []
+    for limit in input:
+        tracker = Tracker()
+        bus = create_bus(
+            [tracker.handler(name) for name in "abcd"],
+            concurrent=True,
+            max_concurrency=limit,
+        )
+        await bus.handle(Pinged("x"))
+        assert sorted(tracker.done) == list("abcd")
+        got.append(tracker.peak)
+
+    assert got == want
+    with pytest.raises(ValueError):
+        create_bus([], max_concurrency=0)
+
+
+@pytest.mark.asyncio
+async def test_failing_event_handler_does_not_cancel_the_others():
+    tracker = Tracker()
+
+    async def failing(event):
+        await asyncio.sleep(0)
+        raise RuntimeError("SMTP is down")
+
+    def failing_sync(event):
+        raise RuntimeError("Template not found")
+
+    for concurrent in (False, True):
+        tracker.done.clear()
+        handlers = [tracker.handler("a"), tracker.handler("b")]
+        bus = create_bus(
+            [failing, handlers[0], failing_sync, handlers[1]],
+            concurrent=concurrent,
+        )
+        await bus.handle(Pinged("x"))
+        assert sorted(tracker.done) == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_events_raised_by_handlers_are_handled_in_order():
+    handled = []
+
+    def handler(event, uow):
+        handled.append(event.name)
+        if event.name == "first":
+            uow.events.extend([Pinged("second"), Pinged("third")])
+
+    def command_handler(command, uow):
+        uow.events.append(Pinged("first"))
+
+    bus = create_bus([handler], {Ping: command_handler})
+    await bus.handle(Ping("x"))
+
+    assert handled == ["first", "second", "third"]
+
+
+def hash_name(event):
+    "Module level so a process pool can pickle it"
+    return event.name.upper()
+
+
+@pytest.mark.asyncio
+async def test_coroutine_and_offloaded_handlers():
+    loop_thread = threading.get_ident()
+    threads = {}
+
+    async def coroutine(event, uow):
+        threads["coroutine"] = threading.get_ident()
+
+    def inline(event, uow):
+        threads["inline"] = threading.get_ident()
+
+    def send_email(event):
+        threads["thread"] = threading.get_ident()
+
+    bus = create_bus(
+        [coroutine, inline, send_email],
+        executors={send_email: bootstrap.THREAD},
+        max_workers=1,
+    )
+    await bus.handle(Pinged("x"))
+    bus.shutdown()
+
+    assert threads["coroutine"] == threads["inline"] == loop_thread
+    assert threads["thread"] != loop_thread
+    assert [handler.__name__ for handler in bus.event_handlers[Pinged]] == [
+        "coroutine",
+        "inline",
+        "send_email",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_process_handlers_give_back_their_result():
+    bus = create_bus(
+        [hash_name], executors={hash_name: bootstrap.PROCESS}, max_workers=1
+    )
+    handler = bus.event_handlers[Pinged][0]
+
+    assert await bus.call(handler, Pinged("x")) == "X"
+    bus.shutdown()
+
+
+def test_handlers_using_the_unit_of_work_stay_on_the_loop():
+    async def coroutine(event):
+        pass
+
+    def with_uow(event, uow):
+        pass
+
+    def with_session(event, session):
+        pass
+
+    uow = FakeUnitOfWork()
+    input = [
+        (coroutine, bootstrap.THREAD),
+        (with_uow, bootstrap.THREAD),
+        (with_uow, bootstrap.PROCESS),
+        (with_session, bootstrap.PROCESS),
+    ]
+    for handler, kind in input:
+        with pytest.raises(bootstrap.OffloadNotAllowed):
+            bootstrap.create(
+                dependencies={"uow": uow, "session": uow},
+                command_handlers={},
+                event_handlers={Pinged: [handler]},
+                uow=uow,
+                executors={handler: kind},
+            )
+    with pytest.raises(ValueError):
+        create_bus([hash_name], executors={hash_name: "fiber"})
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_keep_their_own_frame():
+    handled = []
+
+    async def command_handler(command, uow):
+        # Finish in reverse order, so the calls interleave.
+        await asyncio.sleep(0.01 * (3 - int(command.name)))
+        uow.events.append(Pinged(command.name))
+
+    async def handler(event, uow):
+        frame = messagebus.current_frame()
+        handled.append((event.name, frame.message.name, id(uow)))
+
+    bus = create_bus(
+        [handler], {Ping: command_handler}, uow_factory=FakeUnitOfWork
+    )
+    await asyncio.gather(*(bus.handle(Ping(str(n))) for n in range(3)))
+
+    assert sorted(name for name, _, _ in handled) == ["0", "1", "2"]
+    assert all(event == message for event, message, _ in handled)
+    assert len({uow for _, _, uow in handled}) == 3
+    with pytest.raises(RuntimeError):
+        bus.queue
+    with pytest.raises(RuntimeError):
+        bus.enqueue([Pinged("lost")])
+
+
+@pytest.mark.asyncio
+async def test_calls_sharing_the_unit_of_work_run_one_at_a_time():
+    tracker = Tracker()
+    bus = create_bus([tracker.handler("a")])
+
+    await asyncio.gather(*(bus.handle(Pinged(str(n))) for n in range(3)))
+
+    assert tracker.done == ["a", "a", "a"]
+    assert tracker.peak == 1
+
+
+@pytest.mark.asyncio
+async def test_nested_calls_use_the_unit_of_work_of_their_parent():
+    uows = []
+
+    async def handler(event, uow):
+        uows.append(uow)
+        if event.name == "outer":
+            await bus.handle(Pinged("inner"))
+
+    bus = create_bus([handler], uow_factory=FakeUnitOfWork)
+    await bus.handle(Pinged("outer"))
+
+    assert len(uows) == 2
+    assert uows[0] is uows[1]
+
+
+@pytest.mark.asyncio
+async def test_delayed_messages_are_handled_once_due():
+    handled = []
+
+    def handler(event):
+        handled.append(event.name)
+
+    def command_handler(command, uow):
+        uow.events.extend(
+            [
+                Pinged("later", delay=0.06),
+                Pinged("now"),
+                Pinged("low", delay=0.03),
+                Pinged("high", delay=0.03, priority=5),
+            ]
+        )
+
+    bus = create_bus([handler], {Ping: command_handler})
+    await bus.handle(Ping("x"))
+    assert handled == ["now"]
+    assert len(bus.scheduled) == 3
+
+    await asyncio.sleep(0.045)
+    assert handled == ["now", "high", "low"]
+    await asyncio.sleep(0.045)
+    assert handled == ["now", "high", "low", "later"]
+    assert bus.scheduled == []
+    await bus.stop()
+
+
+@pytest.mark.asyncio
+async def test_release_orders_due_messages_by_priority():
+    bus = create_bus([])
+    for name, delay, priority in [
+        ("c", 3, 0),
+        ("a", 1, 0),
+        ("b", 2, 9),
+        ("d", 1, 0),
+        ("e", 10, 99),
+    ]:
+        bus.schedule(Pinged(name, priority=priority), delay)
+    start = bus.scheduled[0].due - 1
+
+    assert bus.release(start) == []
+    released = bus.release(start + 3)
+    assert [entry.message.name for entry in released] == ["b", "a", "d", "c"]
+    assert [entry.message.name for entry in bus.scheduled] == ["e"]
+
+    pending = await bus.stop()
+    assert [message.name for message in pending] == ["e"]
+    assert bus.scheduled == []
+
+
+@pytest.mark.asyncio
+async def test_stop_cancels_the_scheduler():
+    handled = []
+
+    def handler(event):
+        handled.append(event.name)
+
+    bus = create_bus([handler])
+    await bus.handle(Pinged("late", delay=0.02))
+    await bus.handle(Pinged("later", delay=0.05, priority=1))
+
+    pending = await bus.stop()
+    await asyncio.sleep(0.06)
+    assert [message.name for message in pending] == ["late", "later"]
+    assert handled == []
+
+    bus.schedule(Pinged("again"), 0)
+    await asyncio.sleep(0.01)
+    assert handled == ["again"]
+    await bus.stop()
@@ -0,0 +1,39 @@
+from typing import Generator, List
+
+from src.core.domain import Command, Event, Message
+from src.core.ports import unit_of_work
+
+
+class FakeUnitOfWork(unit_of_work.AbstractUnitOfWork):
+    """Handlers raise events by appending them to `events`, as aggregates
+    do to their event store"""
+
+    def __init__(self):
+        self.events: List[Message] = []
+        self.committed = False
+
+    def _commit(self) -> None:
+        self.committed = True
+
+    def rollback(self) -> None:
+        pass
+
+    def collect_new_events(self) -> Generator:
+        while self.events:
+            yield self.events.pop(0)
+
+
+class Pinged(Event):
+    def __init__(self, name: str, delay: float = 0, priority: int = 0):
+        super().__init__()
+        self.name = name
+        self.delay = delay
+        self.priority = priority
+
+
+class Ping(Command):
+    def __init__(self, name: str, delay: float = 0, priority: int = 0):
+        super().__init__()
+        self.name = name
+        self.delay = delay
+        self.priority = priority